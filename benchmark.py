@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from xml.sax.saxutils import escape
+
+import rdflib
+
+import convert
+
+# 合成データの名前空間宣言
+SYNTHETIC_NAMESPACES = ' '.join([
+    'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"',
+    'xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"',
+    'xmlns:dcterms="http://purl.org/dc/terms/"',
+    'xmlns:dcndl="http://ndl.go.jp/dcndl/terms/"',
+    'xmlns:schema="http://schema.org/"',
+    'xmlns:skos="http://www.w3.org/2004/02/skos/core#"',
+    'xmlns:foaf="http://xmlns.com/foaf/0.1/"',
+    'xmlns:rcgs="https://collection.rcgs.jp/terms/"'
+])
+
+RESOURCE_BASE = 'https://collection.rcgs.jp/resource/'
+TERMS_BASE = 'https://collection.rcgs.jp/terms/'
+
+def write_synthetic_dump(out, resource_count, seed=1):
+    """
+    RCGSのダンプと同じ形のRDF/XMLをresource_count件のリソース分書き出す
+    
+    6件ごとに、foaf:Agent（多言語のskos:prefLabel）1件、rcgs:Package（dcterms:formatと
+    rcgs:provisionActivityのブランクノード付き）2件、exemplarOfでPackageを参照するrcgs:Item 2件、
+    rcgs:Work（genre/themeでジャンルを参照）またはrcgs:Variation 1件を出力する。
+    ほかにgenre/themeの参照先としてresource_countの1/10件のジャンルを出力する。
+    """
+    rnd = random.Random(seed)
+    topic_count = max(1, resource_count // 10)
+    w = out.write
+    w(f'<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF {SYNTHETIC_NAMESPACES}>\n')
+    for i in range(topic_count):
+        w(f'<rcgs:Topic rdf:about="{RESOURCE_BASE}TOPIC{i}">'
+          f'<rdfs:label xml:lang="ja">ジャンル{i}</rdfs:label><rdfs:label xml:lang="en">Genre {i}</rdfs:label>'
+          f'</rcgs:Topic>\n')
+    for i in range(resource_count):
+        kind = i % 6
+        agent = f'{RESOURCE_BASE}AGENT{(i // 6) * 6}'
+        if kind == 0:
+            agent_type = 'Person' if i % 12 == 0 else 'Organization'
+            w(f'<foaf:Agent rdf:about="{RESOURCE_BASE}AGENT{i}">'
+              f'<rdf:type rdf:resource="http://xmlns.com/foaf/0.1/{agent_type}"/>'
+              f'<skos:prefLabel xml:lang="ja">名前{i}</skos:prefLabel>'
+              f'<skos:prefLabel xml:lang="en">Name {i}</skos:prefLabel>'
+              f'<skos:prefLabel xml:lang="zh">名{i}</skos:prefLabel>'
+              f'<skos:altLabel>alt{i}</skos:altLabel><skos:altLabel>alt{i}b</skos:altLabel>'
+              f'<rdfs:seeAlso rdf:resource="https://example.org/agent/{i}"/>'
+              f'<schema:startDate>19{i % 100:02d}</schema:startDate>'
+              f'<rcgs:adminMetadata rdf:parseType="Resource"><dcterms:source>src{i}</dcterms:source></rcgs:adminMetadata>'
+              f'</foaf:Agent>\n')
+        elif kind in (1, 2):
+            w(f'<rcgs:Package rdf:about="{RESOURCE_BASE}PACKAGE{i}">'
+              f'<schema:name>{escape(f"Game {i} & Co.")}</schema:name>'
+              f'<dcndl:titleTranscription xml:lang="ja-Hrkt">ゲーム{i}</dcndl:titleTranscription>'
+              f'<dcndl:titleTranscription xml:lang="ja-Latn">Gemu {i}</dcndl:titleTranscription>'
+              f'<schema:gamePlatform rdf:resource="{RESOURCE_BASE}PLATFORM{i % 7}"/>'
+              f'<schema:price>{rnd.randint(1, 9999)}</schema:price>'
+              f'<rcgs:publisher rdf:resource="{agent}"/>'
+              f'<dcterms:identifier>ID{i}</dcterms:identifier><dcterms:identifier>JAN{i}</dcterms:identifier>'
+              f'<rcgs:exemplar rdf:resource="{RESOURCE_BASE}ITEM{i + 2}"/>'
+              f'<dcterms:format rdf:parseType="Resource"><rdfs:label>Cartridge</rdfs:label>'
+              f'<rcgs:carrierType rdf:resource="{TERMS_BASE}cartridge"/><dcterms:extent>1</dcterms:extent>'
+              f'<schema:fileSize>8M</schema:fileSize><schema:contentSize>8MB</schema:contentSize>'
+              f'<rcgs:adminMetadata rdf:parseType="Resource"><dcterms:source>fmtsrc{i}</dcterms:source></rcgs:adminMetadata>'
+              f'</dcterms:format>'
+              f'<rcgs:formatOfSubunit rdf:parseType="Resource"><rdfs:label>Manual</rdfs:label>'
+              f'<rcgs:dimension>18cm</rcgs:dimension></rcgs:formatOfSubunit>'
+              f'<rcgs:provisionActivity><rcgs:Publication>'
+              f'<rcgs:publisherStatement>Publisher {i}</rcgs:publisherStatement>'
+              f'<dcterms:date>199{i % 10}</dcterms:date><dcterms:spatial>JP</dcterms:spatial>'
+              f'</rcgs:Publication></rcgs:provisionActivity>'
+              f'<rcgs:adminMetadata rdf:parseType="Resource"><dcterms:source>pkgsrc{i}</dcterms:source></rcgs:adminMetadata>'
+              f'</rcgs:Package>\n')
+        elif kind in (3, 4):
+            w(f'<rcgs:Item rdf:about="{RESOURCE_BASE}ITEM{i}">'
+              f'<rcgs:exemplarOf rdf:resource="{RESOURCE_BASE}PACKAGE{i - 2}"/>'
+              f'<dcterms:identifier>S{i}</dcterms:identifier><dcterms:spatial>C{i % 50}</dcterms:spatial>'
+              f'<schema:owns rdf:resource="{RESOURCE_BASE}AGENT0"/></rcgs:Item>\n')
+        elif i % 12 == 5:
+            w(f'<rcgs:Work rdf:about="{RESOURCE_BASE}WORK{i}"><rdfs:label>Work {i}</rdfs:label>'
+              f'<skos:prefLabel xml:lang="ja">作品{i}</skos:prefLabel>'
+              f'<schema:genre rdf:resource="{RESOURCE_BASE}TOPIC{rnd.randrange(topic_count)}"/>'
+              f'<rcgs:theme rdf:resource="{RESOURCE_BASE}TOPIC{rnd.randrange(topic_count)}"/>'
+              f'<dcterms:creator rdf:resource="{agent}"/></rcgs:Work>\n')
+        else:
+            w(f'<rcgs:Variation rdf:about="{RESOURCE_BASE}VARIATION{i}">'
+              f'<rcgs:variationOf rdf:resource="{RESOURCE_BASE}WORK{i}"/><rdfs:label>Variation {i}</rdfs:label>'
+              f'<schema:gamePlatform rdf:resource="{RESOURCE_BASE}PLATFORM{i % 7}"/></rcgs:Variation>\n')
+    w('</rdf:RDF>\n')
+
+def synthetic_source_dir(data_dir, resource_count, seed=1):
+    """
+    指定件数の合成データを置いたソースディレクトリを返す（未作成なら作成する）
+    """
+    source_dir = os.path.join(data_dir, f'synthetic-{resource_count}-{seed}')
+    dump_file = os.path.join(source_dir, 'rcgs-synthetic.xml')
+    if not os.path.exists(dump_file):
+        os.makedirs(source_dir, exist_ok=True)
+        print(f"合成データを作成中: {dump_file}")
+        temp_file = dump_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            write_synthetic_dump(f, resource_count, seed)
+        os.replace(temp_file, dump_file)
+    return source_dir
+
+def run_benchmark(source_dir, mode='graph', jobs=1, store='rdflib', prefetch=2, no_cache=False, work_dir=None):
+    """
+    convert.pyの変換（run_conversion）をそのまま実行し、convert.metricsの段階ごとの計測結果の辞書を返す
+    
+    キャッシュとmmapのストアはwork_dirに置く。空のwork_dirなら解析から行い（cold）、同じwork_dirで
+    もう一度呼ぶとキャッシュから読み込む（warm）。work_dirを省略した場合は一時ディレクトリを使う。
+    convert.pyの出力は捨てる。
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            tempfile.TemporaryDirectory() as output_dir:
+        if work_dir is None:
+            work_dir = output_dir
+        argv = ['--jobs', str(jobs), '--store', store, '--prefetch', str(prefetch),
+                '--cache-dir', os.path.join(work_dir, 'cache'), '--store-dir', os.path.join(work_dir, 'store')]
+        if no_cache:
+            argv.append('--no-cache')
+        if mode == 'stream':
+            argv.append('--stream')
+        start = time.perf_counter()
+        completed = convert.run_conversion(convert.parse_args(argv), source_dir, os.path.join(output_dir, 'output'))
+        total_seconds = time.perf_counter() - start
+    if not completed:
+        raise RuntimeError(f'{source_dir} の変換に失敗しました')
+    
+    summary = convert.metrics.summary()
+    phases = summary['phases']
+    result = {'phases': phases, 'total_seconds': round(total_seconds, 4), 'peak_rss_kb': summary['peak_rss_kb']}
+    if mode == 'graph':
+        extract_phases = {name[len('extract:'):]: phase['counters'] for name, phase in phases.items()
+                          if name.startswith('extract:')}
+        result['triples'] = phases['load']['counters'].get('triples', 0)
+        result['tables'] = {name: counters.get('rows', 0) for name, counters in extract_phases.items()}
+        result['record_cache'] = {'hits': sum(counters.get('cache_hits', 0) for counters in extract_phases.values()),
+                                  'misses': sum(counters.get('cache_misses', 0)
+                                                for counters in extract_phases.values())}
+    return result
+
+def run_single(resource_count, mode, data_dir, jobs, seed, store='rdflib', prefetch=2, no_cache=False,
+               work_dir=None, run='cold'):
+    """
+    1つの規模・モードを計測する（最大RSSを分けるため、規模・回ごとに別プロセスで呼ばれる）
+    
+    runは計測結果に記録するラベルで、'cold'（空のキャッシュ）か'warm'（coldの回で作ったキャッシュを使う）。
+    """
+    source_dir = synthetic_source_dir(data_dir, resource_count, seed)
+    dump_size = sum(os.path.getsize(os.path.join(source_dir, name)) for name in os.listdir(source_dir))
+    result = run_benchmark(source_dir, mode, jobs, store, prefetch, no_cache, work_dir)
+    result.update({'resources': resource_count, 'mode': mode, 'jobs': jobs, 'store': store, 'prefetch': prefetch,
+                   'no_cache': no_cache, 'run': run, 'dump_bytes': dump_size})
+    return result
+
+def phase_seconds(phase):
+    # 以前の結果（独自の計測）は'seconds'、convert.metricsの結果は'wall_seconds'
+    return phase['wall_seconds'] if 'wall_seconds' in phase else phase['seconds']
+
+def current_commit():
+    """
+    計測したconvert.pyのコミットを返す（gitが使えなければNone）
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(previous, current, threshold):
+    """
+    前回の結果と比べて、threshold（割合）以上遅くなった段階を表示し、その数を返す
+    """
+    regressions = 0
+    print("\n=== 前回との比較 ===")
+    for key, result in current['runs'].items():
+        if key not in previous.get('runs', {}):
+            print(f"{key}: 前回の結果なし")
+            continue
+        previous_phases = previous['runs'][key]['phases']
+        for name, entry in result['phases'].items():
+            if name not in previous_phases:
+                continue
+            before = phase_seconds(previous_phases[name])
+            after = phase_seconds(entry)
+            ratio = after / before if before > 0 else 1.0
+            marker = ''
+            # ごく短い段階は誤差が大きいため判定しない
+            if ratio > 1 + threshold and after - before > 0.05:
+                marker = '  <-- 遅くなりました'
+                regressions += 1
+            print(f"{key} {name:32s} {before:9.3f}s -> {after:9.3f}s ({ratio:5.2f}x){marker}")
+        before_rss = previous['runs'][key]['peak_rss_kb']
+        after_rss = result['peak_rss_kb']
+        print(f"{key} {'peak_rss':32s} {before_rss / 1024:8.1f}MB -> {after_rss / 1024:8.1f}MB")
+    return regressions
+
+def parse_args(argv=None):
+    """
+    コマンドライン引数を解析する
+    """
+    parser = argparse.ArgumentParser(description='合成したRCGSダンプでconvert.pyの処理時間と最大メモリを計測する')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000], metavar='N',
+                        help='合成するリソース数（デフォルト: 10000 100000。1000000も指定可能）')
+    parser.add_argument('--modes', nargs='+', choices=['graph', 'stream'], default=['graph'],
+                        help='計測する変換方式（デフォルト: graph）')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='解析と抽出に使うプロセス数（デフォルト: 1）')
+    parser.add_argument('--store', choices=convert.TRIPLE_STORES, default='rdflib',
+                        help='統合グラフの保持方法（convert.pyの--store。デフォルト: rdflib）')
+    parser.add_argument('--prefetch', type=int, default=2, metavar='N',
+                        help='解析と並行して先に読み込むファイル数（convert.pyの--prefetch。デフォルト: 2）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='解析済みトリプルのキャッシュとmmapのストアを使わず、毎回解析する')
+    parser.add_argument('--seed', type=int, default=1, help='合成データの乱数の種（デフォルト: 1）')
+    parser.add_argument('--data-dir', default='./.benchmark',
+                        help='合成データを置くディレクトリ（デフォルト: ./.benchmark）')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='結果を保存するJSONファイル（デフォルト: benchmark_results.json）')
+    parser.add_argument('--compare', metavar='PREVIOUS_JSON',
+                        help='前回の結果のJSONと比較し、遅くなった段階があれば終了コード1で終了する')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='遅くなったと判定する割合（デフォルト: 0.2 = 20%%）')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--single-mode', help=argparse.SUPPRESS)
+    parser.add_argument('--single-work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--single-run', default='cold', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def measure_in_subprocess(args, key, resource_count, mode, work_dir, run):
+    """
+    1つの規模・モード・回を子プロセスで計測して結果を表示し、結果の辞書を返す（失敗した場合はNone）
+    """
+    print(f"\n=== 計測中: {key} ===")
+    command = [sys.executable, os.path.abspath(__file__), '--single', str(resource_count),
+               '--single-mode', mode, '--single-work-dir', work_dir, '--single-run', run,
+               '--data-dir', args.data_dir, '--jobs', str(args.jobs), '--seed', str(args.seed),
+               '--store', args.store, '--prefetch', str(args.prefetch)]
+    if args.no_cache:
+        command.append('--no-cache')
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(f"エラー: {key} の計測に失敗しました")
+        print(completed.stderr)
+        return None
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    for name, entry in result['phases'].items():
+        # ワーカーでの解析など、with文で計測しない段階には最大RSSがない
+        rss = f"最大RSS {entry['peak_rss_kb'] / 1024:.1f}MB" if 'peak_rss_kb' in entry else '最大RSSなし'
+        print(f"  {name:32s} {phase_seconds(entry):9.3f}s  ({rss})")
+    print(f"  {'合計':30s} {result['total_seconds']:9.3f}s  (最大RSS {result['peak_rss_kb'] / 1024:.1f}MB)")
+    return result
+
+def main(argv=None):
+    """
+    メイン処理
+    """
+    args = parse_args(argv)
+    
+    # 子プロセスとして1つの規模を計測し、結果を標準出力にJSONで返す
+    if args.single is not None:
+        result = run_single(args.single, args.single_mode, args.data_dir, args.jobs, args.seed, args.store,
+                            args.prefetch, args.no_cache, args.single_work_dir, args.single_run)
+        print(json.dumps(result))
+        return 0
+    
+    results = {
+        'commit': current_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'platform': platform.platform(),
+        'runs': {}
+    }
+    for resource_count in args.scales:
+        # 合成データは計測の外で作成しておく
+        synthetic_source_dir(args.data_dir, resource_count, args.seed)
+        for mode in args.modes:
+            base_key = f'{mode}-{resource_count}' if mode == 'stream' or args.store == 'rdflib' else \
+                f'{mode}-{args.store}-{resource_count}'
+            # キャッシュを使う場合は、空のキャッシュで解析する回（cold）とそのキャッシュから読み込む回（warm）を
+            # 分けて計測する（逐次変換はキャッシュを使わない）
+            runs = ['cold'] if args.no_cache or mode == 'stream' else ['cold', 'warm']
+            with tempfile.TemporaryDirectory() as work_dir:
+                for run in runs:
+                    key = base_key if len(runs) == 1 else f'{base_key}-{run}'
+                    result = measure_in_subprocess(args, key, resource_count, mode, work_dir, run)
+                    if result is None:
+                        return 1
+                    results['runs'][key] = result
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存: {args.output}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        regressions = compare_results(previous, results, args.threshold)
+        if regressions:
+            print(f"\n警告: {regressions} 件の段階が {args.threshold:.0%} 以上遅くなりました")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,1150 +1,3677 @@
+import io
 import os
+import sys
+import bz2
 import glob
-import pandas as pd
-from rdflib import Graph, Namespace
-from rdflib.namespace import DC, DCTERMS, RDF, RDFS
+import gzip
+import lzma
+import queue
+import zipfile
+import mmap
+import bisect
+import shutil
+import threading
+import csv
+import json
+import time
+import cProfile
+import contextlib
+import tracemalloc
+import pickle
+import hashlib
+import argparse
+import multiprocessing
+import xml.etree.ElementTree as ET
+from urllib.parse import parse_qs, unquote, urljoin, urlparse
+from urllib.request import pathname2url
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import rdflib
+from rdflib import BNode, Graph, Literal, Namespace, URIRef
+from rdflib.namespace import RDF, RDFS
 
-def load_rdf_files(source_dir='./source'):
+try:
+    import resource
+except ImportError:
+    # Windowsでは最大RSSを記録しない
+    resource = None
+
+# 名前空間の定義
+rcgs = Namespace("https://collection.rcgs.jp/terms/")
+dcndl = Namespace("http://ndl.go.jp/dcndl/terms/")
+foaf = Namespace("http://xmlns.com/foaf/0.1/")
+
+# データ統計で件数を表示するクラス: (表示名, クラス)
+STATISTICS_CLASSES = [
+    ('BibResource', dcndl.BibResource),
+    ('Item', dcndl.Item),
+    ('Package', rcgs.Package),
+    ('Person', foaf.Person),
+    ('Organization', foaf.Organization),
+    ('Variation', rcgs.Variation),
+    ('Work', rcgs.Work)
+]
+
+# 解析済みトリプルのキャッシュ形式のバージョン（形式を変えたら上げる）
+CACHE_FORMAT_VERSION = 1
+
+# キャッシュディレクトリに置く、ソースファイルのパス → キャッシュファイル名の対応表
+CACHE_INDEX_FILE = 'cache_index.json'
+
+# 圧縮されたソースファイルの拡張子
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz')
+
+# アーカイブ内のファイルを表すパスの区切り（例: rcgs-all-20230207.xml.zip!/rcgs-all-20230207.xml）
+ARCHIVE_MEMBER_SEPARATOR = '!/'
+
+def peak_rss_kb():
+    """
+    このプロセスのこれまでの最大RSS（KB）を返す（取得できない環境ではNone）
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSではバイト単位
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def cpu_seconds():
     """
-    ./sourceディレクトリからすべてのRDFファイルを読み込み、統合したGraphを返す
+    このプロセスと終了した子プロセス（並列処理のワーカー）のCPU時間の合計を返す
     """
-    merged_graph = Graph()
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+class Metrics:
+    """
+    処理の段階ごとの経過時間・CPU時間・最大メモリと件数（トリプル数、行数、Graphの参照回数など）を記録する
+    
+    trace_memoryを有効にすると、段階ごとのtracemallocの最大値も記録する（処理は遅くなる）。
+    """
+    def __init__(self):
+        self.phases = {}
+        self.trace_memory = False
+        self.started = time.time()
+    
+    def _entry(self, name):
+        return self.phases.setdefault(name, {'wall_seconds': 0.0, 'counters': {}})
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        with文の中を1つの段階として計測する（件数はyieldした辞書に加算する）
+        """
+        entry = self._entry(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+        try:
+            yield entry['counters']
+        finally:
+            entry['wall_seconds'] += time.perf_counter() - wall_start
+            entry['cpu_seconds'] = entry.get('cpu_seconds', 0.0) + cpu_seconds() - cpu_start
+            entry['peak_rss_kb'] = peak_rss_kb()
+            if self.trace_memory:
+                entry['tracemalloc_peak_kb'] = max(entry.get('tracemalloc_peak_kb', 0),
+                                                   tracemalloc.get_traced_memory()[1] // 1024)
+    
+    def add(self, name, wall_seconds=0.0, cpu_seconds=None, **counters):
+        """
+        with文で囲めない処理（ワーカーでの解析など）の時間と件数を段階に加算する
+        """
+        entry = self._entry(name)
+        entry['wall_seconds'] += wall_seconds
+        if cpu_seconds is not None:
+            entry['cpu_seconds'] = entry.get('cpu_seconds', 0.0) + cpu_seconds
+        for counter, value in counters.items():
+            entry['counters'][counter] = entry['counters'].get(counter, 0) + value
+    
+    def summary(self):
+        """
+        段階ごとの計測結果に毎秒あたりの件数を加えた辞書を返す
+        """
+        phases = {}
+        for name, entry in self.phases.items():
+            wall = entry['wall_seconds']
+            phase = {key: value for key, value in entry.items() if key != 'counters'}
+            phase['wall_seconds'] = round(wall, 4)
+            if 'cpu_seconds' in entry:
+                phase['cpu_seconds'] = round(entry['cpu_seconds'], 4)
+            phase['counters'] = dict(entry['counters'])
+            phase['rates'] = {f'{counter}_per_second': round(value / wall, 1) if wall > 0 else None
+                              for counter, value in entry['counters'].items()}
+            phases[name] = phase
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started)),
+            'wall_seconds': round(time.time() - self.started, 4),
+            'peak_rss_kb': peak_rss_kb(),
+            'phases': phases
+        }
     
+    def prometheus_lines(self):
+        """
+        計測結果をPrometheusのtextfile形式の行のリストにする（node exporterのtextfile collector用）
+        """
+        summary = self.summary()
+        metrics = [
+            ('rcgs_convert_phase_wall_seconds', '段階の経過時間（秒）', 'wall_seconds', 1),
+            ('rcgs_convert_phase_cpu_seconds', '段階のCPU時間（秒）', 'cpu_seconds', 1),
+            ('rcgs_convert_phase_peak_rss_bytes', '段階の終了時点の最大RSS（バイト）', 'peak_rss_kb', 1024),
+            ('rcgs_convert_phase_tracemalloc_peak_bytes', '段階中のtracemallocの最大値（バイト）',
+             'tracemalloc_peak_kb', 1024)
+        ]
+        lines = []
+        for metric, help_text, key, scale in metrics:
+            values = [(name, phase[key]) for name, phase in summary['phases'].items() if phase.get(key) is not None]
+            if not values:
+                continue
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            lines.extend(f'{metric}{{phase="{name}"}} {value * scale}' for name, value in values)
+        for metric, help_text, key in [('rcgs_convert_phase_count', '段階で処理した件数', 'counters'),
+                                       ('rcgs_convert_phase_rate', '段階の毎秒あたりの件数', 'rates')]:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            for name, phase in summary['phases'].items():
+                for counter, value in phase[key].items():
+                    if value is not None:
+                        counter = counter[:-len('_per_second')] if key == 'rates' else counter
+                        lines.append(f'{metric}{{phase="{name}",counter="{counter}"}} {value}')
+        lines.append('# HELP rcgs_convert_wall_seconds 変換全体の経過時間（秒）')
+        lines.append('# TYPE rcgs_convert_wall_seconds gauge')
+        lines.append(f'rcgs_convert_wall_seconds {summary["wall_seconds"]}')
+        lines.append('# HELP rcgs_convert_last_run_timestamp_seconds 変換を開始した時刻（UNIX時間）')
+        lines.append('# TYPE rcgs_convert_last_run_timestamp_seconds gauge')
+        lines.append(f'rcgs_convert_last_run_timestamp_seconds {int(self.started)}')
+        return lines
+    
+    def save(self, metrics_file):
+        """
+        計測結果を保存する（拡張子が.promならPrometheusのtextfile形式、それ以外はJSON）
+        """
+        metrics_dir = os.path.dirname(metrics_file)
+        if metrics_dir and not os.path.exists(metrics_dir):
+            os.makedirs(metrics_dir)
+        
+        # node exporterが書きかけのファイルを読まないように一時ファイルから置き換える
+        temp_file = metrics_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            if metrics_file.endswith('.prom'):
+                f.write('\n'.join(self.prometheus_lines()) + '\n')
+            else:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, metrics_file)
+        print(f"計測結果を保存: {metrics_file}")
+
+# 変換全体の計測結果（各処理が段階ごとに記録する）
+metrics = Metrics()
+
+def detect_rdf_format(file_name):
+    """
+    ファイル名の拡張子からrdflibのフォーマット名を返す（RDFファイルでなければNone）
+    """
+    if file_name.endswith('.ttl'):
+        return 'turtle'
+    elif file_name.endswith('.rdf') or file_name.endswith('.xml'):
+        return 'xml'
+    elif file_name.endswith('.n3'):
+        return 'n3'
+    elif file_name.endswith('.nt'):
+        return 'nt'
+    elif file_name.endswith('.jsonld'):
+        return 'json-ld'
+    return None
+
+def list_rdf_files(source_dir='./source'):
+    """
+    ディレクトリ内のRDFファイルを (ファイルパス, フォーマット) のリストで返す
+    
+    .gz/.bz2/.xzで圧縮されたファイルと、.zipアーカイブ内のRDFファイルも対象にする。
+    アーカイブ内のファイルは「アーカイブのパス!/メンバー名」で表す
+    """
     # サポートするRDFファイル形式
     rdf_extensions = ['*.ttl', '*.rdf', '*.xml', '*.n3', '*.nt', '*.jsonld']
     
-    total_files = 0
+    rdf_files = []
+    for extension in rdf_extensions:
+        pattern = os.path.join(source_dir, extension)
+        for file_path in glob.glob(pattern):
+            # ファイル拡張子に基づいてフォーマットを判定
+            rdf_files.append((file_path, detect_rdf_format(file_path)))
+    
+    # 圧縮ファイル（拡張子を除いた名前でフォーマットを判定）
+    for compressed_extension in COMPRESSED_EXTENSIONS:
+        pattern = os.path.join(source_dir, '*' + compressed_extension)
+        for file_path in glob.glob(pattern):
+            format_type = detect_rdf_format(file_path[:-len(compressed_extension)])
+            if format_type:
+                rdf_files.append((file_path, format_type))
+    
+    # zipアーカイブ
+    for archive_path in glob.glob(os.path.join(source_dir, '*.zip')):
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                members = archive.namelist()
+        except zipfile.BadZipFile as e:
+            print(f"  エラー: {archive_path} - {str(e)}")
+            continue
+        for member in members:
+            format_type = detect_rdf_format(member)
+            if format_type and not member.endswith('/'):
+                rdf_files.append((archive_path + ARCHIVE_MEMBER_SEPARATOR + member, format_type))
+    
+    return rdf_files
+
+class BackgroundReader(io.RawIOBase):
+    """
+    別スレッドで読み込み・展開したデータを順に返すファイルオブジェクト
+    
+    zlib/bz2/lzmaの展開はGILを解放するため、展開と解析が並行して進む。
+    先読みはmax_chunks個のチャンクまでに制限する
+    """
+    def __init__(self, raw, chunk_size=1 << 20, max_chunks=8):
+        super().__init__()
+        self._raw = raw
+        self._chunks = queue.Queue(max_chunks)
+        self._stopped = threading.Event()
+        self._buffer = b''
+        self._eof = False
+        self._thread = threading.Thread(target=self._produce, args=(chunk_size,), daemon=True)
+        self._thread.start()
+    
+    def _produce(self, chunk_size):
+        try:
+            while not self._stopped.is_set():
+                chunk = self._raw.read(chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    break
+        except Exception as e:
+            self._put(e)
+    
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                self._eof = True
+            self._buffer = chunk
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+    
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._raw.close()
+        super().close()
+
+def open_rdf_source(file_path):
+    """
+    ソースファイルをバイナリで開く（圧縮ファイルとアーカイブ内のファイルは別スレッドで展開する）
+    """
+    if ARCHIVE_MEMBER_SEPARATOR in file_path:
+        archive_path, member = file_path.split(ARCHIVE_MEMBER_SEPARATOR, 1)
+        raw = zipfile.ZipFile(archive_path).open(member)
+    elif file_path.endswith('.gz'):
+        raw = gzip.open(file_path, 'rb')
+    elif file_path.endswith('.bz2'):
+        raw = bz2.open(file_path, 'rb')
+    elif file_path.endswith('.xz'):
+        raw = lzma.open(file_path, 'rb')
+    else:
+        return open(file_path, 'rb')
+    return io.BufferedReader(BackgroundReader(raw))
+
+def source_size(file_path):
+    """
+    ソースファイルを展開した後の大きさ（バイト）を返す（bz2・xzなど、読まずにはわからない場合はNone）
+    """
+    if ARCHIVE_MEMBER_SEPARATOR in file_path:
+        archive_path, member = file_path.split(ARCHIVE_MEMBER_SEPARATOR, 1)
+        with zipfile.ZipFile(archive_path) as archive:
+            return archive.getinfo(member).file_size
+    if file_path.endswith('.gz'):
+        # gzipの末尾4バイトは展開後の大きさ（4GiBで一巡するため、圧縮後より小さければ不明とする）
+        with open(file_path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            size = int.from_bytes(f.read(4), 'little')
+        return size if size >= os.path.getsize(file_path) else None
+    if file_path.endswith(COMPRESSED_EXTENSIONS):
+        return None
+    return os.path.getsize(file_path)
+
+def source_base_uri(file_path):
+    """
+    ソースファイルのベースURI（相対URIの解決に使う）
+    """
+    return 'file://' + pathname2url(os.path.abspath(file_path))
+
+def parse_rdf_source(graph, file_path, format_type):
+    """
+    ソースファイルをgraphに読み込む（圧縮ファイルは展開しながら読み込む）
+    """
+    if ARCHIVE_MEMBER_SEPARATOR not in file_path and not file_path.endswith(COMPRESSED_EXTENSIONS):
+        graph.parse(file_path, format=format_type)
+        return
+    with open_rdf_source(file_path) as source:
+        graph.parse(source=source, format=format_type, publicID=source_base_uri(file_path))
+
+class TripleFilter:
+    """
+    抽出に使うトリプルだけを統合グラフに残すための述語とクラスの許可リスト
+    
+    predicatesに含まれない述語のトリプルを捨てる。classesを指定した場合はrdf:typeのトリプルも
+    そのクラスのものだけを残す（Noneならすべてのクラスを残す）。
+    """
+    def __init__(self, predicates, classes=None):
+        self.predicates = frozenset(predicates)
+        self.classes = frozenset(classes) if classes is not None else None
+    
+    def accepts(self, triple):
+        predicate = triple[1]
+        if predicate not in self.predicates:
+            return False
+        return self.classes is None or predicate != RDF.type or triple[2] in self.classes
+
+class FilteredGraph(Graph):
+    """
+    triple_filterで許可されたトリプルだけを追加するGraph（解析中に使わないトリプルを捨てる）
+    """
+    def __init__(self, triple_filter, **kwargs):
+        super().__init__(**kwargs)
+        self.triple_filter = triple_filter
+    
+    def add(self, triple):
+        if self.triple_filter.accepts(triple):
+            return super().add(triple)
+        return self
+
+def new_parse_graph(triple_filter=None):
+    """
+    1ファイルの解析に使う空のGraph（triple_filterを渡すと許可されたトリプルだけを追加する）
+    """
+    if triple_filter is None:
+        return Graph()
+    return FilteredGraph(triple_filter)
+
+def parse_rdf_bytes(graph, data, file_path, format_type):
+    """
+    読み込み済みのソースファイルの内容（展開後のバイト列）をgraphに読み込む
+    """
+    graph.parse(source=io.BytesIO(data), format=format_type, publicID=source_base_uri(file_path))
+
+def encode_triples(graph):
+    """
+    Graphのトリプルを用語表と整数IDの配列に変換する（プロセス間で受け渡すための圧縮形式）
+    """
+    term_ids = {}
+    terms = []
+    triple_ids = array('i')
+    for triple in graph:
+        for term in triple:
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(terms)
+                terms.append(term)
+            triple_ids.append(term_id)
+    return terms, triple_ids
+
+def decode_triples(terms, triple_ids):
+    """
+    encode_triplesの結果からトリプルを復元する
+    """
+    ids = iter(triple_ids)
+    for s, p, o in zip(ids, ids, ids):
+        yield terms[s], terms[p], terms[o]
+
+def filter_encoded_triples(terms, triple_ids, triple_filter):
+    """
+    encode_triplesの結果から、triple_filterで許可されたトリプルと、それが使う用語だけを残す
+    """
+    remap = {}
+    filtered_terms = []
+    filtered_ids = array(triple_ids.typecode)
+    allowed = {term_id for term_id, term in enumerate(terms) if term in triple_filter.predicates}
+    type_id = None
+    if triple_filter.classes is not None:
+        type_id = next((term_id for term_id, term in enumerate(terms) if term == RDF.type), None)
+        allowed_classes = {term_id for term_id, term in enumerate(terms) if term in triple_filter.classes}
+    ids = iter(triple_ids)
+    for triple in zip(ids, ids, ids):
+        if triple[1] not in allowed or (triple[1] == type_id and triple[2] not in allowed_classes):
+            continue
+        for term_id in triple:
+            new_id = remap.get(term_id)
+            if new_id is None:
+                new_id = remap[term_id] = len(filtered_terms)
+                filtered_terms.append(terms[term_id])
+            filtered_ids.append(new_id)
+    return filtered_terms, filtered_ids
+
+def parse_rdf_file(file_path, format_type, triple_filter=None):
+    """
+    1ファイルを解析し、(用語表, トリプルのID配列, 解析時間) を返す（ワーカープロセスで実行）
+    
+    triple_filterを渡した場合は許可されたトリプルだけを返す。
+    """
+    start = time.perf_counter()
+    try:
+        temp_graph = new_parse_graph(triple_filter)
+        parse_rdf_source(temp_graph, file_path, format_type)
+    except Exception as e:
+        # パーサーの例外はpickleできない場合があるため、メッセージだけを親プロセスに返す
+        raise RuntimeError(str(e)) from None
+    terms, triple_ids = encode_triples(temp_graph)
+    return terms, triple_ids, time.perf_counter() - start
+
+def cache_file_path(cache_dir, file_path, format_type):
+    """
+    ソースファイルのSHA-256、フォーマット、rdflibのバージョンからキャッシュファイルのパスを決める
+    """
+    archive_path, _, member = file_path.partition(ARCHIVE_MEMBER_SEPARATOR)
+    digest = hashlib.sha256(member.encode('utf-8'))
+    with open(archive_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    key = f"{digest.hexdigest()}-{format_type}-rdflib{rdflib.__version__}-v{CACHE_FORMAT_VERSION}"
+    return os.path.join(cache_dir, key + '.pickle')
+
+def load_cached_triples(cache_path):
+    """
+    キャッシュファイルから (用語表, トリプルのID配列) を読み込む
+    """
+    with open(cache_path, 'rb') as f:
+        return pickle.load(f)
+
+def save_cached_triples(cache_path, terms, triple_ids):
+    """
+    (用語表, トリプルのID配列) をキャッシュファイルに保存する（一時ファイルからの置き換えで書き込む）
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump((terms, triple_ids), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, cache_path)
+
+def prune_cache(cache_dir, cache_paths):
+    """
+    キャッシュの対応表を更新し、どのソースファイルにも対応しなくなったキャッシュファイルを削除する
+    
+    cache_pathsは今回読み込んだソースファイルのパス → キャッシュファイルのパス。
+    ソースファイルが削除された、または内容が変わって別のキャッシュファイルに対応するようになった場合に、
+    前のキャッシュファイルが残り続けないようにする。
+    """
+    index_file = os.path.join(cache_dir, CACHE_INDEX_FILE)
+    index = load_json_file(index_file) or {}
+    for file_path, cache_path in cache_paths.items():
+        archive_path, separator, member = file_path.partition(ARCHIVE_MEMBER_SEPARATOR)
+        index[os.path.abspath(archive_path) + separator + member] = os.path.basename(cache_path)
+    index = {file_path: cache_name for file_path, cache_name in index.items()
+             if os.path.exists(file_path.partition(ARCHIVE_MEMBER_SEPARATOR)[0])}
+    
+    removed = 0
+    keep = set(index.values())
+    for cache_name in os.listdir(cache_dir):
+        if cache_name.endswith('.pickle') and cache_name not in keep:
+            try:
+                os.remove(os.path.join(cache_dir, cache_name))
+                removed += 1
+            except OSError:
+                pass
+    save_json_file(index_file, index)
+    if removed:
+        print(f"使われなくなったキャッシュファイルを削除しました: {removed} 件")
+
+def index_triples(np, triple_ids, term_count):
+    """
+    主語・述語・目的語のIDを並べた配列から重複を除き、検索用の並びを作る
+    
+    (s, p, o, spo, spo_keys, pos, pos_keys) を返す。spoは主語順、posは述語・目的語順（キーはp * term_count + o）の
+    トリプルの番号で、同じキーの中は追加した順のまま。
+    """
+    s, p, o = triple_ids[0::3], triple_ids[1::3], triple_ids[2::3]
+    
+    # 同じトリプルは最初に追加したものだけを残す（lexsortは安定なので各組の先頭が最初のもの）
+    order = np.lexsort((o, p, s))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (np.diff(s[order]) != 0) | (np.diff(p[order]) != 0) | (np.diff(o[order]) != 0)
+    kept = np.sort(order[first])
+    s, p, o = s[kept], p[kept], o[kept]
+    
+    spo = np.argsort(s, kind='stable').astype(np.int32)
+    pos_keys = p.astype(np.int64) * term_count + o
+    pos = np.argsort(pos_keys, kind='stable').astype(np.int32)
+    return s, p, o, spo, s[spo], pos, pos_keys[pos]
+
+class TermDictionary:
+    """
+    複数のInternedTripleStoreで共有する用語表（用語 → ID）
+    
+    一括変換でスナップショットごとに作るストアに渡すと、前のスナップショットにもあったURI・リテラルは
+    同じIDと同じオブジェクトを使い、新しい用語だけが追加される。ブランクノードは解析ごとに別のものになるため、
+    スナップショットの変換が終わってストアを捨てた後にdiscard_blank_nodesで取り除く。
+    """
+    def __init__(self):
+        self.terms = []
+        self.term_ids = {}
+        self._checked = 0
+    
+    def __len__(self):
+        return len(self.terms)
+    
+    def discard_blank_nodes(self):
+        """
+        前回の呼び出し以降に追加された用語からブランクノードを除き、残りの用語のIDを詰め直す
+        
+        それより前の用語のIDは変わらない。この用語表を使っているストアは使えなくなる。
+        """
+        added = self.terms[self._checked:]
+        del self.terms[self._checked:]
+        for term in added:
+            if isinstance(term, BNode):
+                del self.term_ids[term]
+            else:
+                self.term_ids[term] = len(self.terms)
+                self.terms.append(term)
+        self._checked = len(self.terms)
+
+class InternedTripleStore:
+    """
+    用語を整数IDに置き換えてトリプルを保持する省メモリのトリプルストア（NumPyが必要）
+    
+    URIRef・Literal・BNodeは用語表に1つずつだけ保持し、トリプルは主語・述語・目的語のint32配列で持つ。
+    freezeで重複を除き、主語順（SPO）と述語・目的語順（POS）の並びを作って、二分探索で範囲を取り出す。
+    変換で使うGraphのメソッド（subjects、predicate_objects、subject_objectsなど）だけを提供する。
+    同じ主語（または述語と目的語）のトリプルは追加した順に返すため、rdflibのMemoryストアと同じ順になる。
+    term_dictionaryを渡した場合は、用語表を自分で持たずにTermDictionaryの用語表に追加していく。
+    """
+    def __init__(self, term_dictionary=None):
+        import numpy
+        
+        self.np = numpy
+        if term_dictionary is None:
+            self.terms = []
+            self.term_ids = {}
+        else:
+            self.terms = term_dictionary.terms
+            self.term_ids = term_dictionary.term_ids
+        self._chunks = []
+        self._frozen = False
+        self._languages = None
+        self._language_ids = {}
+    
+    def intern(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+    
+    def add_encoded(self, terms, triple_ids):
+        """
+        encode_triplesの結果（用語表, トリプルのID配列）を追加する
+        """
+        np = self.np
+        if self._frozen:
+            # freeze後の追加は重複を除いたトリプルの後ろに続ける
+            self._chunks = [np.column_stack((self.s, self.p, self.o)).ravel()]
+        local_to_global = np.fromiter((self.intern(term) for term in terms), dtype=np.int32, count=len(terms))
+        self._chunks.append(local_to_global[np.asarray(triple_ids, dtype=np.int32)])
+        self._frozen = False
+    
+    def freeze(self):
+        """
+        追加したトリプルの重複を除き、検索用の並びを作る（検索の前に1回呼ぶ）
+        """
+        np = self.np
+        triple_ids = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int32)
+        self._chunks = []
+        (self.s, self.p, self.o, self._spo, self._spo_keys,
+         self._pos, self._pos_keys) = index_triples(np, triple_ids, len(self.terms))
+        self._frozen = True
+    
+    def _check_frozen(self):
+        if not self._frozen:
+            self.freeze()
+    
+    # 探索するキーは並びと同じ型で渡す（型が違うとsearchsortedが並び全体を変換してしまう）
+    def _subject_rows(self, subject_id):
+        lo, hi = self._spo_keys.searchsorted(self.np.array((subject_id, subject_id + 1), dtype=self.np.int32))
+        return self._spo[lo:hi]
+    
+    def _pos_rows(self, predicate_id, object_id=None):
+        term_count = len(self.terms)
+        if object_id is None:
+            keys = (predicate_id * term_count, (predicate_id + 1) * term_count)
+        else:
+            keys = (predicate_id * term_count + object_id, predicate_id * term_count + object_id + 1)
+        lo, hi = self._pos_keys.searchsorted(self.np.array(keys, dtype=self.np.int64))
+        return self._pos[lo:hi]
+    
+    def __len__(self):
+        self._check_frozen()
+        return len(self.s)
+    
+    def __contains__(self, triple):
+        self._check_frozen()
+        s, p, o = (self.term_ids.get(term) for term in triple)
+        if s is None or p is None or o is None:
+            return False
+        rows = self._subject_rows(s)
+        return bool(((self.p[rows] == p) & (self.o[rows] == o)).any())
+    
+    def predicate_objects(self, subject):
+        self._check_frozen()
+        subject_id = self.term_ids.get(subject)
+        if subject_id is None:
+            return
+        rows = self._subject_rows(subject_id)
+        terms = self.terms
+        for p, o in zip(self.p[rows].tolist(), self.o[rows].tolist()):
+            yield terms[p], terms[o]
+    
+    def objects(self, subject, predicate):
+        self._check_frozen()
+        subject_id, predicate_id = self.term_ids.get(subject), self.term_ids.get(predicate)
+        if subject_id is None or predicate_id is None:
+            return
+        rows = self._subject_rows(subject_id)
+        rows = rows[self.p[rows] == predicate_id]
+        terms = self.terms
+        for o in self.o[rows].tolist():
+            yield terms[o]
+    
+    def subjects(self, predicate=None, obj=None, unique=False):
+        self._check_frozen()
+        if predicate is None and obj is None:
+            subject_ids = self.s[self._spo].tolist()
+        elif predicate is None:
+            # 目的語だけの索引は持たないため、目的語の配列を走査する（トリプルを追加した順）
+            object_id = self.term_ids.get(obj)
+            if object_id is None:
+                return
+            subject_ids = self.s[self.o == object_id].tolist()
+        else:
+            predicate_id = self.term_ids.get(predicate)
+            object_id = None if obj is None else self.term_ids.get(obj)
+            if predicate_id is None or (obj is not None and object_id is None):
+                return
+            subject_ids = self.s[self._pos_rows(predicate_id, object_id)].tolist()
+        if unique:
+            subject_ids = dict.fromkeys(subject_ids)
+        terms = self.terms
+        for s in subject_ids:
+            yield terms[s]
+    
+    def subject_objects(self, predicate):
+        self._check_frozen()
+        predicate_id = self.term_ids.get(predicate)
+        if predicate_id is None:
+            return
+        rows = self._pos_rows(predicate_id)
+        terms = self.terms
+        for s, o in zip(self.s[rows].tolist(), self.o[rows].tolist()):
+            yield terms[s], terms[o]
+    
+    def term_id_array(self, terms):
+        """
+        用語のリストをIDの配列にする（ストアにない用語は-1）
+        """
+        np = self.np
+        return np.fromiter((self.term_ids.get(term, -1) for term in terms), dtype=np.int32, count=len(terms))
+    
+    def _term_languages(self):
+        # 用語ごとの言語タグの番号（言語タグのないものは-1）。最初に使うときに1回だけ作る
+        if self._languages is None or len(self._languages) != len(self.terms):
+            language_ids = self._language_ids
+            self._languages = self.np.fromiter(
+                (-1 if getattr(term, 'language', None) is None
+                 else language_ids.setdefault(term.language, len(language_ids))
+                 for term in self.terms),
+                dtype=self.np.int32, count=len(self.terms))
+        return self._languages
+    
+    def predicate_triples(self, predicate):
+        """
+        predicateのトリプルの (主語IDの配列, 目的語IDの配列) を主語順に返す（同じ主語の中は追加した順のまま）
+        
+        object_values・object_termsに渡すと、同じ述語の範囲の取り出しと並べ替えを1回で済ませられる。
+        """
+        np = self.np
+        self._check_frozen()
+        predicate_id = self.term_ids.get(predicate)
+        if predicate_id is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        
+        # 述語の範囲のトリプルを追加した順に戻してから主語順に並べる
+        rows = np.sort(self._pos_rows(predicate_id))
+        s, o = self.s[rows], self.o[rows]
+        order = np.argsort(s, kind='stable')
+        return s[order], o[order]
+    
+    def object_terms(self, subject_ids, predicate, triples=None):
+        """
+        subject_idsの主語ごとのpredicateの値（用語）のリストを、主語の順に並べたリストで返す
+        
+        triplesにはpredicate_triplesの結果を渡せる。値の順序は1件ずつ走査した場合と同じ。
+        """
+        s, o = triples if triples is not None else self.predicate_triples(predicate)
+        terms = self.terms
+        objects = [terms[object_id] for object_id in o.tolist()]
+        return [objects[start:end] for start, end in zip(s.searchsorted(subject_ids, 'left').tolist(),
+                                                          s.searchsorted(subject_ids, 'right').tolist())]
+    
+    def object_values(self, subject_ids, predicate, languages=(None,), class_uri=None, first_only=False,
+                      triples=None):
+        """
+        主語ごとのpredicateの値を言語タグ別にまとめて取り出す（言語タグを問わない場合はNone）
+        
+        戻り値は {言語タグ: (各主語の値の開始位置のリスト, 終了位置のリスト, 値の文字列のリスト)}。
+        述語の範囲をPOSから取り出して主語順に並べ替え、型の条件で絞り込むのは言語タグの数によらず1回だけで、
+        言語タグごとには用語の言語タグの配列で絞り込んでから、subject_idsの各主語の範囲をsearchsortedで求める。
+        triplesにはpredicate_triplesの結果を渡せる。値の順序は1件ずつ走査した場合と同じ。
+        """
+        np = self.np
+        s, o = triples if triples is not None else self.predicate_triples(predicate)
+        if class_uri is not None:
+            type_id, class_id = self.term_ids.get(RDF.type), self.term_ids.get(class_uri)
+            members = (self.s[self._pos_rows(type_id, class_id)] if type_id is not None and class_id is not None
+                       else np.zeros(0, dtype=np.int32))
+            keep = np.isin(o, members)
+            s, o = s[keep], o[keep]
+        
+        results = {}
+        terms = self.terms
+        for lang in languages:
+            lang_s, lang_o = s, o
+            if lang is not None:
+                keep = self._term_languages()[o] == self._language_ids.get(lang, -2)
+                lang_s, lang_o = s[keep], o[keep]
+            if first_only and len(lang_s) > 0:
+                keep = np.ones(len(lang_s), dtype=bool)
+                keep[1:] = lang_s[1:] != lang_s[:-1]
+                lang_s, lang_o = lang_s[keep], lang_o[keep]
+            results[lang] = (lang_s.searchsorted(subject_ids, 'left').tolist(),
+                             lang_s.searchsorted(subject_ids, 'right').tolist(),
+                             [str(terms[object_id]) for object_id in lang_o.tolist()])
+        return results
+    
+    def predicate_languages(self, predicate):
+        """
+        predicateの値のリテラルに付いている言語タグを並べたリストを返す
+        """
+        np = self.np
+        self._check_frozen()
+        predicate_id = self.term_ids.get(predicate)
+        if predicate_id is None:
+            return []
+        language_numbers = np.unique(self._term_languages()[self.o[self._pos_rows(predicate_id)]])
+        tags = {number: tag for tag, number in self._language_ids.items()}
+        return sorted(tags[number] for number in language_numbers.tolist() if number >= 0)
+    
+    def namespaces(self):
+        # 名前空間の束縛は持たないため、rdflibのGraphの既定の束縛を返す（統合したGraphと同じ）
+        return Graph().namespaces()
+    
+    def memory_bytes(self):
+        """
+        トリプルと検索用の並びが使っているバイト数（用語表のオブジェクトは含まない）
+        """
+        self._check_frozen()
+        arrays = (self.s, self.p, self.o, self._spo, self._spo_keys, self._pos, self._pos_keys)
+        return sum(array.nbytes for array in arrays)
+
+def encode_term(term):
+    """
+    用語を種類（U: URI、B: ブランクノード、L: リテラル）と値の文字列にする（MappedTripleStoreの用語ファイル用）
+    
+    リテラルは値・言語タグ・データ型をNUL文字で区切る（XMLのテキストにNUL文字は現れない）。
+    """
+    if isinstance(term, Literal):
+        return f"L{term}\x00{term.language or ''}\x00{term.datatype or ''}"
+    if isinstance(term, BNode):
+        return f"B{term}"
+    return f"U{term}"
+
+def decode_term(encoded):
+    """
+    encode_termの文字列から用語を復元する
+    """
+    kind, value = encoded[0], encoded[1:]
+    if kind == 'L':
+        value, lang, datatype = value.rsplit('\x00', 2)
+        return Literal(value, lang=lang or None, datatype=URIRef(datatype) if datatype else None)
+    if kind == 'B':
+        return BNode(value)
+    return URIRef(value)
+
+# MappedTripleStoreのファイル形式のバージョン（形式を変えたら上げる）
+MAPPED_STORE_VERSION = 1
+
+# MappedTripleStoreの検索用の配列（属性名 → ファイル名）
+MAPPED_STORE_ARRAYS = {'s': 's.npy', 'p': 'p.npy', 'o': 'o.npy', '_spo': 'spo.npy', '_spo_keys': 'spo_keys.npy',
+                       '_pos': 'pos.npy', '_pos_keys': 'pos_keys.npy'}
+
+class MappedTermTable:
+    """
+    MappedTripleStoreの用語ファイルを用語IDで引く読み取り専用の列（terms.binをメモリマップして読む）
+    
+    最近使った用語は復元したオブジェクトを再利用する。
+    """
+    def __init__(self, store_dir, np):
+        self._file = open(os.path.join(store_dir, 'terms.bin'), 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(
+            self._file.name) > 0 else b''
+        self._offsets = np.load(os.path.join(store_dir, 'term_offsets.npy'), mmap_mode='r')
+        self._decode = lru_cache(maxsize=1 << 16)(self._load)
+    
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    def raw(self, term_id):
+        """
+        用語IDの用語をencode_termで符号化したバイト列のまま返す
+        """
+        return self._data[int(self._offsets[term_id]):int(self._offsets[term_id + 1])]
+    
+    def _load(self, term_id):
+        return decode_term(self.raw(term_id).decode('utf-8'))
+    
+    def __getitem__(self, term_id):
+        return self._decode(int(term_id))
+
+class MappedTermIndex:
+    """
+    用語 → 用語ID をMappedTripleStoreの用語ファイルから引く（InternedTripleStoreのterm_idsの代わり）
+    
+    符号化したバイト列の順に並べた用語IDの配列（term_order.npy）を二分探索する。
+    """
+    def __init__(self, terms, order):
+        self._terms = terms
+        self._order = order
+        self.get = lru_cache(maxsize=1 << 16)(self._find)
+    
+    def _find(self, term, default=None):
+        key = encode_term(term).encode('utf-8')
+        index = bisect.bisect_left(self._order, key, key=self._terms.raw)
+        if index < len(self._order) and self._terms.raw(self._order[index]) == key:
+            return int(self._order[index])
+        return default
+
+class MappedTripleStore(InternedTripleStore):
+    """
+    MappedStoreBuilderがディスクに作成したファイルをメモリマップして使う読み取り専用のトリプルストア（NumPyが必要）
+    
+    主語順（SPO）と述語・目的語順（POS）の並びと用語表をファイルのまま参照するため、
+    メモリに載るのは検索で実際に読んだページと最近使った用語だけになり、RAMより大きいデータも変換できる。
+    検索はInternedTripleStoreと同じで、同じファイルから読み込んだ場合と同じ順に結果を返す。
+    """
+    def __init__(self, store_dir):
+        import numpy
+        
+        self.np = numpy
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.terms = MappedTermTable(store_dir, numpy)
+        self.term_ids = MappedTermIndex(self.terms, numpy.load(os.path.join(store_dir, 'term_order.npy'),
+                                                               mmap_mode='r'))
+        for name, file_name in MAPPED_STORE_ARRAYS.items():
+            setattr(self, name, numpy.load(os.path.join(store_dir, file_name), mmap_mode='r'))
+        self._languages = numpy.load(os.path.join(store_dir, 'term_languages.npy'), mmap_mode='r')
+        self._language_ids = {tag: number for number, tag in enumerate(self.meta['languages'])}
+        self._chunks = []
+        self._frozen = True
+    
+    def add_encoded(self, terms, triple_ids):
+        # 読み取り専用のストアへの追加は呼び出し側の誤り
+        raise TypeError('MappedTripleStoreは読み取り専用です（MappedStoreBuilderで作り直してください）')
+    
+    def freeze(self):
+        pass
+    
+    def _term_languages(self):
+        return self._languages
+
+def open_mapped_store(store_dir, signature):
+    """
+    store_dirのMappedTripleStoreを開く（ないか、ソースファイルの一覧・形式のバージョンが違う場合はNone）
+    """
+    meta_file = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    try:
+        with open(meta_file, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != MAPPED_STORE_VERSION or meta.get('signature') != [list(entry) for entry in signature]:
+        return None
+    return MappedTripleStore(store_dir)
+
+class MappedStoreBuilder:
+    """
+    読み込んだトリプルをディスクに書き出し、MappedTripleStoreのファイルを作成する一括読み込み（NumPyが必要）
+    
+    用語は符号化した文字列の辞書でIDを振りながら用語ファイルに追記し、トリプルはIDの配列のまま一時ファイルに追記する。
+    finishでトリプルの重複を除いて検索用の並びを作り、作成中のディレクトリをstore_dirに置き換えてから開き直す。
+    作成中にメモリに持つのは用語の辞書と、並べ替えるトリプルのIDの配列だけになる。
+    """
+    def __init__(self, store_dir, signature):
+        import numpy
+        
+        self.np = numpy
+        self.store_dir = store_dir
+        self.signature = signature
+        self.build_dir = store_dir.rstrip(os.sep) + '.building'
+        if os.path.exists(self.build_dir):
+            shutil.rmtree(self.build_dir)
+        os.makedirs(self.build_dir)
+        self.term_ids = {}
+        self._offsets = array('q', [0])
+        self._languages = array('i')
+        self._language_ids = {}
+        self._terms_file = open(os.path.join(self.build_dir, 'terms.bin'), 'wb')
+        self._triples_file = open(os.path.join(self.build_dir, 'triples.tmp'), 'wb')
+        self._triple_count = 0
+    
+    def _intern(self, term):
+        key = encode_term(term)
+        term_id = self.term_ids.get(key)
+        if term_id is None:
+            term_id = self.term_ids[key] = len(self.term_ids)
+            data = key.encode('utf-8')
+            self._terms_file.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            lang = getattr(term, 'language', None)
+            self._languages.append(-1 if lang is None else self._language_ids.setdefault(lang, len(self._language_ids)))
+        return term_id
+    
+    def add_encoded(self, terms, triple_ids):
+        """
+        encode_triplesの結果（用語表, トリプルのID配列）を追加する
+        """
+        np = self.np
+        local_to_global = np.fromiter((self._intern(term) for term in terms), dtype=np.int32, count=len(terms))
+        local_to_global[np.asarray(triple_ids, dtype=np.int32)].tofile(self._triples_file)
+        self._triple_count += len(triple_ids) // 3
+    
+    def __len__(self):
+        return self._triple_count
+    
+    def finish(self):
+        """
+        検索用の並びと用語の索引を書き出してMappedTripleStoreとして開く
+        """
+        np = self.np
+        self._terms_file.close()
+        self._triples_file.close()
+        triples_path = os.path.join(self.build_dir, 'triples.tmp')
+        triple_ids = np.fromfile(triples_path, dtype=np.int32)
+        os.remove(triples_path)
+        
+        term_count = len(self.term_ids)
+        arrays = dict(zip(MAPPED_STORE_ARRAYS, index_triples(np, triple_ids, term_count)))
+        del triple_ids
+        for name, file_name in MAPPED_STORE_ARRAYS.items():
+            np.save(os.path.join(self.build_dir, file_name), arrays.pop(name))
+        
+        # 用語IDを符号化した文字列の順に並べる（UTF-8のバイト列の順と同じ）
+        keys = list(self.term_ids)
+        self.term_ids = None
+        order = np.array(sorted(range(term_count), key=keys.__getitem__), dtype=np.int32)
+        del keys
+        np.save(os.path.join(self.build_dir, 'term_order.npy'), order)
+        np.save(os.path.join(self.build_dir, 'term_offsets.npy'), np.frombuffer(self._offsets, dtype=np.int64))
+        np.save(os.path.join(self.build_dir, 'term_languages.npy'), np.frombuffer(self._languages, dtype=np.int32))
+        
+        meta = {
+            'version': MAPPED_STORE_VERSION,
+            'signature': [list(entry) for entry in self.signature],
+            'terms': term_count,
+            'languages': sorted(self._language_ids, key=self._language_ids.get),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        }
+        with open(os.path.join(self.build_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        
+        if os.path.exists(self.store_dir):
+            shutil.rmtree(self.store_dir)
+        os.replace(self.build_dir, self.store_dir)
+        return MappedTripleStore(self.store_dir)
+
+def add_encoded_triples(merged_graph, terms, triple_ids):
+    """
+    encode_triplesの結果を統合グラフ（Graph、InternedTripleStoreまたはMappedStoreBuilder）に追加する
+    """
+    if isinstance(merged_graph, Graph):
+        merged_graph.addN((s, p, o, merged_graph) for s, p, o in decode_triples(terms, triple_ids))
+    else:
+        merged_graph.add_encoded(terms, triple_ids)
+
+# 統合グラフの保持方法（rdflib: rdflibのGraph、interned: InternedTripleStore、mmap: MappedTripleStore）
+TRIPLE_STORES = ('rdflib', 'interned', 'mmap')
+
+def read_rdf_bytes(file_path):
+    """
+    ソースファイルを展開したバイト列として読み込む
+    """
+    with open_rdf_source(file_path) as source:
+        return source.read()
+
+class SharedSourceFiles:
+    """
+    一括変換で、複数のスナップショットにある同じ内容のファイル（terms.ttlなど）の解析結果を使い回す
+    
+    サイズとフォーマットが同じファイルだけSHA-256を比べ、同じ内容のファイルは最初に読み込んだときの
+    解析結果（encode_triplesの形式）を、そのファイルを使う最後のスナップショットを読み込み終わるまでメモリに保持する。
+    アーカイブ内のファイルは対象にしない。
+    """
+    def __init__(self, snapshot_files):
+        candidates = {}
+        for rdf_files in snapshot_files:
+            for file_path, format_type in rdf_files:
+                if ARCHIVE_MEMBER_SEPARATOR in file_path:
+                    continue
+                try:
+                    size = os.path.getsize(file_path)
+                except OSError:
+                    continue
+                candidates.setdefault((size, format_type), []).append((file_path, format_type))
+        
+        # ファイルパス → 内容のキー、内容のキー → まだ読み込んでいないスナップショットの数
+        self.keys = {}
+        self.uses = {}
+        for files in candidates.values():
+            if len(files) < 2:
+                continue
+            keys = {file_path: cache_file_path('', file_path, format_type) for file_path, format_type in files}
+            counts = Counter(keys.values())
+            for file_path, key in keys.items():
+                if counts[key] > 1:
+                    self.keys[file_path] = key
+                    self.uses[key] = counts[key]
+        self._triples = {}
+    
+    def __contains__(self, file_path):
+        return file_path in self.keys
+    
+    def get(self, file_path):
+        """
+        解析済みの (用語表, トリプルのID配列) を返す（まだ読み込んでいなければNone）
+        """
+        return self._triples.get(self.keys.get(file_path))
+    
+    def put(self, file_path, terms, triple_ids):
+        key = self.keys.get(file_path)
+        if key is not None:
+            self._triples[key] = (terms, triple_ids)
+    
+    def release(self, rdf_files):
+        """
+        1つのスナップショットの読み込みが終わったときに呼び、もう使わない解析結果を捨てる
+        """
+        for file_path, _ in rdf_files:
+            key = self.keys.get(file_path)
+            if key is None:
+                continue
+            self.uses[key] -= 1
+            if self.uses[key] == 0:
+                self._triples.pop(key, None)
+
+class SourcePrefetcher:
+    """
+    RDFファイルの読み込みを別スレッドで先に進め、ファイルの順に返す
+    
+    各ファイルについて、キャッシュファイルのパスの計算（ファイル全体のハッシュ）、キャッシュの読み込み、
+    キャッシュがなければファイルの読み込みと展開までを行う（skipのファイルはキャッシュの確認だけ）。
+    NFSなど読み込みの遅いディスクでも、解析中に次のファイルの読み込みが進む。
+    先読みはdepth個のファイルまでとし、先読みしたデータの合計がmax_bytesを超える間は次のファイルを読まない。
+    展開後の大きさがmax_bytesを超えるファイル（大きさがわからない圧縮ファイルを含む）は読み込まず、
+    dataをNoneにして返す（解析するときにソースファイルから直接読む）。
+    depthが0の場合はスレッドを使わず、どのファイルも読み込まずに返す。
+    sharedのファイル（一括変換で前のスナップショットと同じ内容のもの）は、読み込まずにその解析結果を返す。
+    """
+    def __init__(self, rdf_files, cache_dir=None, cache_paths=None, skip=(), depth=2, max_bytes=512 << 20,
+                 shared=None):
+        self._rdf_files = rdf_files
+        self._cache_dir = cache_dir
+        self._cache_paths = cache_paths or {}
+        self._skip = set(skip)
+        self._shared = shared or {}
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._held_bytes = 0
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        if depth > 0:
+            self._queue = queue.Queue(depth)
+            self._thread = threading.Thread(target=self._produce, daemon=True)
+            self._thread.start()
+    
+    def _prefetch(self, file_path, format_type):
+        """
+        1ファイル分を読み込み、{file_path, format_type, cache_path, cached, shared, cache_error, data, error} を返す
+        """
+        item = {'file_path': file_path, 'format_type': format_type, 'cache_path': None,
+                'cached': None, 'shared': False, 'cache_error': None, 'data': None, 'error': None}
+        if file_path in self._shared:
+            item['cached'] = self._shared[file_path]
+            item['shared'] = True
+            return item
+        try:
+            cache_path = self._cache_paths.get(file_path)
+            if cache_path is None and self._cache_dir:
+                cache_path = cache_file_path(self._cache_dir, file_path, format_type)
+            item['cache_path'] = cache_path
+            if cache_path and os.path.exists(cache_path):
+                try:
+                    item['cached'] = load_cached_triples(cache_path)
+                    return item
+                except Exception as e:
+                    item['cache_error'] = str(e)
+            if file_path in self._skip or self._depth == 0:
+                return item
+            size = source_size(file_path)
+            if size is None or size > self._max_bytes:
+                return item
+            # 先読みしたデータと合わせて上限を超える間は、解析が進むのを待ってから読み込む
+            with self._condition:
+                while (self._held_bytes > 0 and self._held_bytes + size > self._max_bytes
+                       and not self._stopped.is_set()):
+                    self._condition.wait(0.1)
+            item['data'] = read_rdf_bytes(file_path)
+        except Exception as e:
+            item['error'] = str(e)
+        return item
+    
+    def _produce(self):
+        for file_path, format_type in self._rdf_files:
+            if self._stopped.is_set():
+                return
+            item = self._prefetch(file_path, format_type)
+            size = len(item['data'] or b'')
+            with self._condition:
+                self._held_bytes += size
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put((item, size), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    
+    def __iter__(self):
+        if self._thread is None:
+            for file_path, format_type in self._rdf_files:
+                yield self._prefetch(file_path, format_type)
+            return
+        for _ in self._rdf_files:
+            item, size = self._queue.get()
+            with self._condition:
+                self._held_bytes -= size
+                self._condition.notify()
+            yield item
+    
+    def close(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+
+class GraphMerger:
+    """
+    解析したトリプルを別スレッドで統合グラフに追加し、キャッシュに保存する（渡した順に処理する）
+    
+    次のファイルの解析と並行して前のファイルの統合とキャッシュの書き込みを行う。
+    待っているファイルはdepth個までとし、depthが0の場合はputの中でそのまま統合する。
+    統合に失敗した場合は、その例外と失敗したファイルをerrorとfailed_fileに記録し、以降のファイルは統合しない
+    （統合グラフは途中までになるため、呼び出し側はputの後とcloseの後にerrorを確認して読み込みを中止する）。
+    """
+    def __init__(self, merged_graph, depth=1):
+        self.merged_graph = merged_graph
+        self.error = None
+        self.failed_file = None
+        self._thread = None
+        if depth > 0:
+            self._queue = queue.Queue(depth)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    
+    def put(self, file_path, temp_graph=None, terms=None, triple_ids=None, cache_path=None, triple_filter=None):
+        """
+        file_pathのtemp_graph（解析したGraph）またはterms・triple_ids（encode_triplesの結果）を追加する
+        
+        cache_pathを渡した場合は、トリプルをすべてキャッシュに保存する。
+        triple_filterを渡した場合は、キャッシュへの保存の後、許可されたトリプルだけを追加する。
+        すでに統合に失敗している場合は何もしない。
+        """
+        if self.error is not None:
+            return
+        item = (file_path, temp_graph, terms, triple_ids, cache_path, triple_filter)
+        if self._thread is None:
+            self._merge(*item)
+            return
+        self._queue.put(item)
+    
+    def _merge(self, file_path, temp_graph, terms, triple_ids, cache_path, triple_filter):
+        """
+        1ファイル分を統合し、かかった時間（このスレッドのCPU時間）をmergeの段階として計測結果に加える
+        """
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            triple_count = self._add(temp_graph, terms, triple_ids, cache_path, triple_filter)
+        except Exception as e:
+            self.error = e
+            self.failed_file = file_path
+            return
+        metrics.add('merge', time.perf_counter() - wall_start, time.thread_time() - cpu_start,
+                    merged_triples=triple_count)
+    
+    def _add(self, temp_graph, terms, triple_ids, cache_path, triple_filter):
+        merged_graph = self.merged_graph
+        if temp_graph is not None:
+            if not isinstance(merged_graph, Graph) or cache_path or triple_filter is not None:
+                terms, triple_ids = encode_triples(temp_graph)
+            else:
+                merged_graph += temp_graph
+                return len(temp_graph)
+        if cache_path:
+            try:
+                save_cached_triples(cache_path, terms, triple_ids)
+            except Exception as e:
+                print(f"  警告: キャッシュを保存できません - {cache_path}: {str(e)}")
+        if triple_filter is not None:
+            terms, triple_ids = filter_encoded_triples(terms, triple_ids, triple_filter)
+        add_encoded_triples(merged_graph, terms, triple_ids)
+        return len(triple_ids) // 3
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                self._merge(*item)
+    
+    def close(self):
+        """
+        待っているファイルの統合を終える（失敗したかどうかはこの後にerrorで確認する）
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+def load_rdf_files(source_dir='./source', jobs=1, cache_dir=None, store='rdflib', prefetch=2,
+                   prefetch_bytes=512 << 20, rdf_files=None, triple_filter=None, store_dir='./.store',
+                   term_dictionary=None, shared_files=None):
+    """
+    source_dirのRDFファイルを読み込み、統合グラフ（GraphまたはInternedTripleStore・MappedTripleStore）を返す
+    
+    ファイルの読み込み・解析・統合はパイプラインで並行して行う。解析できないファイルは飛ばすが、
+    統合グラフへの追加に失敗した場合は残りのファイルを読み込まずにNoneを返す。引数は次のとおり。
+    - jobs: 2以上ならキャッシュのないファイルをプロセスプールで並列に解析する
+    - cache_dir: 解析結果をファイルのハッシュごとに保存・再利用するディレクトリ（Noneならキャッシュしない）
+    - store: 統合グラフの保持方法（'rdflib'、'interned'、'mmap'）
+    - prefetch, prefetch_bytes: 解析と並行して先に読み込むファイル数とその合計の上限。0なら順に処理する
+    - rdf_files: source_dirのすべてのファイルの代わりに読み込む (ファイルパス, フォーマット) のリスト
+    - triple_filter: 統合グラフに追加するトリプルを絞り込むTripleFilter。キャッシュを使わない場合は解析中に捨て、
+      使う場合はファイル全体をキャッシュに保存してから絞り込む
+    - store_dir: store='mmap'のストアのディレクトリ。ソースファイルの一覧が一致すれば開くだけにし、
+      一致しなければすべてのファイルのすべてのトリプルから作り直す（rdf_filesとtriple_filterは使わない）
+    - term_dictionary: store='interned'で使う用語表（一括変換で共有するTermDictionary）
+    - shared_files: 前のスナップショットと同じ内容のファイルの解析結果（一括変換で共有するSharedSourceFiles）
+    """
+    if store == 'mmap':
+        signature = source_signature(source_dir)
+        mapped_store = open_mapped_store(store_dir, signature)
+        if mapped_store is not None:
+            print(f"ディスク上のトリプルストアを開きました: {store_dir}")
+            print(f"  統合グラフのトリプル数: {len(mapped_store)}")
+            print(f"  用語数: {len(mapped_store.terms)}")
+            return mapped_store
+        print(f"ディスク上のトリプルストアを作成します: {store_dir}")
+        merged_graph = MappedStoreBuilder(store_dir, signature)
+        rdf_files = None
+        triple_filter = None
+    elif store == 'interned':
+        merged_graph = InternedTripleStore(term_dictionary)
+    else:
+        merged_graph = Graph()
+    
+    if rdf_files is None:
+        rdf_files = list_rdf_files(source_dir)
+    total_files = len(rdf_files)
     loaded_files = 0
+    load_start = time.perf_counter()
     
     print(f"RDFファイルの読み込みを開始: {source_dir}")
     
-    for extension in rdf_extensions:
-        pattern = os.path.join(source_dir, extension)
-        files = glob.glob(pattern)
-        total_files += len(files)
-        
-        for file_path in files:
+    # キャッシュに保存しない場合だけ、トリプルを解析中に絞り込む
+    parse_filter = None if cache_dir else triple_filter
+    
+    # 前のスナップショットで解析済みのファイル
+    shared = {}
+    if shared_files is not None:
+        shared = {file_path: shared_files.get(file_path) for file_path, _ in rdf_files}
+        shared = {file_path: triples for file_path, triples in shared.items() if triples is not None}
+    
+    # キャッシュのないファイルを並列に解析（解析するファイルを先に決めるため、ここでキャッシュを確認する）
+    cache_paths = {}
+    executor = None
+    futures = {}
+    if jobs > 1:
+        if cache_dir:
+            for file_path, format_type in rdf_files:
+                cache_paths[file_path] = cache_file_path(cache_dir, file_path, format_type)
+        uncached_files = [(file_path, format_type) for file_path, format_type in rdf_files
+                          if file_path not in shared and not os.path.exists(cache_paths.get(file_path, ''))]
+        if len(uncached_files) > 1:
+            print(f"並列読み込み: {min(jobs, len(uncached_files))} プロセス")
+            executor = ProcessPoolExecutor(max_workers=min(jobs, len(uncached_files)))
+            futures = {file_path: executor.submit(parse_rdf_file, file_path, format_type, parse_filter)
+                       for file_path, format_type in uncached_files}
+    
+    # 読み込み（キャッシュの確認と展開を含む）・解析・統合をパイプラインで並行させる
+    prefetcher = SourcePrefetcher(rdf_files, cache_dir, cache_paths, futures, prefetch, prefetch_bytes, shared)
+    merger = GraphMerger(merged_graph, 1 if prefetch > 0 else 0)
+    used_cache_paths = {}
+    try:
+        for item in prefetcher:
+            # 統合に失敗したら残りのファイルは読み込まない
+            if merger.error is not None:
+                break
+            file_path, format_type = item['file_path'], item['format_type']
             try:
                 print(f"読み込み中: {file_path}")
+                if item['error'] is not None:
+                    raise RuntimeError(item['error'])
+                cache_path = item['cache_path']
+                if cache_path:
+                    used_cache_paths[file_path] = cache_path
+                merge_filter = triple_filter if cache_path else None
                 
-                # ファイル拡張子に基づいてフォーマットを判定
-                if file_path.endswith('.ttl'):
-                    format_type = 'turtle'
-                elif file_path.endswith('.rdf') or file_path.endswith('.xml'):
-                    format_type = 'xml'
-                elif file_path.endswith('.n3'):
-                    format_type = 'n3'
-                elif file_path.endswith('.nt'):
-                    format_type = 'nt'
-                elif file_path.endswith('.jsonld'):
-                    format_type = 'json-ld'
-                else:
-                    format_type = 'turtle'  # デフォルト
+                # キャッシュ（または前のスナップショットでの解析結果）から読み込み
+                if item['cached'] is not None:
+                    terms, triple_ids = item['cached']
+                    merger.put(file_path, terms=terms, triple_ids=triple_ids, triple_filter=triple_filter)
+                    loaded_files += 1
+                    if item['shared']:
+                        metrics.add('load', shared_triples=len(triple_ids) // 3)
+                        print(f"  成功: {len(triple_ids) // 3} トリプルを前のスナップショットの解析結果から読み込み")
+                        continue
+                    if shared_files is not None:
+                        shared_files.put(file_path, terms, triple_ids)
+                    metrics.add('load', cached_triples=len(triple_ids) // 3)
+                    print(f"  成功: {len(triple_ids) // 3} トリプルをキャッシュから読み込み")
+                    continue
+                if item['cache_error'] is not None:
+                    print(f"  警告: キャッシュを読み込めません（{item['cache_error']}）。再解析します")
                 
-                # ファイルを読み込み
-                temp_graph = Graph()
-                temp_graph.parse(file_path, format=format_type)
+                if file_path in futures:
+                    terms, triple_ids, parse_time = futures[file_path].result()
+                    parse_cpu = None
+                    triple_count = len(triple_ids) // 3
+                    if shared_files is not None:
+                        shared_files.put(file_path, terms, triple_ids)
+                    
+                    # 統合グラフに追加
+                    merger.put(file_path, terms=terms, triple_ids=triple_ids, cache_path=cache_path,
+                               triple_filter=merge_filter)
+                else:
+                    # 先読みしたファイルの内容（先読みしなかったファイルはソースファイル）を解析
+                    parse_start, parse_cpu_start = time.perf_counter(), time.process_time()
+                    temp_graph = new_parse_graph(parse_filter)
+                    data = item.pop('data')
+                    if data is None:
+                        parse_rdf_source(temp_graph, file_path, format_type)
+                    else:
+                        parse_rdf_bytes(temp_graph, data, file_path, format_type)
+                    del data
+                    parse_time = time.perf_counter() - parse_start
+                    parse_cpu = time.process_time() - parse_cpu_start
+                    triple_count = len(temp_graph)
+                    
+                    # 統合グラフに追加（次のスナップショットでも使うファイルは解析結果を残す）
+                    if shared_files is not None and file_path in shared_files:
+                        terms, triple_ids = encode_triples(temp_graph)
+                        shared_files.put(file_path, terms, triple_ids)
+                        merger.put(file_path, terms=terms, triple_ids=triple_ids, cache_path=cache_path,
+                                   triple_filter=merge_filter)
+                    else:
+                        merger.put(file_path, temp_graph=temp_graph, cache_path=cache_path, triple_filter=merge_filter)
+                    del temp_graph
                 
-                # 統合グラフに追加
-                merged_graph += temp_graph
+                metrics.add('parse', parse_time, parse_cpu, parsed_triples=triple_count)
                 loaded_files += 1
                 
-                print(f"  成功: {len(temp_graph)} トリプルを読み込み")
+                print(f"  成功: {triple_count} トリプルを読み込み（解析 {parse_time:.2f}秒）")
                 
             except Exception as e:
                 print(f"  エラー: {file_path} - {str(e)}")
                 continue
+        
+        merger.close()
+    finally:
+        prefetcher.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    
+    # 途中までの統合グラフからは変換しない
+    if merger.error is not None:
+        print(f"  エラー: 統合グラフへの追加に失敗しました - {merger.failed_file}: {str(merger.error)}")
+        print("読み込みを中止しました")
+        return None
+    
+    if cache_dir and os.path.isdir(cache_dir):
+        try:
+            prune_cache(cache_dir, used_cache_paths)
+        except OSError as e:
+            print(f"  警告: キャッシュを整理できません - {str(e)}")
+    
+    if isinstance(merged_graph, InternedTripleStore):
+        merged_graph.freeze()
+    elif isinstance(merged_graph, MappedStoreBuilder):
+        merged_graph = merged_graph.finish()
     
     print(f"\n読み込み完了:")
     print(f"  総ファイル数: {total_files}")
     print(f"  成功したファイル数: {loaded_files}")
     print(f"  統合グラフのトリプル数: {len(merged_graph)}")
+    if isinstance(merged_graph, InternedTripleStore):
+        print(f"  用語数: {len(merged_graph.terms)}"
+              f"（トリプルと索引 {merged_graph.memory_bytes() / 1024 / 1024:.1f} MB）")
+    print(f"  読み込み時間: {time.perf_counter() - load_start:.2f}秒")
     
     return merged_graph
 
-def main():
+# RDF/XMLの構文要素
+RDF_TAG = '{%s}' % RDF
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+XML_BASE = '{http://www.w3.org/XML/1998/namespace}base'
+RDF_SYNTAX_ATTRIBUTES = {
+    RDF_TAG + 'about', RDF_TAG + 'nodeID', RDF_TAG + 'ID', RDF_TAG + 'resource',
+    RDF_TAG + 'datatype', RDF_TAG + 'parseType', XML_LANG, XML_BASE
+}
+
+def _tag_to_uri(tag):
     """
-    メイン処理
+    ElementTreeの '{名前空間}ローカル名' 形式をURIに変換する
     """
-    # ./sourceディレクトリの存在確認
-    if not os.path.exists('./source'):
-        print("エラー: ./sourceディレクトリが見つかりません")
-        return
+    namespace, _, local_name = tag[1:].partition('}')
+    return URIRef(namespace + local_name)
+
+def _resolve_uri(uri, base):
+    """
+    相対URIをxml:baseに対して解決する（絶対URIはそのまま）
+    """
+    if urlparse(uri).scheme:
+        return URIRef(uri)
+    return URIRef(urljoin(base, uri))
+
+def _node_element_triples(elem, lang, base, node_ids):
+    """
+    ノード要素（rdf:Descriptionや型付きノード）から
+    (主語, 述語, 目的語, 言語タグ, データ型) のタプルを生成し、主語を返す
+    """
+    base = elem.get(XML_BASE, base)
+    lang = elem.get(XML_LANG, lang)
+    
+    if elem.get(RDF_TAG + 'about') is not None:
+        subject = _resolve_uri(elem.get(RDF_TAG + 'about'), base)
+    elif elem.get(RDF_TAG + 'ID') is not None:
+        subject = _resolve_uri('#' + elem.get(RDF_TAG + 'ID'), base)
+    elif elem.get(RDF_TAG + 'nodeID') is not None:
+        subject = node_ids.setdefault(elem.get(RDF_TAG + 'nodeID'), BNode())
+    else:
+        subject = BNode()
+    
+    # 型付きノードの要素名はrdf:typeとして扱う
+    if elem.tag != RDF_TAG + 'Description':
+        yield (subject, RDF.type, _tag_to_uri(elem.tag), None, None)
+    
+    # プロパティ属性
+    for attr, value in elem.attrib.items():
+        if attr in RDF_SYNTAX_ATTRIBUTES:
+            continue
+        if attr == RDF_TAG + 'type':
+            yield (subject, RDF.type, _resolve_uri(value, base), None, None)
+        else:
+            yield (subject, _tag_to_uri(attr), Literal(value, lang=lang), lang, None)
     
-    # RDFファイルの読み込み
-    merged_graph = load_rdf_files('./source')
+    # プロパティ要素
+    yield from _property_elements_triples(subject, elem, lang, base, node_ids)
     
-    if len(merged_graph) == 0:
-        print("警告: 読み込まれたRDFデータがありません")
-        return
+    return subject
+
+def _property_elements_triples(subject, elem, lang, base, node_ids):
+    """
+    elemの子のプロパティ要素から (主語, 述語, 目的語, 言語タグ, データ型) のタプルを生成する
+    （rdf:liは出現順にrdf:_1、rdf:_2、…とする）
+    """
+    member_count = 0
+    for prop in elem:
+        predicate = None
+        if prop.tag == RDF_TAG + 'li':
+            member_count += 1
+            predicate = RDF[f'_{member_count}']
+        yield from _property_element_triples(subject, prop, lang, base, node_ids, predicate)
+
+def _property_element_triples(subject, prop, lang, base, node_ids, predicate=None):
+    """
+    プロパティ要素から (主語, 述語, 目的語, 言語タグ, データ型) のタプルを生成する
+    （predicateを渡した場合は要素名の代わりにその述語を使う）
+    """
+    base = prop.get(XML_BASE, base)
+    lang = prop.get(XML_LANG, lang)
+    if predicate is None:
+        predicate = _tag_to_uri(prop.tag)
+    parse_type = prop.get(RDF_TAG + 'parseType')
+    
+    if prop.get(RDF_TAG + 'resource') is not None or prop.get(RDF_TAG + 'nodeID') is not None:
+        # 参照（空のプロパティ要素）
+        if prop.get(RDF_TAG + 'resource') is not None:
+            obj = _resolve_uri(prop.get(RDF_TAG + 'resource'), base)
+        else:
+            obj = node_ids.setdefault(prop.get(RDF_TAG + 'nodeID'), BNode())
+        yield (subject, predicate, obj, None, None)
+        for attr, value in prop.attrib.items():
+            if attr not in RDF_SYNTAX_ATTRIBUTES:
+                yield (obj, _tag_to_uri(attr), Literal(value, lang=lang), lang, None)
+    elif parse_type == 'Resource':
+        # rdf:parseType="Resource"（ブランクノードの省略記法）
+        obj = BNode()
+        yield (subject, predicate, obj, None, None)
+        yield from _property_elements_triples(obj, prop, lang, base, node_ids)
+    elif parse_type == 'Literal':
+        # XMLリテラル
+        text = (prop.text or '') + ''.join(
+            ET.tostring(child, encoding='unicode') for child in prop)
+        yield (subject, predicate, Literal(text, datatype=RDF.XMLLiteral), None, RDF.XMLLiteral)
+    elif parse_type == 'Collection':
+        # rdf:List
+        items = []
+        for child in prop:
+            items.append((yield from _node_element_triples(child, lang, base, node_ids)))
+        head = RDF.nil
+        for item in reversed(items):
+            node = BNode()
+            yield (node, RDF.first, item, None, None)
+            yield (node, RDF.rest, head, None, None)
+            head = node
+        yield (subject, predicate, head, None, None)
+    elif len(prop):
+        # ネストしたノード要素
+        obj = yield from _node_element_triples(prop[0], lang, base, node_ids)
+        yield (subject, predicate, obj, None, None)
+    elif any(attr not in RDF_SYNTAX_ATTRIBUTES for attr in prop.attrib):
+        # プロパティ属性だけを持つ空要素はブランクノード
+        obj = BNode()
+        yield (subject, predicate, obj, None, None)
+        for attr, value in prop.attrib.items():
+            if attr not in RDF_SYNTAX_ATTRIBUTES:
+                yield (obj, _tag_to_uri(attr), Literal(value, lang=lang), lang, None)
+    else:
+        # リテラル
+        datatype = prop.get(RDF_TAG + 'datatype')
+        if datatype is not None:
+            datatype = _resolve_uri(datatype, base)
+            yield (subject, predicate, Literal(prop.text or '', datatype=datatype), None, datatype)
+        else:
+            yield (subject, predicate, Literal(prop.text or '', lang=lang), lang, None)
+
+def _iter_rdfxml_elements(file_path):
+    """
+    RDF/XMLをiterparseで読み、rdf:RDF直下のノード要素を1件ずつ返す
+    （返した要素は次の要素の読み込み前に破棄する）
+    """
+    depth = 0
+    root = None
+    with open_rdf_source(file_path) as source:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                yield root, elem
+                root.clear()
+
+def _iter_rdfxml_descriptions(file_path, node_ids=None):
+    """
+    RDF/XMLファイルをGraphを作らずに逐次読み込み、rdf:RDF直下のノード要素1件ごとに
+    (主語, 述語, 目的語, 言語タグ, データ型) のタプルを生成するジェネレーターを返す
+    （ジェネレーターは次の要素を読み込む前に使い切る）
     
-    # 基本的な統計情報を表示
-    print("\n=== データ統計 ===")
+    node_idsにはファイル全体で共有するrdf:nodeID → ブランクノードの辞書を渡せる。
+    """
+    base = source_base_uri(file_path)
+    if node_ids is None:
+        node_ids = {}
+    for root, elem in _iter_rdfxml_elements(file_path):
+        if root.tag != RDF_TAG + 'RDF':
+            raise ValueError(f"RDF/XMLではありません: {file_path}")
+        yield _node_element_triples(elem, root.get(XML_LANG), root.get(XML_BASE, base), node_ids)
+
+def _node_types(elem, base):
+    """
+    ノード要素が示すクラス（型付きノード要素のタグ、rdf:type属性・プロパティ要素）のリスト
+    """
+    types = []
+    if elem.tag != RDF_TAG + 'Description':
+        types.append(_tag_to_uri(elem.tag))
+    if elem.get(RDF_TAG + 'type') is not None:
+        types.append(_resolve_uri(elem.get(RDF_TAG + 'type'), base))
+    for property_elem in elem:
+        if property_elem.tag == RDF_TAG + 'type' and property_elem.get(RDF_TAG + 'resource') is not None:
+            types.append(_resolve_uri(property_elem.get(RDF_TAG + 'resource'), base))
+    return types
+
+def _collect_node_classes(elem, base, classes):
+    """
+    ノード要素とその中にネストしたノード要素のクラスをclassesに追加する
+    """
+    classes.update(_node_types(elem, base))
+    for property_elem in elem:
+        for child in property_elem:
+            _collect_node_classes(child, base, classes)
+
+def scan_source_classes(file_path, format_type):
+    """
+    ソースファイルに記述されたリソースのクラスを集め、(クラスURIの集合, 型のない記述があるか) を返す
+    
+    RDF/XMLはトリプルを作らずにノード要素の型だけを読み、それ以外の形式はrdflibで読み込んでrdf:typeを集める。
+    """
+    classes = set()
+    untyped = False
+    if format_type == 'xml':
+        base = source_base_uri(file_path)
+        for root, elem in _iter_rdfxml_elements(file_path):
+            if root.tag != RDF_TAG + 'RDF':
+                raise ValueError(f"RDF/XMLではありません: {file_path}")
+            elem_base = root.get(XML_BASE, base)
+            if not _node_types(elem, elem_base):
+                untyped = True
+            _collect_node_classes(elem, elem_base, classes)
+        return classes, untyped
+    
+    temp_graph = Graph()
+    parse_rdf_source(temp_graph, file_path, format_type)
+    classes.update(temp_graph.objects(None, RDF.type))
+    for subject in temp_graph.subjects(unique=True):
+        if not isinstance(subject, BNode) and (subject, RDF.type, None) not in temp_graph:
+            untyped = True
+            break
+    return classes, untyped
+
+# ソースファイルごとのクラスの一覧（キャッシュディレクトリに保存する）
+SOURCE_CLASSES_FILE = 'source_classes.json'
+
+def load_source_classes(rdf_files, cache_dir=None):
+    """
+    ソースファイルのパス → (クラスURIの集合, 型のない記述があるか) の辞書を返す
+    
+    cache_dirを指定した場合は、ファイルのサイズと更新時刻が変わっていない限り前回の走査結果を使う。
+    """
+    cache_file = os.path.join(cache_dir, SOURCE_CLASSES_FILE) if cache_dir else None
+    cached = {}
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+    
+    source_classes = {}
+    updated = False
+    for file_path, format_type in rdf_files:
+        stat = os.stat(file_path.partition(ARCHIVE_MEMBER_SEPARATOR)[0])
+        signature = [stat.st_size, stat.st_mtime_ns]
+        entry = cached.get(file_path)
+        if entry is None or entry['signature'] != signature:
+            print(f"クラスを確認中: {file_path}")
+            try:
+                classes, untyped = scan_source_classes(file_path, format_type)
+            except Exception as e:
+                # クラスを確認できないファイルはどのテーブルでも読み込む
+                print(f"  エラー: {file_path} - {str(e)}")
+                source_classes[file_path] = (set(), True)
+                continue
+            entry = cached[file_path] = {'signature': signature, 'classes': sorted(classes), 'untyped': untyped}
+            updated = True
+        source_classes[file_path] = ({URIRef(class_uri) for class_uri in entry['classes']}, entry['untyped'])
+    
+    if cache_file and updated:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cached, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, cache_file)
+    return source_classes
+
+def add_to_record(record, predicate, obj):
+    """
+    レコードに値を追加する（Graphと同様に重複は無視）
+    """
+    if predicate in record:
+        if obj not in record[predicate]:
+            record[predicate].append(obj)
+    else:
+        record[predicate] = [obj]
+
+def iter_resource_records(file_path, format_type='xml'):
+    """
+    ファイル内のリソースを記述ごとにまとめて返す
     
-    # 名前空間の定義
-    dcndl = Namespace("http://ndl.go.jp/dcndl/terms/")
+    rdf:RDF直下のノード要素1件ごとに {主語: レコード} の辞書を返す。
+    ネストしたブランクノード（dcterms:formatなど）のレコードも同じ辞書に含まれる。
+    rdf:nodeIDのブランクノードを含む記述は、ファイルの最後まで読んでから、同じrdf:nodeIDでつながる
+    記述ごとに1つの辞書にまとめて返す（別の記述に書かれたブランクノードのレコードも同じ辞書に含まれる）。
+    RDF/XML以外のファイルはrdflibで読み込んでから主語ごとにまとめる。
+    """
+    if format_type == 'xml':
+        node_ids = {}
+        node_id_nodes = set()
+        groups = {}
+        for triples in _iter_rdfxml_descriptions(file_path, node_ids):
+            records = {}
+            for subject, predicate, obj, lang, datatype in triples:
+                add_to_record(records.setdefault(subject, {}), predicate, obj)
+            if len(node_id_nodes) < len(node_ids):
+                node_id_nodes.update(islice(reversed(node_ids.values()), len(node_ids) - len(node_id_nodes)))
+            linked = {node for node in records if node in node_id_nodes}
+            linked.update(obj for record in records.values() for values in record.values()
+                          for obj in values if isinstance(obj, BNode) and obj in node_id_nodes)
+            if not linked:
+                yield records
+                continue
+            
+            # rdf:nodeIDでつながる記述のグループに統合する
+            group = {'records': records, 'nodes': linked}
+            for other in {id(groups[node]): groups[node] for node in linked if node in groups}.values():
+                if len(other['nodes']) > len(group['nodes']):
+                    group, other = other, group
+                for node, node_record in other['records'].items():
+                    merge_records(group['records'].setdefault(node, {}), node_record)
+                group['nodes'].update(other['nodes'])
+                for node in other['nodes']:
+                    groups[node] = group
+            for node in linked:
+                groups[node] = group
+        for group in {id(group): group for group in groups.values()}.values():
+            yield group['records']
+        return
     
-    # BibResourceの数をカウント
-    bib_resources = list(merged_graph.subjects(RDF.type, dcndl.BibResource))
-    print(f"BibResource数: {len(bib_resources)}")
+    temp_graph = Graph()
+    parse_rdf_source(temp_graph, file_path, format_type)
+    for subject in temp_graph.subjects(unique=True):
+        if isinstance(subject, BNode):
+            continue
+        records = {}
+        pending = [subject]
+        while pending:
+            node = pending.pop()
+            if node in records:
+                continue
+            records[node] = collect_resource_record(temp_graph, node)
+            for values in records[node].values():
+                pending.extend(v for v in values if isinstance(v, BNode))
+        yield records
+
+def collect_resource_record(merged_graph, resource):
+    """
+    リソースのトリプルをpredicate_objectsで1回だけ走査し、述語ごとの値リストにまとめる
+    """
+    record = {}
+    for predicate, obj in merged_graph.predicate_objects(resource):
+        if predicate in record:
+            record[predicate].append(obj)
+        else:
+            record[predicate] = [obj]
+    return record
+
+class RecordCache:
+    """
+    参照先ノード（ブランクノードやリンク先のリソース）のレコードを保持し、抽出間で共有するキャッシュ
     
-    # Itemの数をカウント
-    items = list(merged_graph.subjects(RDF.type, dcndl.Item))
-    print(f"Item数: {len(items)}")
+    同じPackageのdcterms:formatやrcgs:provisionActivityは、ゲームパッケージと
+    exemplarOfで参照する関連資料ごとにたどられるため、ノードごとのレコードを1回だけ作成して再利用する。
+    レコードは共有されるため、取得した側で変更しないこと。
+    max_entriesを超えた分はキャッシュに追加しない。
+    """
+    def __init__(self, max_entries=1000000):
+        self.records = {}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, node, load_record):
+        record = self.records.get(node)
+        if record is not None:
+            self.hits += 1
+            return record
+        self.misses += 1
+        record = load_record(node)
+        if len(self.records) < self.max_entries:
+            self.records[node] = record
+        return record
+    
+    def report(self):
+        """
+        ヒット数とミス数を表示する
+        """
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        print("\n=== 参照先レコードのキャッシュ ===")
+        print(f"ヒット: {self.hits} / ミス: {self.misses} (ヒット率 {hit_rate:.1f}%)")
+        print(f"保持しているレコード数: {len(self.records)}")
+
+# MappedTripleStoreで保持する参照先レコードの上限（常駐するメモリをデータの大きさによらず抑える）
+MAPPED_RECORD_CACHE_ENTRIES = 10000
+
+def new_record_cache(merged_graph):
+    """
+    統合グラフに合わせた参照先レコードのキャッシュを作成する（MappedTripleStoreでは保持するレコードを減らす）
+    """
+    if isinstance(merged_graph, MappedTripleStore):
+        return RecordCache(MAPPED_RECORD_CACHE_ENTRIES)
+    return RecordCache()
+
+def print_class_counts(class_counts):
+    """
+    データ統計としてクラスごとのリソース数を表示する
+    """
+    print("\n=== データ統計 ===")
+    for label, class_uri in STATISTICS_CLASSES:
+        print(f"{label}数: {class_counts.get(class_uri, 0)}")
+
+class JoinIndex:
+    """
+    Graphの読み込み後に1回だけ作成し、統計情報の表示とすべてのテーブルの抽出で共有する結合用のインデックス
     
-    # 使用されている名前空間を表示
-    print("\n使用されている名前空間:")
-    for prefix, namespace in merged_graph.namespaces():
-        print(f"  {prefix}: {namespace}")
+    - class_members: クラス → リソースのリスト（URIの順。rdf:typeのトリプルを1回だけ走査して全クラス分を作る）
+    - class_member_sets: クラス → リソースの集合（型の判定用）
+    - targets: requireのプロパティ → {主語: [参照先]}（Item → exemplarOf先のPackageなど）
+    - referrers: requireのプロパティ → {参照先: [主語]}（Package → Itemのリストなど）
+    - languages: "languages": "*" の列の終端の述語 → 値に付いている言語タグのリスト
+    """
+    def __init__(self, merged_graph, table_plans):
+        properties = []
+        for plan in table_plans.values():
+            if plan.required_property is not None and plan.required_property not in properties:
+                properties.append(plan.required_property)
+        
+        # 行の順序を実行ごとに変えないため、各クラスのリソースはURIの順に並べる
+        self.class_member_sets = {}
+        for subject, class_uri in merged_graph.subject_objects(RDF.type):
+            members = self.class_member_sets.get(class_uri)
+            if members is None:
+                members = self.class_member_sets[class_uri] = set()
+            members.add(subject)
+        self.class_members = {class_uri: sorted(members, key=str)
+                              for class_uri, members in self.class_member_sets.items()}
+        
+        self.languages = collect_languages(merged_graph, dict.fromkeys(
+            predicate for plan in table_plans.values() for predicate in plan.language_predicates))
+        
+        self.targets = {}
+        self.referrers = {}
+        for property_uri in properties:
+            targets = {}
+            referrers = {}
+            for subject, obj in merged_graph.subject_objects(property_uri):
+                targets.setdefault(subject, []).append(obj)
+                referrers.setdefault(obj, []).append(subject)
+            self.targets[property_uri] = targets
+            self.referrers[property_uri] = referrers
+
+class GraphResolver:
+    """
+    rdflibのGraphから参照先リソースのレコードを取得する
     
-    print("\nRDFファイルの読み込みが完了しました。")
-    return merged_graph
+    record_cacheがあれば参照先ノードのレコードをそれを経由して取得し、
+    join_indexがあれば型の判定にインデックスの集合を使う。1回の実行の中で共有する。
+    graph_probesにはGraphを実際に参照した回数（レコードの作成と型の判定）を数える。
+    """
+    def __init__(self, merged_graph, record_cache=None, join_index=None):
+        self.merged_graph = merged_graph
+        self.record_cache = record_cache
+        self.join_index = join_index
+        self.graph_probes = 0
+    
+    def load_record(self, resource):
+        self.graph_probes += 1
+        return collect_resource_record(self.merged_graph, resource)
+    
+    def record(self, resource):
+        if self.record_cache is not None:
+            return self.record_cache.get(resource, self.load_record)
+        return self.load_record(resource)
+    
+    def has_type(self, resource, class_uri):
+        if self.join_index is not None and class_uri in self.join_index.class_member_sets:
+            return resource in self.join_index.class_member_sets[class_uri]
+        self.graph_probes += 1
+        return (resource, RDF.type, class_uri) in self.merged_graph
 
-def extract_game_package_data(merged_graph):
+class StreamResolver:
     """
-    ゲームパッケージのデータを抽出してCSVに変換する
+    逐次読み込み中の記述と相互参照インデックスから参照先リソースのレコードを取得する
     """
-    print("\n=== ゲームパッケージデータの抽出開始 ===")
+    def __init__(self, index, records=None):
+        self.index = index
+        self.records = records or {}
     
-    # 名前空間の定義
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    schema = Namespace("http://schema.org/")
-    dcndl = Namespace("http://ndl.go.jp/dcndl/terms/")
-    skos = Namespace("http://www.w3.org/2004/02/skos/core#")
+    def record(self, resource):
+        if resource in self.records:
+            return self.records[resource]
+        return self.index.get(resource, {})
     
-    # rcgs:Packageタイプのリソースを取得
-    package_resources = list(merged_graph.subjects(RDF.type, rcgs.Package))
-    print(f"ゲームパッケージ数: {len(package_resources)}")
+    def has_type(self, resource, class_uri):
+        return class_uri in self.index.get(resource, {}).get(RDF.type, ())
+
+# 並列抽出のワーカーが参照するGraph（forkしたプロセスにコピーオンライトで共有される）
+_shared_resolver = None
+
+def _build_rows_chunk(build_row, resources):
+    """
+    ワーカープロセスでリソースのチャンクから行を作成し、
+    (行のリスト, キャッシュのヒット数, ミス数, Graphの参照回数) を返す
+    """
+    resolver = _shared_resolver
+    record_cache = resolver.record_cache
+    hits, misses, probes = record_cache.hits, record_cache.misses, resolver.graph_probes
+    rows = [build_row(resource, resolver.load_record(resource), resolver) for resource in resources]
+    return rows, record_cache.hits - hits, record_cache.misses - misses, resolver.graph_probes - probes
+
+def iter_rows(merged_graph, resources, build_row, jobs=1, resolver=None):
+    """
+    リソースのリストからbuild_rowで作成した行を順に返すジェネレーター
     
-    if len(package_resources) == 0:
-        print("警告: ゲームパッケージが見つかりませんでした")
-        return None
+    jobsに2以上を指定した場合はリストをチャンクに分割し、forkしたワーカープロセスで
+    並列に処理する。結果はチャンクの順に返すため、行の順序はプロセス数によらない。
+    resolverを渡した場合は、そのキャッシュとインデックスをほかのテーブルの抽出と共有する
+    （ワーカーはfork時点のキャッシュを引き継ぎ、ヒット数・ミス数・Graphの参照回数だけを親プロセスに返す）。
+    """
+    global _shared_resolver
     
-    # データを格納するリスト
-    package_data = []
+    if resolver is None:
+        resolver = GraphResolver(merged_graph, new_record_cache(merged_graph))
+    record_cache = resolver.record_cache
     
-    for i, resource in enumerate(package_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(package_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'resource_uri': str(resource)}
-        
-        # 基本プロパティ
-        properties = {
-            'schema_name': (schema.name, None),
-            'schema_volumeNumber': (schema.volumeNumber, None),
-            'schema_issueNumber': (schema.issueNumber, None),
-            'schema_copyrightYear': (schema.copyrightYear, None),
-            'dcndl_edition': (dcndl.edition, None),
-            'dcndl_publicationPeriodicity': (dcndl.publicationPeriodicity, None),
-            'dcndl_volume': (dcndl.volume, None),
-            'dcterms_accessRights': (DCTERMS.accessRights, None),
-            'dcterms_description': (DCTERMS.description, None),
-            'dcterms_hasPart': (DCTERMS.hasPart, None),
-            'dcterms_identifier': (DCTERMS.identifier, None),
-            'dcterms_isPartOf': (DCTERMS.isPartOf, None),
-            'dcterms_issued': (DCTERMS.issued, None),
-            'dcterms_rights': (DCTERMS.rights, None),
-            'dcterms_tableOfContents': (DCTERMS.tableOfContents, None),
-            'dcterms_medium': (DCTERMS.medium, None),
-            'rcgs_abbreviatedTitle': (rcgs.abbreviatedTitle, None),
-            'rcgs_digitalFileType': (rcgs.digitalFileType, None),
-            'rcgs_distributor': (rcgs.distributor, None),
-            'rcgs_jpNumber': (rcgs.jpNumber, None),
-            'rcgs_manufacturer': (rcgs.manufacturer, None),
-            'rcgs_middlewareOrGameEngine': (rcgs.middlewareOrGameEngine, None),
-            'rcgs_modelNumber': (rcgs.modelNumber, None),
-            'rcgs_modeOfIssuance': (rcgs.modeOfIssuance, None),
-            'rcgs_ndlBibID': (rcgs.ndlBibID, None),
-            'rcgs_oclcNumber': (rcgs.oclcNumber, None),
-            'rcgs_parallelTitle': (rcgs.parallelTitle, None),
-            'rcgs_producer': (rcgs.producer, None),
-            'rcgs_publisher': (rcgs.publisher, None),
-            'rcgs_ratingContentDescriptor': (rcgs.ratingContentDescriptor, None),
-            'rcgs_representativeImage': (rcgs.representativeImage, None),
-            'rcgs_responsibilityStatement': (rcgs.responsibilityStatement, None),
-            'rcgs_seriesStatement': (rcgs.seriesStatement, None),
-            'rcgs_subseriesStatement': (rcgs.subseriesStatement, None),
-            'rcgs_variantTitle': (rcgs.variantTitle, None),
-            'rcgs_dimension': (rcgs.dimension, None),
-            'schema_brand': (schema.brand, None),
-            'schema_contactPoints': (schema.contactPoints, None),
-            'schema_contentRating': (schema.contentRating, None),
-            'schema_gamePlatform': (schema.gamePlatform, None),
-            'schema_gtin13': (schema.gtin13, None),
-            'schema_isbn': (schema.isbn, None),
-            'schema_issn': (schema.issn, None),
-            'schema_numberOfPlayers': (schema.numberOfPlayers, None),
-            'schema_price': (schema.price, None),
-            'schema_requirement': (schema.requirement, None),
-            'schema_serialNumber': (schema.serialNumber, None),
-            'schema_thumbnailUrl': (schema.thumbnailUrl, None),
-            'schema_url': (schema.url, None),
-            'schema_videoFrameSize': (schema.videoFrameSize, None),
-            'rdf_type': (RDF.type, None)
-        }
-        
-        # 各プロパティの値を抽出
-        for field_name, (property_uri, lang_filter) in properties.items():
-            values = []
-            for obj in merged_graph.objects(resource, property_uri):
-                if lang_filter:
-                    # 言語フィルターがある場合
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
-        
-        # 特殊なプロパティ（複雑な構造）
-        # dcndl:titleTranscription (言語別)
-        ja_hrkt_values = []
-        ja_latn_values = []
-        for obj in merged_graph.objects(resource, dcndl.titleTranscription):
-            if hasattr(obj, 'language'):
-                if obj.language == 'ja-Hrkt':
-                    ja_hrkt_values.append(str(obj))
-                elif obj.language == 'ja-Latn':
-                    ja_latn_values.append(str(obj))
-        row['dcndl_titleTranscription_jaHrkt'] = "|".join(ja_hrkt_values)
-        row['dcndl_titleTranscription_jaLatn'] = "|".join(ja_latn_values)
-        
-        # dcterms:format (複雑な構造)
-        format_labels = []
-        format_carrier_types = []
-        format_extents = []
-        format_encoding_formats = []
-        format_dimensions = []
-        format_file_sizes = []
-        format_descriptions = []
-        format_notes = []
-        
-        for format_node in merged_graph.objects(resource, DCTERMS.format):
-            for label in merged_graph.objects(format_node, RDFS.label):
-                format_labels.append(str(label))
-            for carrier_type in merged_graph.objects(format_node, rcgs.carrierType):
-                format_carrier_types.append(str(carrier_type))
-            for extent in merged_graph.objects(format_node, DCTERMS.extent):
-                format_extents.append(str(extent))
-            for encoding_format in merged_graph.objects(format_node, schema.encodingFormat):
-                format_encoding_formats.append(str(encoding_format))
-            for dimension in merged_graph.objects(format_node, rcgs.dimension):
-                format_dimensions.append(str(dimension))
-            for file_size in merged_graph.objects(format_node, schema.fileSize):
-                format_file_sizes.append(str(file_size))
-            for description in merged_graph.objects(format_node, DCTERMS.description):
-                format_descriptions.append(str(description))
-            for note in merged_graph.objects(format_node, skos.note):
-                format_notes.append(str(note))
+    if jobs > 1 and len(resources) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        chunk_size = max(100, len(resources) // (jobs * 4) + 1)
+        chunks = [resources[i:i + chunk_size] for i in range(0, len(resources), chunk_size)]
+        done = 0
         
-        row['format_rdfs_label'] = "|".join(format_labels)
-        row['format_rcgs_carrierType'] = "|".join(format_carrier_types)
-        row['format_dcterms_extent'] = "|".join(format_extents)
-        row['format_schema_encodingFormat'] = "|".join(format_encoding_formats)
-        row['format_rcgs_dimension'] = "|".join(format_dimensions)
-        row['format_schema_fileSize'] = "|".join(format_file_sizes)
-        row['format_dcterms_description'] = "|".join(format_descriptions)
-        row['format_skos_note'] = "|".join(format_notes)
-        
-        # rcgs:formatOfSubunit (複雑な構造)
-        subunit_labels = []
-        subunit_carrier_types = []
-        subunit_extents = []
-        subunit_encoding_formats = []
-        subunit_dimensions = []
-        subunit_file_sizes = []
-        subunit_descriptions = []
-        subunit_notes = []
-        
-        for subunit_node in merged_graph.objects(resource, rcgs.formatOfSubunit):
-            for label in merged_graph.objects(subunit_node, RDFS.label):
-                subunit_labels.append(str(label))
-            for carrier_type in merged_graph.objects(subunit_node, rcgs.carrierType):
-                subunit_carrier_types.append(str(carrier_type))
-            for extent in merged_graph.objects(subunit_node, DCTERMS.extent):
-                subunit_extents.append(str(extent))
-            for encoding_format in merged_graph.objects(subunit_node, schema.encodingFormat):
-                subunit_encoding_formats.append(str(encoding_format))
-            for dimension in merged_graph.objects(subunit_node, rcgs.dimension):
-                subunit_dimensions.append(str(dimension))
-            for file_size in merged_graph.objects(subunit_node, schema.fileSize):
-                subunit_file_sizes.append(str(file_size))
-            for description in merged_graph.objects(subunit_node, DCTERMS.description):
-                subunit_descriptions.append(str(description))
-            for note in merged_graph.objects(subunit_node, skos.note):
-                subunit_notes.append(str(note))
+        # forkの前にGraph・キャッシュ・インデックスを設定し、ワーカーに複製せず共有させる
+        _shared_resolver = resolver
+        try:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(chunks)),
+                                     mp_context=multiprocessing.get_context('fork')) as executor:
+                for chunk_rows, hits, misses, probes in executor.map(partial(_build_rows_chunk, build_row), chunks):
+                    record_cache.hits += hits
+                    record_cache.misses += misses
+                    resolver.graph_probes += probes
+                    yield from chunk_rows
+                    done += len(chunk_rows)
+                    print(f"処理中: {done}/{len(resources)}")
+        finally:
+            _shared_resolver = None
+        return
+    
+    for i, resource in enumerate(resources):
+        if i % 100 == 0:
+            print(f"処理中: {i+1}/{len(resources)}")
         
-        row['subunit_rdfs_label'] = "|".join(subunit_labels)
-        row['subunit_rcgs_carrierType'] = "|".join(subunit_carrier_types)
-        row['subunit_dcterms_extent'] = "|".join(subunit_extents)
-        row['subunit_schema_encodingFormat'] = "|".join(subunit_encoding_formats)
-        row['subunit_rcgs_dimension'] = "|".join(subunit_dimensions)
-        row['subunit_schema_fileSize'] = "|".join(subunit_file_sizes)
-        row['subunit_dcterms_description'] = "|".join(subunit_descriptions)
-        row['subunit_skos_note'] = "|".join(subunit_notes)
+        # リソースのトリプルを1回だけ走査（行の対象のレコードはキャッシュしない）
+        record = resolver.load_record(resource)
+        yield build_row(resource, record, resolver)
+
+def iter_assembled_rows(store, plan, resources, jobs=1, resolver=None, value_lists=False):
+    """
+    InternedTripleStoreのリソースのリストから行を順に返すジェネレーター
+    
+    先頭の述語だけで値が決まる列（schema:gamePlatformなど）は、InternedTripleStore.object_valuesで
+    すべてのリソースの値をまとめて取り出し（言語タグ別の列は述語ごとに1回）、列ごとに1回の走査で"|"で連結しておく。
+    ブランクノードやリンク先をたどる列は、先頭の述語（dcterms:formatなど）の参照先だけをobject_termsで
+    まとめて取り出し、その先をresolverでたどる（リソースごとにすべてのトリプルを走査しない）。
+    同じ述語の範囲の取り出しは両方で共有する。jobsは使わない。
+    value_listsがTrueなら値を連結せずにリストのまま返す。
+    """
+    subject_ids = store.term_id_array(resources)
+    if resolver is None:
+        resolver = GraphResolver(store, new_record_cache(store))
+    
+    # ネストした経路の先頭の述語は、値の文字列の列と参照先の用語の両方に使う
+    nested_predicates = list(dict.fromkeys(predicate for predicate, first in plan.nested_steps))
+    triples = {predicate: store.predicate_triples(predicate) for predicate in nested_predicates}
+    
+    # 同じ述語を言語タグだけ変えて取り出す列は、述語の範囲の取り出しを1回にまとめる
+    groups = {}
+    for field_name, predicate, lang, class_uri, first_only in plan.one_hop_columns:
+        groups.setdefault((predicate, class_uri, first_only), []).append((field_name, lang))
+    columns = {}
+    for (predicate, class_uri, first_only), fields in groups.items():
+        by_language = store.object_values(subject_ids, predicate, [lang for _, lang in fields], class_uri, first_only,
+                                          triples.get(predicate))
+        for field_name, lang in fields:
+            starts, ends, values = by_language[lang]
+            if value_lists:
+                columns[field_name] = [values[start:end] for start, end in zip(starts, ends)]
+            else:
+                columns[field_name] = ['|'.join(values[start:end]) for start, end in zip(starts, ends)]
+    
+    # リソースごとのレコードはネストした経路の先頭の述語の値だけを持つ
+    nested_objects = {predicate: store.object_terms(subject_ids, predicate, triples.pop(predicate))
+                      for predicate in nested_predicates}
+    resolver.graph_probes += len(nested_objects)
+    
+    for index, resource in enumerate(resources):
+        nested = None
+        if nested_objects:
+            if index % 100 == 0:
+                print(f"処理中: {index+1}/{len(resources)}")
+            record = {predicate: objects[index] for predicate, objects in nested_objects.items() if objects[index]}
+            nested = plan.build_nested_values(resource, record, resolver)
+        row = {plan.key: str(resource)}
+        for field_name in plan.value_columns:
+            if field_name in columns:
+                row[field_name] = columns[field_name][index]
+            elif value_lists:
+                row[field_name] = nested[field_name]
+            else:
+                row[field_name] = "|".join(nested[field_name])
+        yield row
+
+# 列定義ファイル（テーブルごとの列とプロパティパス）
+COLUMN_SPEC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'column_spec.json')
+
+def expand_curie(curie, prefixes):
+    """
+    "rcgs:exemplarOf" のような接頭辞付きの名前をURIRefに展開する
+    """
+    prefix, _, local_name = curie.partition(':')
+    if prefix not in prefixes:
+        raise ValueError(f"列定義に未定義の接頭辞があります: {curie}")
+    return URIRef(prefixes[prefix] + local_name)
+
+def parse_property_path(path, prefixes):
+    """
+    "dcterms:format/rcgs:adminMetadata/dcterms:source" のようなプロパティパスを
+    (プロパティURI, 最初の値だけを使うか) のタプルのリストに変換する（"[0]"で最初の値だけを使う）
+    """
+    steps = []
+    for step in path.split('/'):
+        first = step.endswith('[0]')
+        if first:
+            step = step[:-len('[0]')]
+        steps.append((expand_curie(step, prefixes), first))
+    return steps
+
+class TablePlan:
+    """
+    列定義から作成した1テーブル分の抽出計画
+    
+    各列のプロパティパスを先頭から共有する木にまとめておき、行の作成時には
+    リソースごとに木を1回だけたどる。同じ経路を通る列（dcterms:format以下の列など）は
+    述語の値の取り出しと参照先ノードのレコード作成を共有する。
+    """
+    def __init__(self, name, table_spec, prefixes, languages=None):
+        self.name = name
+        self.table_spec = table_spec
+        self.prefixes = prefixes
+        self.label = table_spec['label']
+        self.file_name = table_spec['file']
+        self.class_uri = expand_curie(table_spec['class'], prefixes)
+        self.required_property = expand_curie(table_spec['require'], prefixes) if 'require' in table_spec else None
+        self.key = table_spec.get('key', 'resource_uri')
+        self.filter_classes = []
+        # 経路でたどるリンク先のクラス（--onlyで読み込むファイルを選ぶために使う）
+        self.depends = [expand_curie(class_curie, prefixes) for class_curie in table_spec.get('depends', [])]
+        # 列名 → (プロパティパス, 言語タグ)（Arrow形式の出力で言語別の列をまとめるために使う）
+        self.column_paths = {}
+        # 言語タグごとに展開した列 → 展開元の列名
+        self.fan_out_names = {}
+        # "languages": "*" の列の終端の述語（データにある言語タグをlanguagesで渡して展開する）
+        self.language_predicates = []
         
-        # rcgs:provisionActivity (複雑な構造)
-        pa_types = []
-        pa_publisher_statements = []
-        pa_dates = []
-        pa_spatials = []
-        pa_sources = []
-        pa_notes = []
+        # "languages"を指定した列を言語タグごとの列に展開する
+        column_specs = {}
+        for field_name, column_spec in table_spec['columns'].items():
+            if isinstance(column_spec, str):
+                column_spec = {'path': column_spec}
+            if 'languages' not in column_spec:
+                column_specs[field_name] = column_spec
+                continue
+            tags = column_spec['languages']
+            if tags == '*':
+                predicate = parse_property_path(column_spec['path'], prefixes)[-1][0]
+                if predicate not in self.language_predicates:
+                    self.language_predicates.append(predicate)
+                tags = (languages or {}).get(predicate, [])
+            for tag in tags:
+                column_name = language_column_name(field_name, tag)
+                column_specs[column_name] = {**column_spec, 'lang': tag}
+                self.fan_out_names[column_name] = field_name
+        self.value_columns = list(column_specs)
+        self.columns = [self.key, *self.value_columns]
         
-        for pa_node in merged_graph.objects(resource, rcgs.provisionActivity):
-            for pa_type in merged_graph.objects(pa_node, RDF.type):
-                pa_types.append(str(pa_type))
-            for publisher_statement in merged_graph.objects(pa_node, rcgs.publisherStatement):
-                pa_publisher_statements.append(str(publisher_statement))
-            for date in merged_graph.objects(pa_node, DCTERMS.date):
-                pa_dates.append(str(date))
-            for spatial in merged_graph.objects(pa_node, DCTERMS.spatial):
-                pa_spatials.append(str(spatial))
-            for source in merged_graph.objects(pa_node, DCTERMS.source):
-                pa_sources.append(str(source))
-            for note in merged_graph.objects(pa_node, skos.note):
-                pa_notes.append(str(note))
+        # 経路の木: {(プロパティURI, 最初の値だけを使うか): [終端の列のリスト, 子の木]}
+        self.steps = {}
+        for field_name, column_spec in column_specs.items():
+            path = parse_property_path(column_spec['path'], prefixes)
+            self.column_paths[field_name] = (column_spec['path'], column_spec.get('lang'))
+            class_uri = expand_curie(column_spec['type'], prefixes) if 'type' in column_spec else None
+            if class_uri is not None and class_uri not in self.filter_classes:
+                self.filter_classes.append(class_uri)
+            
+            steps = self.steps
+            for predicate, first in path[:-1]:
+                steps = steps.setdefault((predicate, first), [[], {}])[1]
+            # 終端の"[0]"は言語・型の条件に合う最初の値だけを使う
+            predicate, first = path[-1]
+            terminals = steps.setdefault((predicate, False), [[], {}])[0]
+            terminals.append((field_name, column_spec.get('lang'), class_uri, first))
         
-        row['PA_rdf_type'] = "|".join(pa_types)
-        row['PA_rcgs_publisherStatement'] = "|".join(pa_publisher_statements)
-        row['PA_dcterms_date'] = "|".join(pa_dates)
-        row['PA_dcterms_spatial'] = "|".join(pa_spatials)
-        row['PA_dcterms_source'] = "|".join(pa_sources)
-        row['PA_skos_note'] = "|".join(pa_notes)
+        # 先頭の述語だけで値が決まる列と、ブランクノードやリンク先をたどる残りの経路の木
+        # （InternedTripleStoreからは前者を列ごとに一括で組み立てる）
+        self.one_hop_columns = []
+        self.nested_steps = {}
+        for (predicate, first), (terminals, children) in self.steps.items():
+            for field_name, lang, class_uri, first_only in terminals:
+                self.one_hop_columns.append((field_name, predicate, lang, class_uri, first_only))
+            if children:
+                self.nested_steps[(predicate, first)] = [[], children]
         
-        package_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(package_data)
-    
-    print(f"抽出完了: {len(df)} 件のゲームパッケージデータ")
-    print(f"列数: {len(df.columns)}")
-    
-    return df
+        # 抽出に使う述語とクラス（読み込むファイルとトリプルの選択に使う）
+        # rdf:typeの値を出力する列があれば、すべてのクラスのrdf:typeが必要になる
+        predicates = {RDF.type: None}
+        if self.required_property is not None:
+            predicates[self.required_property] = None
+        self.outputs_types = False
+        pending = [self.steps]
+        while pending:
+            for (predicate, first), (terminals, children) in pending.pop().items():
+                predicates[predicate] = None
+                if predicate == RDF.type and terminals:
+                    self.outputs_types = True
+                pending.append(children)
+        self.predicates = list(predicates)
+        self.classes = list(dict.fromkeys([self.class_uri, *self.filter_classes, *self.depends]))
+    
+    def with_languages(self, languages):
+        """
+        "languages": "*" の列をlanguages（述語 → 言語タグのリスト）で展開した抽出計画を返す
+        """
+        if not self.language_predicates:
+            return self
+        return TablePlan(self.name, self.table_spec, self.prefixes, languages)
+    
+    def _walk(self, record, steps, values, resolver):
+        for (predicate, first), (terminals, children) in steps.items():
+            objects = record.get(predicate, ())
+            by_language = None
+            for field_name, lang, class_uri, first_only in terminals:
+                # 言語タグ別の列は値を1回だけ言語タグごとに分けて使い回す
+                candidates = objects
+                if lang is not None:
+                    if by_language is None:
+                        by_language = partition_by_language(objects)
+                    candidates = by_language.get(lang, ())
+                for obj in candidates:
+                    if class_uri is not None and not resolver.has_type(obj, class_uri):
+                        continue
+                    values[field_name].append(str(obj))
+                    if first_only:
+                        break
+            if children:
+                for node in (objects[:1] if first else objects):
+                    self._walk(resolver.record(node), children, values, resolver)
+    
+    def _collect_values(self, record, resolver):
+        values = {field_name: [] for field_name in self.value_columns}
+        self._walk(record, self.steps, values, resolver)
+        return values
+    
+    def build_nested_values(self, resource, record, resolver):
+        """
+        残りの経路の木（nested_steps）の列の値だけをレコードから作成する
+        """
+        values = {field_name: [] for field_name in self.value_columns}
+        self._walk(record, self.nested_steps, values, resolver)
+        return values
+    
+    def build_value_row(self, resource, record, resolver):
+        """
+        1件分の行をレコードから作成する（各列の値は文字列のリストのまま返す）
+        """
+        row = {self.key: str(resource)}
+        row.update(self._collect_values(record, resolver))
+        return row
+    
+    def build_row(self, resource, record, resolver):
+        """
+        1件分の行をレコードから作成する（複数の値は"|"で連結する）
+        """
+        values = self._collect_values(record, resolver)
+        row = {self.key: str(resource)}
+        for field_name in self.value_columns:
+            row[field_name] = "|".join(values[field_name])
+        return row
+
+def language_column_name(field_name, tag):
+    """
+    言語タグごとに展開した列の名前（"prefLabel"と"ja-Hrkt"から"prefLabel_jaHrkt"）
+    """
+    return f"{field_name}_{tag.replace('-', '')}"
+
+def partition_by_language(objects):
+    """
+    値のリストを言語タグ → 値のリストの辞書に分ける（言語タグのない値は含めない）
+    """
+    by_language = {}
+    for obj in objects:
+        lang = getattr(obj, 'language', None)
+        if lang is not None:
+            by_language.setdefault(lang, []).append(obj)
+    return by_language
+
+def collect_languages(merged_graph, predicates):
+    """
+    述語ごとに、値のリテラルに付いている言語タグを集めて並べたリストを返す（"languages": "*" の列用）
+    """
+    languages = {}
+    for predicate in predicates:
+        if isinstance(merged_graph, InternedTripleStore):
+            languages[predicate] = merged_graph.predicate_languages(predicate)
+            continue
+        tags = set()
+        for _, obj in merged_graph.subject_objects(predicate):
+            lang = getattr(obj, 'language', None)
+            if lang is not None:
+                tags.add(lang)
+        languages[predicate] = sorted(tags)
+    return languages
+
+def load_table_plans(spec_file=COLUMN_SPEC_FILE):
+    """
+    列定義ファイル（JSON）を読み込み、テーブル名 → TablePlan の辞書を返す（出力順）
+    """
+    with open(spec_file, encoding='utf-8') as f:
+        spec = json.load(f)
+    prefixes = spec['prefixes']
+    return {name: TablePlan(name, table_spec, prefixes) for name, table_spec in spec['tables'].items()}
+
+def select_table_plans(table_plans, only):
+    """
+    --onlyで指定したテーブル（カンマ区切りのテーブル名）の抽出計画だけを返す（順序は列定義の順）
+    """
+    names = [name.strip() for name in only.split(',') if name.strip()]
+    unknown = [name for name in names if name not in table_plans]
+    if unknown:
+        raise ValueError(f"列定義にないテーブルです: {', '.join(unknown)}（{', '.join(table_plans)} から指定）")
+    return {name: plan for name, plan in table_plans.items() if name in names}
 
-def extract_item_data(merged_graph):
+def compact_uri(uri, prefixes):
+    """
+    URIを列定義の接頭辞で "rcgs:Package" のような名前に縮める（該当する接頭辞がなければそのまま）
     """
-    個別資料（Item）のデータを抽出してCSVに変換する
+    for prefix, namespace in prefixes.items():
+        if uri.startswith(namespace):
+            return f"{prefix}:{uri[len(namespace):]}"
+    return str(uri)
+
+def table_dependencies(table_plans, source_classes):
     """
-    print("\n=== 個別資料データの抽出開始 ===")
+    テーブル名 → 抽出に必要なソースファイルのリスト（依存関係）を返す
     
-    # 名前空間の定義
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    schema = Namespace("http://schema.org/")
-    dcndl = Namespace("http://ndl.go.jp/dcndl/terms/")
+    テーブルのクラス、列の型の条件（"type"）、経路でたどるリンク先のクラス（"depends"）の
+    いずれかのリソースを記述したファイルと、型のない記述を含むファイルが必要になる。
+    """
+    dependencies = {}
+    for name, plan in table_plans.items():
+        dependencies[name] = [file_path for file_path, (classes, untyped) in source_classes.items()
+                              if untyped or not classes.isdisjoint(plan.classes)]
+    return dependencies
+
+def select_source_files(table_plans, source_dir='./source', cache_dir=None):
+    """
+    table_plansの抽出に必要なソースファイルだけを (ファイルパス, フォーマット) のリストで返す（依存関係を表示する）
+    """
+    rdf_files = list_rdf_files(source_dir)
+    dependencies = table_dependencies(table_plans, load_source_classes(rdf_files, cache_dir))
+    
+    print("\n=== テーブルの依存関係 ===")
+    for name, plan in table_plans.items():
+        print(f"{name}: {', '.join(compact_uri(class_uri, plan.prefixes) for class_uri in plan.classes)}")
+        for file_path in dependencies[name]:
+            print(f"  {file_path}")
+    
+    needed = {file_path for file_paths in dependencies.values() for file_path in file_paths}
+    selected = [(file_path, format_type) for file_path, format_type in rdf_files if file_path in needed]
+    print(f"読み込むファイル: {len(selected)} / {len(rdf_files)}")
+    return selected
+
+def plan_triple_filter(table_plans):
+    """
+    table_plansの抽出とデータ統計の表示に使うトリプルの許可リスト（TripleFilter）を列定義から作成する
     
-    # rcgs:Itemタイプのリソースを取得
-    item_resources = list(merged_graph.subjects(RDF.type, rcgs.Item))
-    print(f"個別資料数: {len(item_resources)}")
+    列のパスに現れる述語、rdf:type、requireのプロパティを残す。rdf:typeは、テーブルのクラス・型の条件・
+    "depends"のクラスとデータ統計のクラスのものだけを残す（rdf:typeの値を出力する列があればすべて残す）。
+    """
+    predicates = {predicate for plan in table_plans.values() for predicate in plan.predicates}
+    classes = None
+    if not any(plan.outputs_types for plan in table_plans.values()):
+        classes = {class_uri for plan in table_plans.values() for class_uri in plan.classes}
+        classes.update(class_uri for label, class_uri in STATISTICS_CLASSES)
+    return TripleFilter(predicates, classes)
+
+def extract_table_data(merged_graph, plan, jobs=1, resolver=None, value_lists=False, skip=0):
+    """
+    抽出計画に従ってテーブルのデータを抽出し、行を順に返すジェネレーターを返す（対象がなければNone）
     
-    if len(item_resources) == 0:
-        print("警告: 個別資料が見つかりませんでした")
+    resolverを渡すと、参照先ノードのキャッシュと結合用のインデックスをほかのテーブルの抽出と共有する。
+    value_listsがTrueなら各列の値を"|"で連結せずにリストのまま返す（Parquet・Arrow形式の出力用）。
+    skipを指定した場合は先頭のskip件のリソースの行を作らない（--resumeで出力済みのチャンクの分）。
+    """
+    print(f"\n=== {plan.label}データの抽出開始 ===")
+    
+    if resolver is None:
+        resolver = GraphResolver(merged_graph, new_record_cache(merged_graph),
+                                 JoinIndex(merged_graph, {plan.name: plan}))
+    join_index = resolver.join_index
+    
+    # 対象クラスのリソースを取得（requireがあればそのプロパティを持つものだけ）
+    resources = join_index.class_members.get(plan.class_uri, [])
+    if plan.required_property is not None:
+        targets = join_index.targets[plan.required_property]
+        resources = [resource for resource in resources if resource in targets]
+    print(f"{plan.label}数: {len(resources)}")
+    
+    if len(resources) == 0:
+        print(f"警告: {plan.label}が見つかりませんでした")
         return None
     
-    # データを格納するリスト
-    item_data = []
+    # リソースの並びは同じGraphなら毎回同じなので、出力済みの分は先頭から飛ばせる
+    if skip > 0:
+        print(f"再開: 先頭の {skip} 件は出力済み")
+        resources = resources[skip:]
+        if len(resources) == 0:
+            return None
+    
+    # 各リソースの行を順に作成（jobsが2以上ならチャンクに分割して並列処理）
+    if isinstance(merged_graph, InternedTripleStore):
+        return iter_assembled_rows(merged_graph, plan, resources, jobs, resolver, value_lists)
+    build_row = plan.build_value_row if value_lists else plan.build_row
+    return iter_rows(merged_graph, resources, build_row, jobs, resolver)
+
+def row_hash(row, columns):
+    """
+    行の内容のハッシュ値を返す（差分変換で前回のスナップショットと比較するために使う）
     
-    for i, resource in enumerate(item_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(item_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'resource_uri': str(resource)}
-        
-        # rcgs:exemplarOfを確認（Packageへの参照）
-        exemplar_of = list(merged_graph.objects(resource, rcgs.exemplarOf))
-        if exemplar_of:
-            # exemplarOfがPackageタイプかチェック
-            for exemplar in exemplar_of:
-                if (exemplar, RDF.type, rcgs.Package) in merged_graph:
-                    row['exemplarOf'] = str(exemplar)
-                    break
-            else:
-                row['exemplarOf'] = ""
-        else:
-            row['exemplarOf'] = ""
+    "|"で連結した複数の値はGraphの走査順によって並びが変わるため、並べ替えてからハッシュ値を計算する。
+    値がリストの行（Parquet・Arrow形式の出力）も"|"で連結した場合と同じハッシュ値になる。
+    """
+    values = []
+    for column in columns:
+        value = row.get(column)
+        if value is None:
+            values.append('')
+            continue
+        if isinstance(value, list):
+            value = '|'.join(value)
+        values.append('|'.join(sorted(str(value).split('|'))))
+    return hashlib.blake2b('\x1f'.join(values).encode('utf-8'), digest_size=16).hexdigest()
+
+# 出力形式 → 出力ファイルの拡張子
+OUTPUT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+class TableWriter:
+    """
+    行を1件ずつファイルに書き込む（列は固定、ファイルは最初の行で作成する）
+    
+    書き込んだ行のハッシュ値をキー列（先頭の列）ごとに記録する。
+    previous_snapshotに前回の変換のハッシュ値を渡した場合は、追加・変更された行だけを書き込み、
+    削除された行のキーを <テーブル名>_deleted.csv に書き込む。
+    実際のファイルへの書き込みはサブクラスの_open・_write_row・_finishで行う。
+    ファイルへの書き込みにかかった時間は、閉じるときにsave_to_<形式>（save_to_csvなど）の段階として計測結果に加える。
+    """
+    format_label = None
+    
+    def __init__(self, filename, columns, output_dir='./output', previous_snapshot=None):
+        self.filename = filename
+        self.output_file = os.path.join(output_dir, filename)
+        self.output_dir = output_dir
+        self.columns = columns
+        self.row_count = 0
+        self.row_hashes = {}
+        self.previous_hashes = None if previous_snapshot is None else previous_snapshot.get(filename, {})
+        self.change_counts = {'added': 0, 'changed': 0, 'deleted': 0, 'unchanged': 0}
+        self.write_seconds = 0.0
+        self._opened = False
+    
+    def _ensure_output_dir(self):
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+            print(f"出力ディレクトリを作成: {self.output_dir}")
+    
+    def write(self, row):
+        key = row[self.columns[0]]
+        digest = row_hash(row, self.columns)
+        self.row_hashes[key] = digest
         
-        # 基本プロパティ
-        properties = {
-            'identifier': (DCTERMS.identifier, None),
-            'spatial': (DCTERMS.spatial, None),
-            'owns': (schema.owns, None),
-            'holdingAgent': (dcndl.holdlingAgent, None)
-        }
+        # 差分変換では前回と同じ行を書き込まない
+        if self.previous_hashes is not None:
+            previous = self.previous_hashes.get(key)
+            if previous == digest:
+                self.change_counts['unchanged'] += 1
+                return
+            self.change_counts['added' if previous is None else 'changed'] += 1
         
-        # 各プロパティの値を抽出
-        for field_name, (property_uri, lang_filter) in properties.items():
-            values = []
-            for obj in merged_graph.objects(resource, property_uri):
-                if lang_filter:
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
+        start = time.perf_counter()
+        if not self._opened:
+            self._ensure_output_dir()
+            self._open()
+            self._opened = True
+        self._write_row(row)
+        self.row_count += 1
+        self.write_seconds += time.perf_counter() - start
+    
+    def deleted_file_name(self):
+        return os.path.splitext(self.filename)[0] + '_deleted.csv'
+    
+    def checkpoint_state(self):
+        """
+        出力し終わったテーブルの状態（行数、行のハッシュ値、差分の件数）をチェックポイント用に返す
+        """
+        return {'row_count': self.row_count, 'row_hashes': self.row_hashes, 'change_counts': self.change_counts}
+    
+    def restore(self, state):
+        """
+        checkpoint_stateで保存した状態を戻す（--resumeで出力済みのテーブルを書き直さない場合）
+        """
+        self.row_count = state['row_count']
+        self.row_hashes = state['row_hashes']
+        self.change_counts = state['change_counts']
+    
+    def write_deleted(self):
+        """
+        前回のスナップショットにあって今回なくなった行のキーを書き込む
+        """
+        deleted = [key for key in self.previous_hashes if key not in self.row_hashes]
+        self.change_counts['deleted'] = len(deleted)
+        if len(deleted) == 0:
+            return
+        self._ensure_output_dir()
+        deleted_file = os.path.join(self.output_dir, self.deleted_file_name())
+        with open(deleted_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow([self.columns[0]])
+            writer.writerows([key] for key in deleted)
+        print(f"削除された行を保存: {deleted_file} ({len(deleted)} 件)")
+    
+    def close(self):
+        """
+        ファイルを閉じて基本統計情報を表示する（1行も書き込まれていなければFalseを返す）
+        """
+        start = time.perf_counter()
+        if self.previous_hashes is not None:
+            self.write_deleted()
+            counts = self.change_counts
+            print(f"差分: {self.filename} 追加 {counts['added']} / 変更 {counts['changed']} / "
+                  f"削除 {counts['deleted']} / 変更なし {counts['unchanged']}")
+        opened = self._opened
+        if opened:
+            self._finish()
+            self._opened = False
+        self.write_seconds += time.perf_counter() - start
+        metrics.add(f'save_to_{self.format_label.lower()}', self.write_seconds, written_rows=self.row_count)
+        self.write_seconds = 0.0
+        if not opened:
+            return False
+        print(f"{self.format_label}ファイルを保存: {self.output_file}")
         
-        item_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(item_data)
-    
-    print(f"抽出完了: {len(df)} 件の個別資料データ")
-    print(f"列数: {len(df.columns)}")
-    
-    return df
+        # 基本統計情報を表示
+        print(f"  行数: {self.row_count}")
+        print(f"  列数: {len(self.columns)}")
+        print(f"  ファイルサイズ: {os.path.getsize(self.output_file) / 1024:.1f} KB")
+        return True
 
-def extract_person_data(merged_graph):
+class CsvTableWriter(TableWriter):
     """
-    個人（Person）のデータを抽出してCSVに変換する
+    行を1件ずつCSVファイルに書き込む（複数の値は"|"で連結済みの行を受け取る）
     """
-    print("\n=== 個人データの抽出開始 ===")
+    format_label = 'CSV'
     
-    # 名前空間の定義
-    foaf = Namespace("http://xmlns.com/foaf/0.1/")
-    skos = Namespace("http://www.w3.org/2004/02/skos/core#")
-    schema = Namespace("http://schema.org/")
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
+    def __init__(self, filename, columns, output_dir='./output', previous_snapshot=None):
+        super().__init__(filename, columns, output_dir, previous_snapshot)
+        self._file = None
+        self._writer = None
     
-    # foaf:Personタイプのリソースを取得
-    person_resources = list(merged_graph.subjects(RDF.type, foaf.Person))
-    print(f"個人数: {len(person_resources)}")
+    def _open(self):
+        self._file = open(self.output_file, 'w', encoding='utf-8', newline='', buffering=1 << 20)
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, lineterminator='\n')
+        self._writer.writeheader()
     
-    if len(person_resources) == 0:
-        print("警告: 個人が見つかりませんでした")
-        return None
+    def _write_row(self, row):
+        self._writer.writerow(row)
     
-    # データを格納するリスト
-    person_data = []
+    def _finish(self):
+        self._file.close()
+        self._file = None
+        self._writer = None
+
+class ChunkedCsvTableWriter(CsvTableWriter):
+    """
+    行をチェックポイントのチャンクファイルに書き込み、閉じるときに1つのCSVファイルにまとめる（--checkpoint用）
     
-    for i, resource in enumerate(person_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(person_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'resource_uri': str(resource)}
-        
-        # 基本プロパティ（言語別）
-        ja_pref_labels = []
-        en_pref_labels = []
-        for obj in merged_graph.objects(resource, skos.prefLabel):
-            if hasattr(obj, 'language'):
-                if obj.language == 'ja':
-                    ja_pref_labels.append(str(obj))
-                elif obj.language == 'en':
-                    en_pref_labels.append(str(obj))
-        row['prefLabel_ja'] = "|".join(ja_pref_labels)
-        row['prefLabel_en'] = "|".join(en_pref_labels)
-        
-        # その他のプロパティ
-        properties = {
-            'altLabel': (skos.altLabel, None),
-            'homepage': (foaf.homepage, None),
-            'description': (DCTERMS.description, None),
-            'identifier': (DCTERMS.identifier, None),
-            'ndlAuthoritiesID': (rcgs.ndlAuthoritiesID, None),
-            'viafID': (rcgs.viafID, None),
-            'wikidataID': (rcgs.wikidataID, None),
-            'twitterID': (rcgs.twitterID, None),
-            'seeAlso': (RDFS.seeAlso, None),
-            'language': (DCTERMS.language, None),
-            'disambiguatingDescription': (schema.disambiguatingDescription, None),
-            'note': (skos.note, None),
-            'hasOccupation': (schema.hasOccupation, None),
-            'birthDate': (schema.birthDate, None),
-            'deathDate': (schema.deathDate, None),
-            'birthPlace': (schema.birthPlace, None),
-            'deathPlace': (schema.deathPlace, None),
-            'homeLocation': (schema.homeLocation, None),
-            'mbox': (foaf.mbox, None),
-            'addressCountry': (schema.addressCountry, None),
-            'additionalName': (schema.additionalName, None),
-            'title': (foaf.title, None)
-        }
-        
-        # 各プロパティの値を抽出
-        for field_name, (property_uri, lang_filter) in properties.items():
-            values = []
-            for obj in merged_graph.objects(resource, property_uri):
-                if lang_filter:
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
-        
-        # rcgs:adminMetadataからのsource
-        source_values = []
-        for admin_meta in merged_graph.objects(resource, rcgs.adminMetadata):
-            for source in merged_graph.objects(admin_meta, DCTERMS.source):
-                source_values.append(str(source))
-        row['source'] = "|".join(source_values)
+    writeに渡した行のcheckpoint.chunk_rows件ごとに、チャンクファイル（ヘッダーなしのCSV）と、そのチャンクの
+    行のハッシュ値・件数のJSONを一時ファイルから置き換えて保存する（JSONがあるチャンクが完了したもの）。
+    前回の実行で完了したチャンクがあればその状態を引き継ぎ、続きのチャンクから書き込む
+    （行の作成で飛ばすリソースの数はresumed_rows）。
+    """
+    def __init__(self, filename, columns, output_dir, previous_snapshot, checkpoint):
+        super().__init__(filename, columns, output_dir, previous_snapshot)
+        self.chunk_dir = checkpoint.chunk_dir(filename)
+        self.chunk_rows = checkpoint.chunk_rows
+        chunks = checkpoint.completed_chunks(filename)
+        self.chunk_count = len(chunks)
+        self.resumed_rows = 0
+        for chunk in chunks:
+            self.resumed_rows += chunk['rows']
+            self.row_count += chunk['row_count']
+            self.row_hashes.update(chunk['row_hashes'])
+            for change, count in chunk['change_counts'].items():
+                self.change_counts[change] += count
+        self._opened = self.row_count > 0
+        self._start_chunk()
+    
+    def _start_chunk(self):
+        self._chunk_keys = []
+        self._chunk_start = (self.row_count, dict(self.change_counts))
+    
+    def _chunk_path(self, number, extension):
+        return os.path.join(self.chunk_dir, f'part-{number:06d}{extension}')
+    
+    def write(self, row):
+        super().write(row)
+        self._chunk_keys.append(row[self.columns[0]])
+        if len(self._chunk_keys) >= self.chunk_rows:
+            self._commit_chunk()
+    
+    def _open(self):
+        # チャンクファイルは_write_rowでチャンクごとに作成する
+        pass
+    
+    def _write_row(self, row):
+        if self._file is None:
+            os.makedirs(self.chunk_dir, exist_ok=True)
+            self._file = open(self._chunk_path(self.chunk_count, '.csv.tmp'), 'w', encoding='utf-8', newline='',
+                              buffering=1 << 20)
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, lineterminator='\n')
+        self._writer.writerow(row)
+    
+    def _commit_chunk(self):
+        """
+        書き込み中のチャンクを閉じて完了させる（差分変換で書き込む行がなかったチャンクはJSONだけを保存する）
+        """
+        if not self._chunk_keys:
+            return
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+            os.replace(self._chunk_path(self.chunk_count, '.csv.tmp'), self._chunk_path(self.chunk_count, '.csv'))
+        start_row_count, start_counts = self._chunk_start
+        save_json_file(self._chunk_path(self.chunk_count, '.json'), {
+            'rows': len(self._chunk_keys),
+            'row_count': self.row_count - start_row_count,
+            'row_hashes': {key: self.row_hashes[key] for key in self._chunk_keys},
+            'change_counts': {change: count - start_counts[change] for change, count in self.change_counts.items()}
+        })
+        self.chunk_count += 1
+        self._start_chunk()
+    
+    def _finish(self):
+        self._commit_chunk()
         
-        person_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(person_data)
-    
-    print(f"抽出完了: {len(df)} 件の個人データ")
-    print(f"列数: {len(df.columns)}")
-    
-    return df
+        # ヘッダーの後にチャンクファイルを順に連結し、一時ファイルから置き換える
+        self._ensure_output_dir()
+        temp_file = f"{self.output_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+            csv.DictWriter(f, fieldnames=self.columns, lineterminator='\n').writeheader()
+            for number in range(self.chunk_count):
+                chunk_file = self._chunk_path(number, '.csv')
+                if os.path.exists(chunk_file):
+                    with open(chunk_file, encoding='utf-8', newline='') as chunk:
+                        shutil.copyfileobj(chunk, f, 1 << 20)
+        os.replace(temp_file, self.output_file)
 
-def extract_organization_data(merged_graph):
-    """
-    団体（Organization）のデータを抽出してCSVに変換する
+def arrow_column_layout(plan):
     """
-    print("\n=== 団体データの抽出開始 ===")
+    Arrow形式で出力するときの列の構成を返す: [(列名, 言語タグ → 元の列名の辞書またはNone), ...]
     
-    # 名前空間の定義
-    foaf = Namespace("http://xmlns.com/foaf/0.1/")
-    skos = Namespace("http://www.w3.org/2004/02/skos/core#")
-    schema = Namespace("http://schema.org/")
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    
-    # foaf:Organizationタイプのリソースを取得
-    org_resources = list(merged_graph.subjects(RDF.type, foaf.Organization))
-    print(f"団体数: {len(org_resources)}")
+    同じプロパティパスを言語タグだけ変えて取り出す列（prefLabel_ja、prefLabel_enなど）は
+    展開元の列名（または列名の共通部分）を名前にした1つのstruct列にまとめ、最初の列の位置に置く。
+    """
+    groups = {}
+    for field_name in plan.value_columns:
+        path, lang = plan.column_paths[field_name]
+        if lang is not None:
+            groups.setdefault(path, []).append((field_name, lang))
+    
+    layout = []
+    grouped = set()
+    for field_name in plan.value_columns:
+        if field_name in grouped:
+            continue
+        path, lang = plan.column_paths[field_name]
+        members = groups.get(path, []) if lang is not None else []
+        if len(members) < 2:
+            layout.append((field_name, None))
+            continue
+        # "languages"で展開した列は展開元の列名、それ以外は列名の共通部分を使う
+        # （共通部分の末尾の"_"以降は"titleTranscription_ja"の"ja"のように言語タグの一部なので除く）
+        name = plan.fan_out_names.get(field_name)
+        if name is None:
+            name = os.path.commonprefix([member for member, _ in members])
+            name = name[:name.rfind('_')] if '_' in name else name
+        layout.append((name or field_name, {member_lang: member for member, member_lang in members}))
+        grouped.update(member for member, _ in members)
+    return layout
+
+class ArrowTableWriter(TableWriter):
+    """
+    行をArrowの列にまとめてParquetまたはArrow IPCファイルに書き込む（pyarrowが必要）
     
-    if len(org_resources) == 0:
-        print("警告: 団体が見つかりませんでした")
-        return None
+    各列は値のリスト（list<string>）、言語別の列はstruct<言語タグ: list<string>>にする。
+    Parquetは一定の行数ごとに行グループとして書き込み、値の重複が多い列の圧縮はParquetの辞書エンコーディングに任せる。
+    Arrow IPCは最後にまとめて書き込み、値の重複が多い列（gamePlatform、carrierType、rdf_typeなどのURI）を辞書型にする。
+    """
+    BATCH_ROWS = 50000
     
-    # データを格納するリスト
-    org_data = []
+    # 異なる値の数が値の総数のこの割合以下の列を辞書型にする（Arrow IPCのみ）
+    DICTIONARY_RATIO = 0.5
     
-    for i, resource in enumerate(org_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(org_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'resource_uri': str(resource)}
+    def __init__(self, plan, output_dir='./output', file_format='parquet', previous_snapshot=None):
+        import pyarrow
         
-        # 基本プロパティ（言語別）
-        ja_pref_labels = []
-        en_pref_labels = []
-        for obj in merged_graph.objects(resource, skos.prefLabel):
-            if hasattr(obj, 'language'):
-                if obj.language == 'ja':
-                    ja_pref_labels.append(str(obj))
-                elif obj.language == 'en':
-                    en_pref_labels.append(str(obj))
-        row['skos_prefLabel_ja'] = "|".join(ja_pref_labels)
-        row['skos_prefLabel_en'] = "|".join(en_pref_labels)
+        filename = os.path.splitext(plan.file_name)[0] + OUTPUT_FORMATS[file_format]
+        super().__init__(filename, plan.columns, output_dir, previous_snapshot)
+        self.format_label = 'Parquet' if file_format == 'parquet' else 'Arrow'
+        self.file_format = file_format
+        self.pa = pyarrow
+        self.key = plan.key
+        self.layout = arrow_column_layout(plan)
         
-        # その他のプロパティ
-        properties = {
-            'altLabel': (skos.altLabel, None),
-            'homepage': (foaf.homepage, None),
-            'description': (DCTERMS.description, None),
-            'identifier': (DCTERMS.identifier, None),
-            'ndlAuthoritiesID': (rcgs.ndlAuthoritiesID, None),
-            'viafID': (rcgs.viafID, None),
-            'wikidataID': (rcgs.wikidataID, None),
-            'twitterID': (rcgs.twitterID, None),
-            'seeAlso': (RDFS.seeAlso, None),
-            'language': (DCTERMS.language, None),
-            'disambiguatingDescription': (schema.disambiguatingDescription, None),
-            'note': (skos.note, None),
-            'additionalType': (schema.additionalType, None),
-            'startDate': (schema.startDate, None),
-            'endDate': (schema.endDate, None),
-            'address': (schema.address, None),
-            'latitude': (schema.latitude, None),
-            'longitude': (schema.longitude, None),
-            'relatedOrganization': (rcgs.relatedOrganization, None),
-            'member': (foaf.member, None),
-            'logo': (foaf.logo, None)
-        }
-        
-        # 各プロパティの値を抽出
-        for field_name, (property_uri, lang_filter) in properties.items():
-            values = []
-            for obj in merged_graph.objects(resource, property_uri):
-                if lang_filter:
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
+        values_type = pyarrow.list_(pyarrow.string())
+        fields = [pyarrow.field(self.key, pyarrow.string(), nullable=False)]
+        for name, members in self.layout:
+            if members is None:
+                fields.append(pyarrow.field(name, values_type))
+            else:
+                fields.append(pyarrow.field(name, pyarrow.struct([pyarrow.field(lang, values_type) for lang in members])))
+        self.schema = pyarrow.schema(fields)
+        self._pending = {column: [] for column in self.columns}
+        self._batches = []
+        self._parquet_writer = None
+    
+    def _open(self):
+        if self.file_format == 'parquet':
+            import pyarrow.parquet
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(self.output_file, self.schema, compression='zstd')
+    
+    def _write_row(self, row):
+        for column, values in self._pending.items():
+            values.append(row[column])
+        if len(self._pending[self.key]) >= self.BATCH_ROWS:
+            self._flush()
+    
+    def _flush(self):
+        """
+        たまった行を1つのRecordBatchにする（Parquetはそのまま行グループとして書き込む）
+        """
+        pa = self.pa
+        if len(self._pending[self.key]) == 0:
+            return
+        values_type = pa.list_(pa.string())
+        arrays = [pa.array(self._pending[self.key], type=pa.string())]
+        for name, members in self.layout:
+            if members is None:
+                arrays.append(pa.array(self._pending[name], type=values_type))
+            else:
+                children = [pa.array(self._pending[member], type=values_type) for member in members.values()]
+                arrays.append(pa.StructArray.from_arrays(children, names=list(members)))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        for values in self._pending.values():
+            values.clear()
         
-        # rcgs:adminMetadataからのsource
-        source_values = []
-        for admin_meta in merged_graph.objects(resource, rcgs.adminMetadata):
-            for source in merged_graph.objects(admin_meta, DCTERMS.source):
-                source_values.append(str(source))
-        row['source'] = "|".join(source_values)
+        if self._parquet_writer is not None:
+            self._parquet_writer.write_table(pa.Table.from_batches([batch], schema=self.schema))
+        else:
+            self._batches.append(batch)
+    
+    def _dictionary_encode(self, column):
+        """
+        値の重複が多いlist<string>列を辞書型の値のリスト列にする（重複が少なければNone）
+        """
+        pa = self.pa
+        array = pa.concat_arrays(column.chunks)
+        values = array.flatten()
+        if len(values) == 0 or len(values.unique()) > len(values) * self.DICTIONARY_RATIO:
+            return None
+        return pa.ListArray.from_arrays(array.offsets, values.dictionary_encode())
+    
+    def _finish(self):
+        pa = self.pa
+        self._flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+            return
         
-        org_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(org_data)
-    
-    print(f"抽出完了: {len(df)} 件の団体データ")
-    print(f"列数: {len(df.columns)}")
+        # 辞書はすべての行で共有させるため、Arrow IPCは全行をまとめてから書き込む
+        table = pa.Table.from_batches(self._batches, schema=self.schema)
+        self._batches = []
+        for index, field in enumerate(table.schema):
+            if field.type != pa.list_(pa.string()):
+                continue
+            encoded = self._dictionary_encode(table.column(index))
+            if encoded is not None:
+                table = table.set_column(index, pa.field(field.name, encoded.type), encoded)
+        with pa.OSFile(self.output_file, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=self.BATCH_ROWS)
+
+def open_table_writer(plan, output_dir='./output', file_format='csv', previous_snapshot=None, checkpoint=None):
+    """
+    出力形式に合ったテーブルの書き込み先を作成する
     
-    return df
+    checkpointを渡した場合、CSVはチャンクファイルに分けて書き込む（Parquet・Arrowはテーブル単位でだけ再開する）。
+    """
+    if file_format == 'csv' and checkpoint is not None:
+        return ChunkedCsvTableWriter(plan.file_name, plan.columns, output_dir, previous_snapshot, checkpoint)
+    if file_format == 'csv':
+        return CsvTableWriter(plan.file_name, plan.columns, output_dir, previous_snapshot)
+    return ArrowTableWriter(plan, output_dir, file_format, previous_snapshot)
 
-def extract_variation_data(merged_graph):
+def save_rows(rows, writer):
     """
-    バリエーション（Variation）のデータを抽出してCSVに変換する
+    行を順に書き込み先へ書き込んで閉じ、書き込み先を返す（行をまとめてメモリに保持しない）
     """
-    print("\n=== バリエーションデータの抽出開始 ===")
-    
-    # 名前空間の定義
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    schema = Namespace("http://schema.org/")
-    
-    # rcgs:Variationタイプのリソースを取得
-    variation_resources = list(merged_graph.subjects(RDF.type, rcgs.Variation))
-    print(f"バリエーション数: {len(variation_resources)}")
-    
-    if len(variation_resources) == 0:
-        print("警告: バリエーションが見つかりませんでした")
+    for row in rows:
+        writer.write(row)
+    if not writer.close():
+        if writer.previous_hashes is not None:
+            print(f"前回から変更された行がないため {writer.filename} を作成しませんでした")
+        else:
+            print(f"警告: 出力する行がないため {writer.filename} を作成しませんでした")
+    return writer
+
+# 各テーブルの行のハッシュ値を保存するファイル（次回の差分変換の比較元になる）
+ROW_HASHES_FILE = 'row_hashes.json'
+
+# 差分変換の結果をまとめたファイル
+MANIFEST_FILE = 'manifest.json'
+
+def load_snapshot_hashes(since):
+    """
+    前回の変換の出力ディレクトリ（またはrow_hashes.json）から各テーブルの行のハッシュ値を読み込む
+    """
+    hashes_file = os.path.join(since, ROW_HASHES_FILE) if os.path.isdir(since) else since
+    if not os.path.exists(hashes_file):
         return None
+    with open(hashes_file, encoding='utf-8') as f:
+        return json.load(f)['tables']
+
+def save_snapshot_hashes(writers, output_dir='./output', since=None, partial=False):
+    """
+    各テーブルの行のハッシュ値を保存し、差分変換の場合はマニフェストも保存する
     
-    # データを格納するリスト
-    variation_data = []
+    partialがTrue（--onlyで一部のテーブルだけを出力した場合）は、出力しなかったテーブルの
+    ハッシュ値を前回のファイルから引き継ぐ。
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
     
-    for i, resource in enumerate(variation_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(variation_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'resource_uri': str(resource)}
-        
-        # 基本プロパティ
-        properties = {
-            'contribution': (rcgs.contribution, None),
-            'contentType': (rcgs.contentType, None),
-            'variationOf': (rcgs.variationOf, None),
-            'type': (RDF.type, None),
-            'label': (RDFS.label, None),
-            'color': (schema.color, None),
-            'audio': (schema.audio, None),
-            'language': (DCTERMS.language, None),
-            'date': (DCTERMS.date, None),
-            'gamePlatform': (schema.gamePlatform, None),
-            'aspectRatio': (rcgs.aspectRatio, None),
-            'middlewareOrGameEngine': (rcgs.middlewareOrGameEngine, None),
-            'dimension': (rcgs.dimension, None),
-            'pointOfView': (rcgs.pointOfView, None),
-            'ending': (rcgs.ending, None),
-            'multipleEnding': (rcgs.multipleEnding, None),
-            'disambiguatingDescription': (schema.disambiguatingDescription, None),
-            'difficultyOption': (rcgs.difficultyOption, None),
-            'award': (schema.award, None),
-            'abstract': (DCTERMS.abstract, None),
-            'postGameContents': (rcgs.postGameContents, None)
+    hashes_file = os.path.join(output_dir, ROW_HASHES_FILE)
+    tables = {}
+    if partial and os.path.exists(hashes_file):
+        tables = load_snapshot_hashes(hashes_file)
+    tables.update({writer.filename: writer.row_hashes for writer in writers})
+    with open(hashes_file, 'w', encoding='utf-8') as f:
+        json.dump({'tables': tables}, f)
+    print(f"行のハッシュ値を保存: {hashes_file}")
+    
+    if since is None:
+        return
+    manifest = {
+        'since': since,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'tables': {
+            writer.filename: {
+                **writer.change_counts,
+                'file': writer.filename if writer.row_count > 0 else None,
+                'deleted_file': writer.deleted_file_name() if writer.change_counts['deleted'] > 0 else None
+            }
+            for writer in writers
         }
+    }
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"マニフェストを保存: {manifest_file}")
+
+def save_json_file(path, data):
+    """
+    JSONファイルを一時ファイルからの置き換えで書き込む（途中で止まっても書きかけのファイルを残さない）
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def load_json_file(path):
+    """
+    JSONファイルを読み込む（ファイルがない、または読み込めない場合はNone）
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+CHECKPOINT_VERSION = 1
+
+# チェックポイントの状態（入力のキーと完了したテーブル）と、読み込んだ統合グラフのファイル
+CHECKPOINT_FILE = 'checkpoint.json'
+CHECKPOINT_GRAPH_FILE = 'graph.pickle'
+
+def checkpoint_key(args, source_dir, since=None):
+    """
+    チェックポイントから再開できるかを判定するキー（ソースファイルの一覧・列定義・出力に関わるオプション）を返す
+    """
+    with open(args.spec, 'rb') as f:
+        spec_digest = hashlib.sha256(f.read()).hexdigest()
+    key = {'source': source_signature(source_dir), 'spec': spec_digest, 'store': args.store, 'only': args.only,
+           'all_triples': args.all_triples, 'format': args.format, 'since': since}
+    # 保存したJSONと比べられるようにタプルをリストにしておく
+    return json.loads(json.dumps(key))
+
+class Checkpoint:
+    """
+    変換の途中経過を保存し、--resumeで最後に完了したチャンクの続きから再開する
+    
+    checkpoint_dirには次のものを置く。
+    - checkpoint.json: 入力のキー（checkpoint_key）、統合グラフを保存したか、変換が完了したか
+    - graph.pickle: 読み込んだ統合グラフのトリプル（encode_triplesの形式。--store mmapはストアを開き直すため作らない）
+    - tables/<テーブルのファイル名>.json: 出力し終わったテーブルの状態（TableWriter.checkpoint_state）
+    - chunks/<テーブルのファイル名>/: 出力中のテーブルのチャンクファイル（ChunkedCsvTableWriter）
+    どのファイルも一時ファイルからの置き換えで書き込む。変換が完了したらcheckpoint.json以外を削除する。
+    入力のキーが一致しない場合や--resumeでない場合は、保存済みの途中経過を捨てて最初から変換する。
+    """
+    def __init__(self, checkpoint_dir, key, chunk_rows=10000, resume=False):
+        self.dir = checkpoint_dir
+        self.chunk_rows = chunk_rows
+        self.graph_path = os.path.join(checkpoint_dir, CHECKPOINT_GRAPH_FILE)
+        self._state_path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
         
-        # 各プロパティの値を抽出
-        for field_name, (property_uri, lang_filter) in properties.items():
-            values = []
-            for obj in merged_graph.objects(resource, property_uri):
-                if lang_filter:
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
-        
-        variation_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(variation_data)
-    
-    print(f"抽出完了: {len(df)} 件のバリエーションデータ")
-    print(f"列数: {len(df.columns)}")
-    
-    return df
+        state = load_json_file(self._state_path) if resume else None
+        if resume and state is None:
+            print(f"チェックポイントがないため、最初から変換します: {checkpoint_dir}")
+        elif state is not None and (state.get('version') != CHECKPOINT_VERSION or state.get('key') != key):
+            print("警告: チェックポイントが現在のソースファイル・列定義・オプションと一致しないため、最初から変換します")
+            state = None
+        if state is None:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+            state = {'version': CHECKPOINT_VERSION, 'key': key, 'graph': False, 'completed': False}
+        self.state = state
+        os.makedirs(os.path.join(checkpoint_dir, 'tables'), exist_ok=True)
+        self._save_state()
+    
+    def _save_state(self):
+        save_json_file(self._state_path, self.state)
+    
+    @property
+    def completed(self):
+        return self.state['completed']
+    
+    def save_graph(self, merged_graph):
+        """
+        読み込んだ統合グラフのトリプルを保存する
+        """
+        if isinstance(merged_graph, MappedTripleStore):
+            return
+        start = time.perf_counter()
+        if isinstance(merged_graph, InternedTripleStore):
+            np = merged_graph.np
+            terms = merged_graph.terms
+            triple_ids = np.column_stack((merged_graph.s, merged_graph.p, merged_graph.o)).ravel()
+        else:
+            terms, triple_ids = encode_triples(merged_graph)
+        save_cached_triples(self.graph_path, terms, triple_ids)
+        self.state['graph'] = True
+        self._save_state()
+        print(f"チェックポイントに統合グラフを保存: {self.graph_path}（{time.perf_counter() - start:.2f}秒）")
+    
+    def load_graph(self, store='rdflib', term_dictionary=None):
+        """
+        保存した統合グラフを読み込む（保存していなければNone）
+        """
+        if not self.state['graph']:
+            return None
+        start = time.perf_counter()
+        try:
+            terms, triple_ids = load_cached_triples(self.graph_path)
+        except Exception as e:
+            print(f"警告: チェックポイントの統合グラフを読み込めません（{str(e)}）。RDFファイルを読み込み直します")
+            return None
+        merged_graph = InternedTripleStore(term_dictionary) if store == 'interned' else Graph()
+        add_encoded_triples(merged_graph, terms, triple_ids)
+        del terms, triple_ids
+        if isinstance(merged_graph, InternedTripleStore):
+            merged_graph.freeze()
+        print(f"チェックポイントから統合グラフを読み込みました: {len(merged_graph)} トリプル"
+              f"（{time.perf_counter() - start:.2f}秒）")
+        return merged_graph
+    
+    def _table_path(self, filename):
+        return os.path.join(self.dir, 'tables', filename + '.json')
+    
+    def table_state(self, filename):
+        """
+        出力し終わったテーブルの状態を返す（まだ出力し終わっていなければNone）
+        """
+        return load_json_file(self._table_path(filename))
+    
+    def complete_table(self, writer):
+        """
+        テーブルを出力し終わったことを記録し、そのテーブルのチャンクファイルを削除する
+        """
+        save_json_file(self._table_path(writer.filename), writer.checkpoint_state())
+        shutil.rmtree(self.chunk_dir(writer.filename), ignore_errors=True)
+    
+    def chunk_dir(self, filename):
+        return os.path.join(self.dir, 'chunks', filename)
+    
+    def completed_chunks(self, filename):
+        """
+        前回の実行で完了したチャンクの状態を番号順に返す（途中に欠けたチャンクがあればその前まで）
+        """
+        chunks = []
+        while True:
+            chunk = load_json_file(os.path.join(self.chunk_dir(filename), f'part-{len(chunks):06d}.json'))
+            if chunk is None:
+                return chunks
+            chunks.append(chunk)
+    
+    def finish(self):
+        """
+        変換が完了したことを記録し、統合グラフとテーブルの途中経過を削除する
+        """
+        self.state['completed'] = True
+        self.state['graph'] = False
+        self._save_state()
+        for name in ('tables', 'chunks'):
+            shutil.rmtree(os.path.join(self.dir, name), ignore_errors=True)
+        if os.path.exists(self.graph_path):
+            os.remove(self.graph_path)
 
-def extract_work_data(merged_graph):
+def merge_records(target, source):
+    """
+    sourceのレコードの値をtargetのレコードに統合する
     """
-    作品（Work）のデータを抽出してCSVに変換する
+    for predicate, values in source.items():
+        for obj in values:
+            add_to_record(target, predicate, obj)
+
+def build_stream_index(rdf_files, joined_plans=(), language_predicates=()):
     """
-    print("\n=== 作品データの抽出開始 ===")
+    逐次変換の1パス目として、行の作成に必要な相互参照インデックスを作成する
     
-    # 名前空間の定義
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    skos = Namespace("http://www.w3.org/2004/02/skos/core#")
-    schema = Namespace("http://schema.org/")
+    joined_plansには、requireのプロパティの参照先と結合して行を作成するテーブル（関連資料など）の
+    抽出計画を渡す。language_predicatesには"languages": "*" の列の終端の述語を渡す。
     
-    # rcgs:Workタイプのリソースを取得
-    work_resources = list(merged_graph.subjects(RDF.type, rcgs.Work))
-    print(f"作品数: {len(work_resources)}")
+    戻り値は (index, description_counts, joined_records, failed_files, languages)
+    - index: URIリソース → {rdf:type: [...], rdfs:label: [...]}
+    - description_counts: URIリソースごとの記述の数（分割された記述の統合用）
+    - joined_records: テーブル名 → {requireのプロパティを持つリソース → レコード}
+    - languages: language_predicatesの述語 → 値に付いている言語タグのリスト
+    """
+    index = {}
+    description_counts = {}
+    joined_records = {plan.name: {} for plan in joined_plans}
+    failed_files = set()
+    language_sets = {predicate: set() for predicate in language_predicates}
+    
+    for file_path, format_type in rdf_files:
+        try:
+            print(f"インデックス作成中: {file_path}")
+            resource_count = 0
+            for records in iter_resource_records(file_path, format_type):
+                for subject, record in records.items():
+                    for predicate, tags in language_sets.items():
+                        tags.update(partition_by_language(record.get(predicate, ())))
+                    if isinstance(subject, BNode):
+                        continue
+                    resource_count += 1
+                    description_counts[subject] = description_counts.get(subject, 0) + 1
+                    entry = index.setdefault(subject, {})
+                    for predicate in (RDF.type, RDFS.label):
+                        for obj in record.get(predicate, ()):
+                            add_to_record(entry, predicate, obj)
+                    for plan in joined_plans:
+                        plan_records = joined_records[plan.name]
+                        if plan.class_uri in record.get(RDF.type, ()) or subject in plan_records:
+                            merge_records(plan_records.setdefault(subject, {}), record)
+            print(f"  成功: {resource_count} リソース")
+        except Exception as e:
+            print(f"  エラー: {file_path} - {str(e)}")
+            failed_files.add(file_path)
+            continue
+    
+    # 対象クラスと判明したリソースのうちrequireのプロパティを持つものだけを残す
+    for plan in joined_plans:
+        joined_records[plan.name] = {
+            resource: record for resource, record in joined_records[plan.name].items()
+            if plan.class_uri in index[resource].get(RDF.type, ()) and record.get(plan.required_property)
+        }
     
-    if len(work_resources) == 0:
-        print("警告: 作品が見つかりませんでした")
-        return None
+    languages = {predicate: sorted(tags) for predicate, tags in language_sets.items()}
+    return index, description_counts, joined_records, failed_files, languages
+
+def convert_streaming(source_dir='./source', output_dir='./output', table_plans=None, previous_snapshot=None,
+                      since=None, file_format='csv', rdf_files=None, partial=False, save_hashes=False):
+    """
+    rdflibのGraphを作らずにRDFファイルを逐次読み込み、CSVに変換する
+    
+    1パス目で相互参照インデックス（rdf:type、rdfs:label、関連資料のItem）を作成し、
+    2パス目でリソースの記述を1件ずつ読みながら行を作成する。
+    メモリ使用量はインデックスと最大の記述1件分に抑えられる。
+    previous_snapshotを渡した場合は前回との差分だけを出力する（sinceはマニフェストに記録するパス）。
+    file_formatに'parquet'・'arrow'を渡すとCSVの代わりにParquet・Arrow IPCファイルに出力する。
+    rdf_filesを渡した場合はsource_dirのすべてのファイルの代わりにそのファイルだけを読み込む
+    （partialがTrueならtable_plansは一部のテーブルで、ほかのテーブルの行のハッシュ値を引き継ぐ）。
+    行のハッシュ値はsinceを渡した場合かsave_hashesがTrueの場合だけ保存する。
+    """
+    if table_plans is None:
+        table_plans = load_table_plans()
+    joined_plans = [plan for plan in table_plans.values() if plan.required_property is not None]
+    language_predicates = list(dict.fromkeys(predicate for plan in table_plans.values()
+                                             for predicate in plan.language_predicates))
+    
+    if rdf_files is None:
+        rdf_files = list_rdf_files(source_dir)
+    print(f"RDFファイルの逐次読み込みを開始: {source_dir}")
+    
+    with metrics.phase('stream_index') as counters:
+        index, description_counts, joined_records, failed_files, languages = build_stream_index(
+            rdf_files, joined_plans, language_predicates)
+        counters['resources'] = len(index)
+    
+    if len(index) == 0:
+        print("警告: 読み込まれたRDFデータがありません")
+        return
     
-    # データを格納するリスト
-    work_data = []
+    # "languages": "*" の列を1パス目で見つかった言語タグで展開する
+    table_plans = {name: plan.with_languages(languages) for name, plan in table_plans.items()}
+    direct_plans = [plan for plan in table_plans.values() if plan.required_property is None]
+    joined_plans = [plan for plan in table_plans.values() if plan.required_property is not None]
     
-    for i, resource in enumerate(work_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(work_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'resource_uri': str(resource)}
-        
-        # 基本プロパティ
-        properties = {
-            'label': (RDFS.label, None),
-            'prefLabel': (skos.prefLabel, None),
-            'altLabel': (skos.altLabel, None),
-            'spatial': (DCTERMS.spatial, None),
-            'date': (DCTERMS.date, None),
-            'description': (DCTERMS.description, None),
-            'identifier': (DCTERMS.identifier, None),
-            'closeMatch': (skos.closeMatch, None),
-            'twitch': (rcgs.twitch, None),
-            'freebase': (rcgs.freebase, None),
-            'mobyGames': (rcgs.mobyGames, None),
-            'metacritic': (rcgs.metacritic, None),
-            'seeAlso': (RDFS.seeAlso, None),
-            'imdb': (rcgs.imdb, None),
-            'abstract': (DCTERMS.abstract, None),
-            'audience': (DCTERMS.audience, None),
-            'natureOfContent': (rcgs.natureOfContent, None),
-            'serialNumber': (schema.serialNumber, None),
-            'disambiguatingDescription': (schema.disambiguatingDescription, None),
-            'locationCreated': (schema.locationCreated, None),
-            'about': (schema.about, None),
-            'subjectOf': (schema.subjectOf, None),
-            'gameLocation': (schema.gameLocation, None),
-            'creator': (DCTERMS.creator, None),
-            'productionCompany': (schema.productionCompany, None),
-            'relatedAgent': (rcgs.relatedAgent, None),
-            'logo': (schema.logo, None),
-            'relation': (DCTERMS.relation, None),
-            'isPartOf': (DCTERMS.isPartOf, None),
-            'hasPart': (DCTERMS.hasPart, None),
-            'precedes': (rcgs.precedes, None),
-            'succeeds': (rcgs.succeeds, None),
-            'sequelTo': (rcgs.sequelTo, None),
-            'sequel': (rcgs.sequel, None),
-            'remadeAs': (rcgs.remadeAs, None),
-            'complements': (rcgs.complements, None),
-            'expandedAs': (rcgs.expandedAs, None),
-            'spinOff': (rcgs.spinOff, None),
-            'note': (skos.note, None)
-        }
-        
-        # 各プロパティの値を抽出
-        for field_name, (property_uri, lang_filter) in properties.items():
-            values = []
-            for obj in merged_graph.objects(resource, property_uri):
-                if lang_filter:
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
-        
-        # 複雑な構造（rdfs:labelを持つリソース）
-        # schema:genre
-        genre_labels = []
-        for genre_node in merged_graph.objects(resource, schema.genre):
-            for label in merged_graph.objects(genre_node, RDFS.label):
-                genre_labels.append(str(label))
-        row['genre'] = "|".join(genre_labels)
-        
-        # rcgs:narrativeGenre
-        narrative_genre_labels = []
-        for ng_node in merged_graph.objects(resource, rcgs.narrativeGenre):
-            for label in merged_graph.objects(ng_node, RDFS.label):
-                narrative_genre_labels.append(str(label))
-        row['narrativeGenre'] = "|".join(narrative_genre_labels)
-        
-        # rcgs:theme
-        theme_labels = []
-        for theme_node in merged_graph.objects(resource, rcgs.theme):
-            for label in merged_graph.objects(theme_node, RDFS.label):
-                theme_labels.append(str(label))
-        row['theme'] = "|".join(theme_labels)
-        
-        # rcgs:mood
-        mood_labels = []
-        for mood_node in merged_graph.objects(resource, rcgs.mood):
-            for label in merged_graph.objects(mood_node, RDFS.label):
-                mood_labels.append(str(label))
-        row['mood'] = "|".join(mood_labels)
-        
-        # rcgs:setting
-        setting_labels = []
-        for setting_node in merged_graph.objects(resource, rcgs.setting):
-            for label in merged_graph.objects(setting_node, RDFS.label):
-                setting_labels.append(str(label))
-        row['setting'] = "|".join(setting_labels)
-        
-        # rcgs:series
-        series_labels = []
-        for series_node in merged_graph.objects(resource, rcgs.series):
-            for label in merged_graph.objects(series_node, RDFS.label):
-                series_labels.append(str(label))
-        row['series'] = "|".join(series_labels)
-        
-        # rcgs:franchise
-        franchise_labels = []
-        for franchise_node in merged_graph.objects(resource, rcgs.franchise):
-            for label in merged_graph.objects(franchise_node, RDFS.label):
-                franchise_labels.append(str(label))
-        row['franchise'] = "|".join(franchise_labels)
-        
-        # rcgs:mechanic
-        mechanic_labels = []
-        for mechanic_node in merged_graph.objects(resource, rcgs.mechanic):
-            for label in merged_graph.objects(mechanic_node, RDFS.label):
-                mechanic_labels.append(str(label))
-        row['mechanic'] = "|".join(mechanic_labels)
+    # 基本的な統計情報を表示
+    type_counts = {}
+    for entry in index.values():
+        for class_uri in entry.get(RDF.type, ()):
+            type_counts[class_uri] = type_counts.get(class_uri, 0) + 1
+    print_class_counts(type_counts)
+    
+    # requireのプロパティの参照先（exemplarOf先のPackageなど） → 結合して行を作成するリソース
+    pending_rows = {}
+    for plan in joined_plans:
+        for resource, record in joined_records[plan.name].items():
+            pending_rows.setdefault(record[plan.required_property][0], []).append((plan, resource))
+    
+    # 行は作成した順に出力ファイルへ書き込む
+    print("\n=== 行の作成とCSV出力開始 ===")
+    writers = {plan.name: open_table_writer(plan, output_dir, file_format, previous_snapshot)
+               for plan in table_plans.values()}
+    row_builders = {plan.name: plan.build_row if file_format == 'csv' else plan.build_value_row
+                    for plan in table_plans.values()}
+    with metrics.phase('stream_convert') as counters:
+        deferred = {}
         
-        # rcgs:protagonist
-        protagonist_labels = []
-        for protagonist_node in merged_graph.objects(resource, rcgs.protagonist):
-            for label in merged_graph.objects(protagonist_node, RDFS.label):
-                protagonist_labels.append(str(label))
-        row['protagonist'] = "|".join(protagonist_labels)
+        for file_path, format_type in rdf_files:
+            if file_path in failed_files:
+                continue
+            print(f"読み込み中: {file_path}")
+            for records in iter_resource_records(file_path, format_type):
+                for subject in list(records):
+                    if isinstance(subject, BNode):
+                        continue
+                    record = records[subject]
+                    nested = records
+                    
+                    # 複数の記述に分かれたリソースは最後の記述まで待って統合する
+                    if description_counts[subject] > 1:
+                        pending = deferred.setdefault(subject, {'records': {}, 'seen': 0})
+                        for node, node_record in records.items():
+                            if node == subject or isinstance(node, BNode):
+                                merge_records(pending['records'].setdefault(node, {}), node_record)
+                        pending['seen'] += 1
+                        if pending['seen'] < description_counts[subject]:
+                            continue
+                        del deferred[subject]
+                        nested = pending['records']
+                        record = nested[subject]
+                    
+                    resolver = StreamResolver(index, nested)
+                    for plan in direct_plans:
+                        if plan.class_uri in record.get(RDF.type, ()):
+                            writers[plan.name].write(row_builders[plan.name](subject, record, resolver))
+                    for plan, resource in pending_rows.pop(subject, ()):
+                        joined_record = joined_records[plan.name][resource]
+                        writers[plan.name].write(row_builders[plan.name](resource, joined_record, resolver))
         
-        work_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(work_data)
-    
-    print(f"抽出完了: {len(df)} 件の作品データ")
-    print(f"列数: {len(df.columns)}")
+        # 参照先の記述がないリソース
+        resolver = StreamResolver(index)
+        for rows in pending_rows.values():
+            for plan, resource in rows:
+                joined_record = joined_records[plan.name][resource]
+                writers[plan.name].write(row_builders[plan.name](resource, joined_record, resolver))
+        counters['rows'] = sum(len(writer.row_hashes) for writer in writers.values())
+    
+    # 各データタイプのCSVファイルを閉じる
+    print("\n=== CSV出力結果 ===")
+    for plan in table_plans.values():
+        writer = writers[plan.name]
+        if writer.close():
+            print(f"抽出完了: {writer.row_count} 件の{plan.label}データ")
+        elif previous_snapshot is not None:
+            print(f"前回から変更された{plan.label}はありません")
+        else:
+            print(f"警告: {plan.label}が見つかりませんでした")
     
-    return df
+    if since or save_hashes:
+        save_snapshot_hashes(list(writers.values()), output_dir, since, partial)
 
-def extract_related_item_data(merged_graph):
+# 変換サービス（--serve）がソースディレクトリと列定義ファイルの変更を確認する間隔（秒）
+SERVICE_POLL_SECONDS = 5
+
+def source_signature(source_dir):
     """
-    関連資料（Item）のデータを抽出してCSVに変換する
+    ソースディレクトリのファイルのパス・サイズ・更新時刻の一覧を返す（変換サービスの再読み込みの判定用）
     """
-    print("\n=== 関連資料データの抽出開始 ===")
-    
-    # 名前空間の定義
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    schema = Namespace("http://schema.org/")
-    skos = Namespace("http://www.w3.org/2004/02/skos/core#")
-    dcndl = Namespace("http://ndl.go.jp/dcndl/terms/")
-    
-    # rcgs:Itemタイプのリソースを取得（exemplarOfを持つもの）
-    item_resources = []
-    for item in merged_graph.subjects(RDF.type, rcgs.Item):
-        exemplar_of = list(merged_graph.objects(item, rcgs.exemplarOf))
-        if exemplar_of:
-            item_resources.append(item)
-    
-    print(f"関連資料数: {len(item_resources)}")
-    
-    if len(item_resources) == 0:
-        print("警告: 関連資料が見つかりませんでした")
-        return None
+    signature = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+class ServiceState:
+    """
+    変換サービスが保持する読み込み済みのGraph・結合用インデックス・抽出計画・参照先レコードのキャッシュ
     
-    # データを格納するリスト
-    related_item_data = []
+    作成後は置き換えるだけで変更しないため、処理中の要求は開始時の状態のまま最後まで出力できる。
+    """
+    def __init__(self, merged_graph, spec_file, signature):
+        self.merged_graph = merged_graph
+        self.spec_file = spec_file
+        self.spec_mtime = os.stat(spec_file).st_mtime_ns
+        self.signature = signature
+        self.loaded = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        table_plans = load_table_plans(spec_file)
+        self.join_index = JoinIndex(merged_graph, table_plans)
+        self.table_plans = {name: plan.with_languages(self.join_index.languages)
+                            for name, plan in table_plans.items()}
+        self.resolver = GraphResolver(merged_graph, new_record_cache(merged_graph), self.join_index)
+    
+    def resources(self, plan):
+        """
+        テーブルの対象リソースのリスト（requireがあればそのプロパティを持つものだけ）
+        """
+        resources = self.join_index.class_members.get(plan.class_uri, [])
+        if plan.required_property is not None:
+            targets = self.join_index.targets[plan.required_property]
+            resources = [resource for resource in resources if resource in targets]
+        return resources
+    
+    def is_resource(self, plan, resource):
+        """
+        resourceがテーブルの対象リソースかどうか
+        """
+        if resource not in self.join_index.class_member_sets.get(plan.class_uri, ()):
+            return False
+        return plan.required_property is None or resource in self.join_index.targets[plan.required_property]
+
+class ConversionService:
+    """
+    ./sourceのRDFファイルを1回だけ読み込んで保持し、HTTPの要求に応じてテーブルを出力する変換サービス
     
-    for i, item_resource in enumerate(item_resources):
-        if i % 100 == 0:
-            print(f"処理中: {i+1}/{len(item_resources)}")
-        
-        # 各プロパティを抽出
-        row = {'item_uri': str(item_resource)}
+    ソースディレクトリの変更を監視し、ファイルの一覧が2回続けて同じになった（書き込みが終わった）時点で
+    新しいGraphを読み込み、読み込みが終わってから状態をまとめて置き換える。
+    列定義ファイルが変更された場合はGraphを読み直さずに抽出計画とインデックスだけを作り直す。
+    """
+    def __init__(self, args, source_dir='./source'):
+        self.args = args
+        self.source_dir = source_dir
+        self.state = None
+        self._reload_lock = threading.Lock()
+        # 読み込めなかった列定義ファイルの更新時刻（同じ内容を読み直さないため）
+        self._rejected_spec_mtime = None
+    
+    def reload(self, signature=None):
+        """
+        ソースディレクトリを読み込み直して状態を置き換える（失敗した場合は前の状態のまま）
+        """
+        with self._reload_lock:
+            if signature is None:
+                signature = source_signature(self.source_dir)
+            try:
+                merged_graph = load_rdf_files(self.source_dir, jobs=self.args.jobs,
+                                              cache_dir=None if self.args.no_cache else self.args.cache_dir,
+                                              store=self.args.store, prefetch=self.args.prefetch,
+                                              prefetch_bytes=self.args.prefetch_memory << 20,
+                                              store_dir=self.args.store_dir)
+                if merged_graph is None:
+                    raise RuntimeError('統合グラフへの追加に失敗しました')
+                state = ServiceState(merged_graph, self.args.spec, signature)
+            except Exception as e:
+                print(f"エラー: 再読み込みに失敗しました（{str(e)}）。前のデータで続けます")
+                return False
+            self.state = state
+            print(f"データを読み込みました: {len(merged_graph)} トリプル")
+            return True
+    
+    def watch(self):
+        """
+        ソースディレクトリと列定義ファイルの変更を監視する（デーモンスレッドで実行）
+        """
+        pending = None
+        while True:
+            time.sleep(SERVICE_POLL_SECONDS)
+            state = self.state
+            signature = source_signature(self.source_dir)
+            if signature != state.signature:
+                # 書き込み中のファイルを読まないよう、前回の確認から変わっていない場合だけ読み込む
+                if signature == pending:
+                    print("ソースディレクトリの変更を検出しました。再読み込みします")
+                    self.reload(signature)
+                    pending = None
+                else:
+                    pending = signature
+                continue
+            try:
+                spec_mtime = os.stat(state.spec_file).st_mtime_ns
+            except OSError:
+                continue
+            if spec_mtime in (state.spec_mtime, self._rejected_spec_mtime):
+                continue
+            print(f"列定義の変更を検出しました: {state.spec_file}")
+            with self._reload_lock:
+                try:
+                    self.state = ServiceState(state.merged_graph, state.spec_file, state.signature)
+                except Exception as e:
+                    print(f"エラー: 列定義を読み込めません（{str(e)}）。前の列定義で続けます")
+                    self._rejected_spec_mtime = spec_mtime
+
+def filter_rows(rows, filters, limit=None):
+    """
+    filters（列名 → 値の集合）のすべての列で、"|"で区切った値のいずれかが一致する行だけを返す
+    """
+    count = 0
+    for row in rows:
+        if limit is not None and count >= limit:
+            return
+        if all(not values.isdisjoint(row[column].split('|')) for column, values in filters.items()):
+            count += 1
+            yield row
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    変換サービスのHTTPの要求を処理する
+    
+    - GET /tables: テーブルの一覧と行数（JSON）
+    - GET /tables/<テーブル名>: テーブル全体（CSV、?format=jsonlでJSON Lines）。
+      ?<列名>=<値>で列の値が一致する行だけに絞り込み、?limit=Nで行数を制限する
+    - GET /tables/<テーブル名>/row?uri=<リソースのURI>: 1リソース分の行（JSON）
+    - GET /status: 読み込んだデータの状態（JSON）
+    - POST /reload: ソースディレクトリをすぐに読み込み直す
+    """
+    server_version = 'RCGSConvert/1.0'
+    
+    def _send_json(self, status, content):
+        body = json.dumps(content, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+    
+    def _send_rows(self, columns, rows, output_format):
+        """
+        行を作成しながら順に送る（Content-Lengthを付けず、接続を閉じて終わりを知らせる）
+        """
+        self.send_response(200)
+        if output_format == 'jsonl':
+            self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        else:
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.end_headers()
+        text = io.TextIOWrapper(self.wfile, encoding='utf-8', newline='')
+        try:
+            if output_format == 'jsonl':
+                for row in rows:
+                    text.write(json.dumps(row, ensure_ascii=False) + '\n')
+            else:
+                writer = csv.DictWriter(text, fieldnames=columns, lineterminator='\n')
+                writer.writeheader()
+                writer.writerows(rows)
+            text.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            print("クライアントが接続を閉じたため出力を中断しました")
+        finally:
+            text.detach()
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+        state = self.server.service.state
         
-        # Itemの基本プロパティ
-        item_properties = {
-            'item_holdingAgent': (dcndl.holdlingAgent, None),
-            'item_identifier': (DCTERMS.identifier, None),
-            'item_spatial': (DCTERMS.spatial, None),
-            'item_owns': (schema.owns, None)
-        }
+        if parts == ['status']:
+            self._send_json(200, {
+                'loaded': state.loaded,
+                'triples': len(state.merged_graph),
+                'files': len(state.signature),
+                'spec': state.spec_file
+            })
+            return
+        if parts == ['tables']:
+            self._send_json(200, {
+                name: {'label': plan.label, 'rows': len(state.resources(plan)), 'columns': plan.columns}
+                for name, plan in state.table_plans.items()
+            })
+            return
+        if len(parts) not in (2, 3) or parts[0] != 'tables' or (len(parts) == 3 and parts[2] != 'row'):
+            self._send_error(404, f"不明なパスです: {url.path}")
+            return
+        plan = state.table_plans.get(parts[1])
+        if plan is None:
+            self._send_error(404, f"テーブルが見つかりません: {parts[1]}")
+            return
         
-        for field_name, (property_uri, lang_filter) in item_properties.items():
-            values = []
-            for obj in merged_graph.objects(item_resource, property_uri):
-                if lang_filter:
-                    if hasattr(obj, 'language') and obj.language == lang_filter:
-                        values.append(str(obj))
-                else:
-                    values.append(str(obj))
-            row[field_name] = "|".join(values) if values else ""
+        # 1リソース分の行
+        if len(parts) == 3:
+            uri = query.get('uri', [None])[0]
+            if not uri:
+                self._send_error(400, "uriを指定してください")
+                return
+            resource = URIRef(uri)
+            if not state.is_resource(plan, resource):
+                self._send_error(404, f"{plan.label}のリソースが見つかりません: {uri}")
+                return
+            self._send_json(200, plan.build_row(resource, state.resolver.load_record(resource), state.resolver))
+            return
         
-        # exemplarOfからPackageリソースを取得
-        exemplar_of = list(merged_graph.objects(item_resource, rcgs.exemplarOf))
-        if exemplar_of:
-            package_resource = exemplar_of[0]
-            row['exemplarOf'] = str(package_resource)
-            
-            # Packageの基本プロパティ
-            properties = {
-                'type': (RDF.type, None),
-                'name': (schema.name, None),
-                'parallelTitle': (rcgs.parallelTitle, None),
-                'alternative': (DCTERMS.alternative, None),
-                'abbreviatedTitle': (rcgs.abbreviatedTitle, None),
-                'edition': (dcndl.edition, None),
-                'volume': (dcndl.volume, None),
-                'responsibilityStatement': (rcgs.responsibilityStatement, None),
-                'creator': (DCTERMS.creator, None),
-                'contribution': (rcgs.contribution, None),
-                'issued': (DCTERMS.issued, None),
-                'dimension': (rcgs.dimension, None),
-                'medium': (DCTERMS.medium, None),
-                'identifier': (DCTERMS.identifier, None),
-                'gtin13': (schema.gtin13, None),
-                'isbn': (schema.isbn, None),
-                'issn': (schema.issn, None),
-                'modelNumber': (rcgs.modelNumber, None),
-                'jpNumber': (rcgs.jpNumber, None),
-                'ndlBiBID': (rcgs.ndlBiBID, None),
-                'oclcNumber': (rcgs.oclcNumber, None),
-                'seeAlso': (RDFS.seeAlso, None),
-                'copyrightYear': (schema.copyrightYear, None),
-                'accessRights': (DCTERMS.accessRights, None),
-                'hasPart': (DCTERMS.hasPart, None),
-                'isPartOf': (DCTERMS.isPartOf, None),
-                'abstract': (DCTERMS.abstract, None),
-                'description': (DCTERMS.description, None),
-                'relation': (DCTERMS.relation, None),
-                'references': (DCTERMS.references, None),
-                'isReferencedBy': (DCTERMS.isReferencedBy, None),
-                'language': (DCTERMS.language, None),
-                'about': (schema.about, None),
-                'subjectOf': (schema.subjectOf, None),
-                'tableOfContents': (DCTERMS.tableOfContents, None),
-                'brand': (schema.brand, None),
-                'producer': (rcgs.producer, None),
-                'publisher': (rcgs.publisher, None),
-                'distributor': (rcgs.distributor, None),
-                'manufacturer': (rcgs.manufacturer, None),
-                'seriesStatement': (rcgs.seriesStatement, None),
-                'subseriesStatement': (rcgs.subseriesStatement, None),
-                'modeOfIssuance': (rcgs.modeOfIssuance, None),
-                'publicationPeriodicity': (dcndl.publicationPeriodicity, None),
-                'serialNumber': (schema.serialNumber, None),
-                'volumeNumber': (schema.volumeNumber, None),
-                'issueNumber': (schema.issueNumber, None),
-                'price': (schema.price, None),
-                'exemplar': (rcgs.exemplar, None),
-                'downloadUrl': (schema.downloadUrl, None),
-                'created': (DCTERMS.created, None),
-                'locationCreated': (schema.locationCreated, None),
-                'thumbnailUrl': (schema.thumbnailUrl, None),
-                'source': (DCTERMS.source, None)
-            }
-            
-            # 各プロパティの値を抽出
-            for field_name, (property_uri, lang_filter) in properties.items():
-                values = []
-                for obj in merged_graph.objects(package_resource, property_uri):
-                    if lang_filter:
-                        if hasattr(obj, 'language') and obj.language == lang_filter:
-                            values.append(str(obj))
-                    else:
-                        values.append(str(obj))
-                row[field_name] = "|".join(values) if values else ""
-            
-            # 特殊なプロパティ（言語別）
-            # dcndl:titleTranscription
-            ja_hrkt_values = []
-            ja_latn_values = []
-            for obj in merged_graph.objects(package_resource, dcndl.titleTranscription):
-                if hasattr(obj, 'language'):
-                    if obj.language == 'ja-Hrkt':
-                        ja_hrkt_values.append(str(obj))
-                    elif obj.language == 'ja-Latn':
-                        ja_latn_values.append(str(obj))
-            row['titleTranscription_jaHrkt'] = "|".join(ja_hrkt_values)
-            row['titleTranscription_jaLatn'] = "|".join(ja_latn_values)
-            
-            # 複雑な構造
-            # dcterms:format
-            format_carrier_types = []
-            format_extents = []
-            format_dimensions = []
-            format_encoding_formats = []
-            format_content_sizes = []
-            format_sources = []
-            
-            for format_node in merged_graph.objects(package_resource, DCTERMS.format):
-                for carrier_type in merged_graph.objects(format_node, rcgs.carrierType):
-                    format_carrier_types.append(str(carrier_type))
-                for extent in merged_graph.objects(format_node, DCTERMS.extent):
-                    format_extents.append(str(extent))
-                for dimension in merged_graph.objects(format_node, rcgs.dimension):
-                    format_dimensions.append(str(dimension))
-                for encoding_format in merged_graph.objects(format_node, schema.encodingFormat):
-                    format_encoding_formats.append(str(encoding_format))
-                for content_size in merged_graph.objects(format_node, schema.contentSize):
-                    format_content_sizes.append(str(content_size))
-                for admin_meta in merged_graph.objects(format_node, rcgs.adminMetadata):
-                    for source in merged_graph.objects(admin_meta, DCTERMS.source):
-                        format_sources.append(str(source))
-            
-            row['format_carrierType'] = "|".join(format_carrier_types)
-            row['format_extent'] = "|".join(format_extents)
-            row['format_dimension'] = "|".join(format_dimensions)
-            row['format_encodingFormat'] = "|".join(format_encoding_formats)
-            row['format_contentSize'] = "|".join(format_content_sizes)
-            row['format_source'] = "|".join(format_sources)
-            
-            # rcgs:formatOfSubunit
-            subunit_carrier_types = []
-            subunit_extents = []
-            subunit_dimensions = []
-            subunit_encoding_formats = []
-            subunit_content_sizes = []
-            subunit_sources = []
-            
-            for subunit_node in merged_graph.objects(package_resource, rcgs.formatOfSubunit):
-                for carrier_type in merged_graph.objects(subunit_node, rcgs.carrierType):
-                    subunit_carrier_types.append(str(carrier_type))
-                for extent in merged_graph.objects(subunit_node, DCTERMS.extent):
-                    subunit_extents.append(str(extent))
-                for dimension in merged_graph.objects(subunit_node, rcgs.dimension):
-                    subunit_dimensions.append(str(dimension))
-                for encoding_format in merged_graph.objects(subunit_node, schema.encodingFormat):
-                    subunit_encoding_formats.append(str(encoding_format))
-                for content_size in merged_graph.objects(subunit_node, schema.contentSize):
-                    subunit_content_sizes.append(str(content_size))
-                for admin_meta in merged_graph.objects(subunit_node, rcgs.adminMetadata):
-                    for source in merged_graph.objects(admin_meta, DCTERMS.source):
-                        subunit_sources.append(str(source))
-            
-            row['subunit_carrierType'] = "|".join(subunit_carrier_types)
-            row['subunit_extent'] = "|".join(subunit_extents)
-            row['subunit_dimension'] = "|".join(subunit_dimensions)
-            row['subunit_encodingFormat'] = "|".join(subunit_encoding_formats)
-            row['subunit_contentSize'] = "|".join(subunit_content_sizes)
-            row['subunit_source'] = "|".join(subunit_sources)
-            
-            # rcgs:provisionActivity
-            pa_types = []
-            pa_publisher_statements = []
-            pa_dates = []
-            pa_spatials = []
-            pa_sources = []
-            pa_notes = []
-            
-            for pa_node in merged_graph.objects(package_resource, rcgs.provisionActivity):
-                for pa_type in merged_graph.objects(pa_node, RDF.type):
-                    pa_types.append(str(pa_type))
-                for publisher_statement in merged_graph.objects(pa_node, rcgs.publisherStatement):
-                    pa_publisher_statements.append(str(publisher_statement))
-                for date in merged_graph.objects(pa_node, DCTERMS.date):
-                    pa_dates.append(str(date))
-                for spatial in merged_graph.objects(pa_node, DCTERMS.spatial):
-                    pa_spatials.append(str(spatial))
-                for source in merged_graph.objects(pa_node, DCTERMS.source):
-                    pa_sources.append(str(source))
-                for note in merged_graph.objects(pa_node, skos.note):
-                    pa_notes.append(str(note))
-            
-            row['PA_type'] = "|".join(pa_types)
-            row['PA_publisherStatement'] = "|".join(pa_publisher_statements)
-            row['PA_date'] = "|".join(pa_dates)
-            row['PA_spatial'] = "|".join(pa_spatials)
-            row['PA_source'] = "|".join(pa_sources)
-            row['PA_note'] = "|".join(pa_notes)
-            
-            # rcgs:adminMetadataからのsource
-            admin_source_values = []
-            for admin_meta in merged_graph.objects(package_resource, rcgs.adminMetadata):
-                for source in merged_graph.objects(admin_meta, DCTERMS.source):
-                    admin_source_values.append(str(source))
-            row['admin_source'] = "|".join(admin_source_values)
+        # テーブル全体（または絞り込んだ行）
+        output_format = query.pop('format', ['csv'])[0]
+        limit = query.pop('limit', [None])[0]
+        unknown = [column for column in query if column not in plan.columns]
+        if output_format not in ('csv', 'jsonl') or unknown or (limit is not None and not limit.isdigit()):
+            self._send_error(400, f"不正な指定です: format={output_format}, limit={limit}, 不明な列={unknown}")
+            return
+        rows = extract_table_data(state.merged_graph, plan, resolver=state.resolver) or ()
+        if query or limit is not None:
+            filters = {column: set(values) for column, values in query.items()}
+            rows = filter_rows(rows, filters, None if limit is None else int(limit))
+        self._send_rows(plan.columns, rows, output_format)
+    
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/reload':
+            self._send_error(404, f"不明なパスです: {self.path}")
+            return
+        if self.server.service.reload():
+            self._send_json(200, {'loaded': self.server.service.state.loaded})
         else:
-            row['exemplarOf'] = ""
-            # 空の値を設定
-            for field in ['type', 'name', 'titleTranscription_jaHrkt', 'titleTranscription_jaLatn', 
-                         'parallelTitle', 'alternative', 'abbreviatedTitle', 'edition', 'volume',
-                         'responsibilityStatement', 'creator', 'contribution', 'issued',
-                         'format_carrierType', 'format_extent', 'format_dimension', 'format_encodingFormat',
-                         'format_contentSize', 'format_source', 'subunit_carrierType', 'subunit_extent',
-                         'subunit_dimension', 'subunit_encodingFormat', 'subunit_contentSize', 'subunit_source',
-                         'dimension', 'medium', 'identifier', 'gtin13', 'isbn', 'issn', 'modelNumber',
-                         'jpNumber', 'ndlBiBID', 'oclcNumber', 'seeAlso', 'copyrightYear', 'accessRights',
-                         'hasPart', 'isPartOf', 'abstract', 'description', 'relation', 'references',
-                         'isReferencedBy', 'language', 'about', 'subjectOf', 'tableOfContents', 'brand',
-                         'PA_type', 'PA_publisherStatement', 'PA_date', 'PA_spatial', 'PA_source', 'PA_note',
-                         'producer', 'publisher', 'distributor', 'manufacturer', 'seriesStatement',
-                         'subseriesStatement', 'modeOfIssuance', 'publicationPeriodicity', 'serialNumber',
-                         'volumeNumber', 'issueNumber', 'price', 'exemplar', 'downloadUrl', 'created',
-                         'locationCreated', 'thumbnailUrl', 'source', 'admin_source']:
-                row[field] = ""
-        
-        related_item_data.append(row)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(related_item_data)
-    
-    print(f"抽出完了: {len(df)} 件の関連資料データ")
-    print(f"列数: {len(df.columns)}")
-    
-    return df
+            self._send_error(500, '再読み込みに失敗しました')
 
-def save_to_csv(df, filename, output_dir='./output'):
+def serve(args):
     """
-    DataFrameをCSVファイルに保存
+    変換サービスを起動する（Ctrl+Cで終了）
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        print(f"出力ディレクトリを作成: {output_dir}")
-    
-    output_file = os.path.join(output_dir, filename)
-    df.to_csv(output_file, index=False, encoding='utf-8')
-    print(f"CSVファイルを保存: {output_file}")
-    
-    # 基本統計情報を表示
-    print(f"  行数: {len(df)}")
-    print(f"  列数: {len(df.columns)}")
-    print(f"  ファイルサイズ: {os.path.getsize(output_file) / 1024:.1f} KB")
+    host, _, port = args.serve.rpartition(':')
+    service = ConversionService(args)
+    if not service.reload():
+        return False
+    threading.Thread(target=service.watch, daemon=True).start()
+    
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), ServiceRequestHandler)
+    server.service = service
+    print(f"変換サービスを開始: http://{host or '127.0.0.1'}:{port}/tables")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n変換サービスを終了します")
+    finally:
+        server.server_close()
+    return True
 
-def main():
+def parse_args(argv=None):
     """
-    メイン処理
+    コマンドライン引数を解析する
     """
-    # ./sourceディレクトリの存在確認
-    if not os.path.exists('./source'):
-        print("エラー: ./sourceディレクトリが見つかりません")
-        return
+    parser = argparse.ArgumentParser(description='RCGSのダンプデータをMAdB用のCSVに変換する')
+    parser.add_argument('--stream', action='store_true',
+                        help='rdflibのGraphを作らずにRDF/XMLを逐次読み込みして変換する（省メモリ）')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='RDFファイルの解析と各テーブルの抽出に使うプロセス数（デフォルト: 1）')
+    parser.add_argument('--cache-dir', default='./.cache',
+                        help='解析済みトリプルのキャッシュを置くディレクトリ（デフォルト: ./.cache）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='キャッシュを使わずに毎回すべてのファイルを解析する')
+    parser.add_argument('--prefetch', type=int, default=2, metavar='N',
+                        help='解析と並行して先に読み込むファイル数（0で先読みと並行統合をしない。デフォルト: 2）')
+    parser.add_argument('--prefetch-memory', type=int, default=512, metavar='MB',
+                        help='先読みしたファイルの内容を保持する上限（MB。これより大きいファイルは先読みせずに'
+                             '解析しながら読み込む。デフォルト: 512）')
+    parser.add_argument('--store', choices=TRIPLE_STORES, default='rdflib',
+                        help='統合グラフの保持方法（interned: 用語を整数IDにしてNumPyの配列で持つ省メモリの形式、'
+                             'mmap: --store-dirに作成した索引ファイルをメモリマップして使う形式。NumPyが必要。'
+                             'デフォルト: rdflib）')
+    parser.add_argument('--store-dir', default='./.store',
+                        help='--store mmapの索引ファイルを置くディレクトリ（ソースファイルが変わると作り直す。'
+                             'デフォルト: ./.store）')
+    parser.add_argument('--only', metavar='TABLES',
+                        help='出力するテーブル名をカンマ区切りで指定する（例: persons,organizations）。'
+                             '必要なソースファイルだけを読み込む')
+    parser.add_argument('--all-triples', action='store_true',
+                        help='列定義で使わない述語・クラスのトリプルも統合グラフに読み込む')
+    parser.add_argument('--spec', default=COLUMN_SPEC_FILE,
+                        help='テーブルごとの列とプロパティパスを定義したJSONファイル（デフォルト: column_spec.json）')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='段階ごとの処理時間・CPU時間・最大メモリ・件数を保存するファイル'
+                             '（拡張子が.promならPrometheusのtextfile形式、それ以外はJSON）')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='tracemallocで段階ごとの最大メモリも記録する（処理は遅くなる）')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='変換全体をプロファイルして結果を保存する（cProfileの.prof、pyinstrumentの.html）')
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile',
+                        help='--profileで使うプロファイラ（デフォルト: cprofile）')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='csv',
+                        help='出力形式（parquet・arrowは複数の値をリストの列、言語別の列をstruct列にする。'
+                             'pyarrowが必要。デフォルト: csv）')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='Graphを読み込んだまま保持し、HTTPでテーブルを出力する変換サービスとして起動する'
+                             '（HOSTのデフォルト: 127.0.0.1）')
+    parser.add_argument('--snapshots', nargs='+', metavar='DIR',
+                        help='複数のスナップショットのソースディレクトリを1回の実行で順に変換し、'
+                             './output/<ディレクトリ名>に出力する（用語表と同じ内容のファイルの解析結果を共有する）')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='読み込んだ統合グラフと出力し終わったテーブル・チャンクを--checkpoint-dirに保存し、'
+                             '中断しても--resumeで続きから再開できるようにする')
+    parser.add_argument('--resume', action='store_true',
+                        help='--checkpoint-dirに保存した途中経過から変換を再開する（--checkpointも有効になる）')
+    parser.add_argument('--checkpoint-dir', default='./.checkpoint',
+                        help='途中経過を保存するディレクトリ（--snapshotsではその下のディレクトリ名ごと。'
+                             'デフォルト: ./.checkpoint）')
+    parser.add_argument('--checkpoint-rows', type=int, default=10000, metavar='N',
+                        help='CSVを途中経過のチャンクファイルに分けて保存する行数（デフォルト: 10000）')
+    parser.add_argument('--since', metavar='PREVIOUS_OUTPUT',
+                        help='前回のスナップショットの出力ディレクトリ（またはrow_hashes.json）と比較し、'
+                             '追加・変更・削除された行だけを出力する（row_hashes.jsonも保存する）')
+    parser.add_argument('--save-hashes', action='store_true',
+                        help='次回の--sinceの比較元にするため、各行のハッシュ値をrow_hashes.jsonに保存する')
+    return parser.parse_args(argv)
+
+def run_conversion(args, source_dir='./source', output_dir='./output'):
+    """
+    コマンドライン引数に従って変換を行う（最後まで変換できた場合にTrueを返す）
+    
+    source_dirとoutput_dirは--snapshotsを指定しない場合の入力と出力のディレクトリ（benchmark.pyで変更する）。
+    """
+    # ソースディレクトリの存在確認
+    source_dirs = args.snapshots or [source_dir]
+    for snapshot_dir in source_dirs:
+        if not os.path.isdir(snapshot_dir):
+            print(f"エラー: {snapshot_dir}ディレクトリが見つかりません")
+            return False
+    
+    # 列定義を読み込んで抽出計画を作成
+    table_plans = load_table_plans(args.spec)
+    
+    # --onlyで指定したテーブルだけを出力する
+    if args.only:
+        try:
+            table_plans = select_table_plans(table_plans, args.only)
+        except ValueError as e:
+            print(f"エラー: {str(e)}")
+            return False
+    
+    # 列定義から作成した許可リストにない述語・クラスのトリプルは統合グラフに追加しない
+    triple_filter = None if args.all_triples else plan_triple_filter(table_plans)
+    
+    # 省メモリのトリプルストアにはNumPyが必要
+    if args.store != 'rdflib' and not args.stream:
+        try:
+            import numpy
+        except ImportError:
+            print(f"エラー: --store {args.store} にはNumPyが必要です（pip install numpy）")
+            return False
+    
+    # Parquet・Arrow形式の出力にはpyarrowが必要
+    if args.format != 'csv':
+        try:
+            import pyarrow
+        except ImportError:
+            print(f"エラー: --format {args.format} にはpyarrowが必要です（pip install pyarrow）")
+            return False
+    
+    # 差分変換の比較元
+    previous_snapshot = None
+    if args.since:
+        previous_snapshot = load_snapshot_hashes(args.since)
+        if previous_snapshot is None:
+            print(f"エラー: {args.since} に {ROW_HASHES_FILE} が見つかりません")
+            return False
+        print(f"差分変換: {args.since} との差分を出力します")
+    
+    if args.snapshots:
+        return convert_snapshots(args, table_plans, triple_filter, previous_snapshot)
+    
+    # --onlyで指定したテーブルの抽出に必要なファイルだけを読み込む
+    rdf_files = None
+    if args.only:
+        rdf_files = select_source_files(table_plans, source_dir, None if args.no_cache else args.cache_dir)
+    return convert_snapshot(args, table_plans, source_dir, output_dir, rdf_files, triple_filter,
+                            previous_snapshot, args.since, args.store_dir)
+
+def convert_snapshot(args, table_plans, source_dir, output_dir, rdf_files=None, triple_filter=None,
+                     previous_snapshot=None, since=None, store_dir='./.store', term_dictionary=None,
+                     shared_files=None, checkpoint_dir='./.checkpoint'):
+    """
+    1つのスナップショット（source_dirのRDFファイル）を変換してoutput_dirに出力する（最後まで変換できた場合にTrueを返す）
     
-    # RDFファイルの読み込み
-    merged_graph = load_rdf_files('./source')
+    term_dictionaryとshared_filesは一括変換でスナップショットの間で共有するもの（load_rdf_filesを参照）。
+    --checkpoint・--resumeでは、途中経過をcheckpoint_dirに保存し、保存済みの途中経過から再開する。
+    """
+    # Graphを作らない逐次変換
+    if args.stream:
+        if args.checkpoint or args.resume:
+            print("警告: --streamでは途中経過を保存しないため、--checkpoint・--resumeは使いません")
+        convert_streaming(source_dir, output_dir, table_plans, previous_snapshot, since, args.format,
+                          rdf_files, partial=bool(args.only), save_hashes=args.save_hashes)
+        return True
+    
+    checkpoint = None
+    if args.checkpoint or args.resume:
+        checkpoint = Checkpoint(checkpoint_dir, checkpoint_key(args, source_dir, since), args.checkpoint_rows,
+                                args.resume)
+        if checkpoint.completed:
+            print(f"チェックポイントによると変換は完了しています: {checkpoint_dir}（最初から変換する場合は--resumeを外してください）")
+            return True
+    
+    # RDFファイルの読み込み（チェックポイントに統合グラフがあればそれを使う）
+    with metrics.phase('load') as counters:
+        merged_graph = None
+        if checkpoint is not None:
+            merged_graph = checkpoint.load_graph(args.store, term_dictionary)
+        if merged_graph is None:
+            merged_graph = load_rdf_files(source_dir, jobs=args.jobs,
+                                          cache_dir=None if args.no_cache else args.cache_dir, store=args.store,
+                                          prefetch=args.prefetch, prefetch_bytes=args.prefetch_memory << 20,
+                                          rdf_files=rdf_files, triple_filter=triple_filter, store_dir=store_dir,
+                                          term_dictionary=term_dictionary, shared_files=shared_files)
+            if merged_graph is None:
+                return False
+            if checkpoint is not None and len(merged_graph) > 0:
+                checkpoint.save_graph(merged_graph)
+        counters['triples'] = len(merged_graph)
     
     if len(merged_graph) == 0:
         print("警告: 読み込まれたRDFデータがありません")
-        return
-    
-    # 基本的な統計情報を表示
-    print("\n=== データ統計 ===")
-    
-    # 名前空間の定義
-    dcndl = Namespace("http://ndl.go.jp/dcndl/terms/")
-    rcgs = Namespace("https://collection.rcgs.jp/terms/")
-    foaf = Namespace("http://xmlns.com/foaf/0.1/")
-    
-    # 各タイプの数をカウント
-    bib_resources = list(merged_graph.subjects(RDF.type, dcndl.BibResource))
-    print(f"BibResource数: {len(bib_resources)}")
+        return False
     
-    items = list(merged_graph.subjects(RDF.type, dcndl.Item))
-    print(f"Item数: {len(items)}")
+    # 結合用のインデックス（rdf:typeを1回だけ走査したクラスごとのリソースのリスト）は
+    # 統計情報の表示とすべてのテーブルの抽出で共有する
+    with metrics.phase('join_index'):
+        join_index = JoinIndex(merged_graph, table_plans)
     
-    packages = list(merged_graph.subjects(RDF.type, rcgs.Package))
-    print(f"Package数: {len(packages)}")
+    # "languages": "*" の列をデータにある言語タグで展開する
+    table_plans = {name: plan.with_languages(join_index.languages) for name, plan in table_plans.items()}
     
-    persons = list(merged_graph.subjects(RDF.type, foaf.Person))
-    print(f"Person数: {len(persons)}")
-    
-    organizations = list(merged_graph.subjects(RDF.type, foaf.Organization))
-    print(f"Organization数: {len(organizations)}")
-    
-    variations = list(merged_graph.subjects(RDF.type, rcgs.Variation))
-    print(f"Variation数: {len(variations)}")
-    
-    works = list(merged_graph.subjects(RDF.type, rcgs.Work))
-    print(f"Work数: {len(works)}")
+    # 基本的な統計情報を表示
+    with metrics.phase('statistics'):
+        print_class_counts({class_uri: len(members) for class_uri, members in join_index.class_members.items()})
     
     # 使用されている名前空間を表示
     print("\n使用されている名前空間:")
@@ -1153,43 +3680,163 @@ def main():
     
     # 各データタイプの抽出とCSV保存
     print("\n=== CSV出力開始 ===")
+    writers = []
+    print(f"結合用インデックスを作成: {len(join_index.class_members)} クラス, "
+          f"{sum(len(targets) for targets in join_index.targets.values())} 件の参照")
+    
+    # 参照先ノードのレコードのキャッシュもすべてのテーブルの抽出で共有する
+    resolver = GraphResolver(merged_graph, new_record_cache(merged_graph), join_index)
+    for plan in table_plans.values():
+        writer = open_table_writer(plan, output_dir, args.format, previous_snapshot, checkpoint)
+        
+        # 前回の実行で出力し終わったテーブル
+        table_state = checkpoint.table_state(plan.file_name) if checkpoint is not None else None
+        if table_state is not None:
+            writer.restore(table_state)
+            print(f"\n再開: {plan.file_name} は出力済みです（{writer.row_count} 行）")
+            writers.append(writer)
+            continue
+        
+        record_cache = resolver.record_cache
+        probes, hits, misses = resolver.graph_probes, record_cache.hits, record_cache.misses
+        
+        # 行の作成とCSVへの書き込みは交互に行われるため、まとめて1つの段階として計測する
+        with metrics.phase(f'extract:{plan.name}') as counters:
+            rows = extract_table_data(merged_graph, plan, jobs=args.jobs, resolver=resolver,
+                                      value_lists=args.format != 'csv', skip=getattr(writer, 'resumed_rows', 0))
+            writer = save_rows(rows or (), writer)
+            counters['rows'] = len(writer.row_hashes)
+            counters['graph_probes'] = resolver.graph_probes - probes
+            counters['cache_hits'] = record_cache.hits - hits
+            counters['cache_misses'] = record_cache.misses - misses
+        if checkpoint is not None:
+            checkpoint.complete_table(writer)
+        writers.append(writer)
+    
+    # 次回の差分変換のためのハッシュ値（差分変換ではマニフェストも）を保存
+    if since or args.save_hashes:
+        save_snapshot_hashes(writers, output_dir, since, partial=bool(args.only))
+    resolver.record_cache.report()
+    if checkpoint is not None:
+        checkpoint.finish()
+    return True
+
+def convert_snapshots(args, table_plans, triple_filter=None, previous_snapshot=None):
+    """
+    --snapshotsの各ディレクトリを1つのプロセスで順に変換し、./output/<ディレクトリ名>に出力する
     
-    # ゲームパッケージデータの抽出とCSV保存
-    df_packages = extract_game_package_data(merged_graph)
-    if df_packages is not None:
-        save_to_csv(df_packages, 'game_packages.csv')
-    
-    # 個別資料データの抽出とCSV保存
-    df_items = extract_item_data(merged_graph)
-    if df_items is not None:
-        save_to_csv(df_items, 'items.csv')
-    
-    # 個人データの抽出とCSV保存
-    df_persons = extract_person_data(merged_graph)
-    if df_persons is not None:
-        save_to_csv(df_persons, 'persons.csv')
-    
-    # 団体データの抽出とCSV保存
-    df_organizations = extract_organization_data(merged_graph)
-    if df_organizations is not None:
-        save_to_csv(df_organizations, 'organizations.csv')
-    
-    # バリエーションデータの抽出とCSV保存
-    df_variations = extract_variation_data(merged_graph)
-    if df_variations is not None:
-        save_to_csv(df_variations, 'variations.csv')
-    
-    # 作品データの抽出とCSV保存
-    df_works = extract_work_data(merged_graph)
-    if df_works is not None:
-        save_to_csv(df_works, 'works.csv')
-    
-    # 関連資料データの抽出とCSV保存
-    df_related_items = extract_related_item_data(merged_graph)
-    if df_related_items is not None:
-        save_to_csv(df_related_items, 'related_items.csv')
-    
-    print("\n処理が完了しました。")
+    InternedTripleStoreの用語表（TermDictionary）と、複数のスナップショットにある同じ内容のファイル
+    （terms.ttlなど）の解析結果をスナップショットの間で共有する。--sinceを指定した場合は、
+    最初のスナップショットを--sinceと、以降のスナップショットを1つ前のスナップショットの出力と比べる。
+    """
+    names = [os.path.basename(os.path.normpath(source_dir)) for source_dir in args.snapshots]
+    duplicates = sorted(name for name, count in Counter(names).items() if count > 1)
+    if duplicates:
+        print(f"エラー: --snapshotsのディレクトリ名が重複しています: {', '.join(duplicates)}")
+        return False
+    
+    # スナップショットごとに読み込むファイル（--store mmapはストアを作り直すときにすべてのファイルを読む）
+    cache_dir = None if args.no_cache else args.cache_dir
+    snapshot_files = []
+    for source_dir in args.snapshots:
+        if args.only and args.store != 'mmap':
+            snapshot_files.append(select_source_files(table_plans, source_dir, cache_dir))
+        else:
+            snapshot_files.append(list_rdf_files(source_dir))
+    
+    shared_files = SharedSourceFiles(snapshot_files) if not args.stream else None
+    term_dictionary = TermDictionary() if args.store == 'interned' and not args.stream else None
+    if shared_files is not None and shared_files.keys:
+        print(f"スナップショットの間で共有するファイル: {len(shared_files.keys)} 件"
+              f"（内容の種類 {len(shared_files.uses)} 件）")
+    
+    since = args.since
+    batch_start = time.perf_counter()
+    completed = []
+    for number, (source_dir, name, rdf_files) in enumerate(zip(args.snapshots, names, snapshot_files), 1):
+        output_dir = os.path.join('./output', name)
+        print(f"\n=== スナップショット {number}/{len(names)}: {source_dir} → {output_dir} ===")
+        snapshot_start = time.perf_counter()
+        
+        done = convert_snapshot(args, table_plans, source_dir, output_dir,
+                                rdf_files if args.only else None, triple_filter, previous_snapshot, since,
+                                os.path.join(args.store_dir, name), term_dictionary, shared_files,
+                                os.path.join(args.checkpoint_dir, name))
+        if shared_files is not None:
+            shared_files.release(rdf_files)
+        if term_dictionary is not None:
+            term_dictionary.discard_blank_nodes()
+            print(f"共有している用語数: {len(term_dictionary)}")
+        print(f"スナップショット {name} の変換時間: {time.perf_counter() - snapshot_start:.2f}秒")
+        
+        if done:
+            completed.append(name)
+        if since is not None:
+            # 次のスナップショットはこのスナップショットの出力との差分にする
+            since = output_dir
+            previous_snapshot = load_snapshot_hashes(output_dir) if done else None
+            if previous_snapshot is None:
+                print(f"警告: {output_dir} の行のハッシュ値がないため、次のスナップショットはすべての行を出力します")
+                since = None
+    
+    print(f"\n一括変換: {len(completed)}/{len(names)} 件のスナップショットを変換しました"
+          f"（{time.perf_counter() - batch_start:.2f}秒）")
+    return len(completed) == len(names)
+
+def run_profiled(args):
+    """
+    --profileの指定に従ってプロファイラの下で変換を行う（戻り値はrun_conversionと同じ）
+    """
+    if args.profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("警告: pyinstrumentがインストールされていないため、cProfileを使います")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return run_conversion(args)
+            finally:
+                profiler.stop()
+                with open(args.profile, 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+                print(f"プロファイルを保存: {args.profile}")
+    
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(run_conversion, args)
+    finally:
+        profiler.dump_stats(args.profile)
+        print(f"プロファイルを保存: {args.profile}（python -m pstats {args.profile} で表示）")
+
+def main(argv=None):
+    """
+    メイン処理（最後まで変換できた場合は0、失敗した場合は1を返す）
+    """
+    args = parse_args(argv)
+    
+    if args.trace_memory:
+        tracemalloc.start()
+        metrics.trace_memory = True
+    
+    if args.serve:
+        if args.only:
+            print("警告: 変換サービスではすべてのテーブルを提供するため、--onlyは使いません")
+        if args.snapshots:
+            print("警告: 変換サービスでは./sourceだけを読み込むため、--snapshotsは使いません")
+        completed = serve(args)
+    elif args.profile:
+        completed = run_profiled(args)
+    else:
+        completed = run_conversion(args)
+    
+    if args.metrics:
+        metrics.save(args.metrics)
+    
+    if completed:
+        print("\n処理が完了しました。")
+    return 0 if completed else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())